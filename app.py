@@ -1,21 +1,52 @@
+import io
+import mimetypes
 import os
+import sys
+import time
 
 from enum import Enum
+from jinja2 import FileSystemBytecodeCache
 from flask import (
-    Flask, 
+    Flask,
+    Response,
+    abort,
+    before_render_template,
+    g,
+    request,
+    send_file,
+    send_from_directory,
+    template_rendered,
 )
+from markupsafe import Markup
 from typing import Final
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 
 from routes.landing.landing_route import landing_bp
 from routes.home.home_routes import home_bp
 from routes.admin.admin_routes import admin_bp
 
+from utils.assets import StaticManifest, build_static_manifest
+from utils.bundles import build_bundles, get_critical_css
+from utils.compression import (
+    compress,
+    compress_stream,
+    get_accepted_encoding,
+    get_precompressed_path,
+    is_compressible,
+)
 from utils.config import CFG
+from utils.extensions import get_cache, get_limiter
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.request_monitor import request_monitor
+from utils.timing import get_request_stages, record, start_request_timing, timings
+from utils.ttl_cache import MISSING, TTLCache
 
 
 DEFAULT_CACHE_DURATION: Final = 60
 STATIC_CACHE_DURATION: Final = CFG.server.STATIC_CACHE_DURATION
-API_CACHE_DURATION: Final = CFG.server.API_CACHE_DURATION
+IMMUTABLE_CACHE_DURATION: Final = CFG.server.IMMUTABLE_CACHE_DURATION
 
 
 def get_app() -> Flask:
@@ -23,20 +54,129 @@ def get_app() -> Flask:
     app = Flask(__name__)
     app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
 
-    # _init_limiter(app)
+    _init_proxy(app)
+    _init_metrics(app)
+    _init_timing(app)
+    _init_limiter(app)
     _init_security_headers(app)
-    # _init_cache(app)
+    _init_static(app)
+    _init_templates(app)
+    _init_cache(app)
+    _init_compression(app)
     _init_session(app)
     _init_blueprints(app)
     return app
 
 
-# def _init_limiter(app: Flask) -> None:
-#     limiter = get_limiter(app)
-#     # Use Redis storage for rate limiting
-#     storage_uri = os.environ.get("UPSTASH_REDIS_REST_URL", "memory://")
-#     app.config["RATELIMIT_STORAGE_URI"] = storage_uri
-#     limiter.init_app(app)
+def _init_proxy(app: Flask) -> None:
+    """Sets request.remote_addr to the client address reported by the trusted proxies.
+    Entries a client adds to X-Forwarded-For itself are ignored."""
+    if CFG.server.PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=CFG.server.PROXY_HOPS)
+
+
+def _init_metrics(app: Flask) -> None:
+    """Counts requests and their latency per route, and collects the state of
+    caches, queues and storage when the metrics are read."""
+    if not CFG.server.METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_metrics() -> None:
+        g.metrics_started_at = time.perf_counter()
+
+    @app.after_request
+    def count_request(response: Response) -> Response:
+        route = request.endpoint or "unmatched"
+        metrics.inc("tracking_http_requests_total", route=route, method=request.method, status=str(response.status_code))
+        metrics.observe(
+            "tracking_http_request_duration_seconds",
+            (time.perf_counter() - g.metrics_started_at) * 1000,
+            route=route,
+        )
+        return response
+
+    def get_stage_samples() -> list:
+        return [
+            ("tracking_stage_duration_seconds", {"stage": stage}, histogram)
+            for stage, histogram in timings.get_histograms().items()
+        ]
+
+    def get_upstream_samples() -> list:
+        # Breakers only exist once the HTTP client is used, so httpx is not imported for them
+        http_client = sys.modules.get("utils.http_client")
+        return http_client.get_metric_samples() if http_client else []
+
+    metrics.add_collector(get_stage_samples)
+    metrics.add_collector(get_upstream_samples)
+    metrics.add_collector(lambda: request_monitor.get_metric_samples())
+    metrics.add_collector(lambda: get_cache().cache.get_metric_samples())
+    if CFG.server.RATE_LIMIT_ENABLED:
+        metrics.add_collector(lambda: get_limiter().get_metric_samples())
+
+
+def _init_timing(app: Flask) -> None:
+    """Times the stages of sampled requests into histograms and the
+    Server-Timing header. Registered first, so its after_request hook runs
+    last and the total includes the other hooks."""
+    if CFG.server.TIMING_SAMPLE_RATE <= 0:
+        return
+
+    @app.before_request
+    def start_timing() -> None:
+        start_request_timing()
+
+    def start_render(sender, template, context, **extra) -> None:
+        if g.get("timing_sampled"):
+            g.timing_render_started_at = time.perf_counter()
+
+    def end_render(sender, template, context, **extra) -> None:
+        started_at = g.pop("timing_render_started_at", None)
+        if started_at is not None:
+            record("render", (time.perf_counter() - started_at) * 1000)
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
+
+    @app.after_request
+    def add_server_timing(response: Response) -> Response:
+        if not g.get("timing_sampled"):
+            return response
+
+        stages = get_request_stages()
+        total_ms = stages[-1][1]
+        record("request", total_ms)
+        if CFG.server.SERVER_TIMING_HEADER:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{stage};dur={duration_ms:.2f}" for stage, duration_ms in stages
+            )
+        if total_ms >= CFG.server.TIMING_LOG_THRESHOLD_MS:
+            breakdown = ", ".join(f"{stage} {duration_ms:.1f} ms" for stage, duration_ms in stages[:-1])
+            logger.timing(f"{request.method} {request.path} took {total_ms:.1f} ms ({breakdown})")
+        return response
+
+
+def _init_limiter(app: Flask) -> None:
+    """Limits requests per route and client, static files are not limited."""
+    if not CFG.server.RATE_LIMIT_ENABLED:
+        return
+
+    @app.before_request
+    def limit_request() -> Response | None:
+        if request.endpoint in (None, "static"):
+            return None
+
+        # Created on the first request, so startup does not connect to Redis
+        decision = get_limiter().hit(request.endpoint.split(".")[-1], request.remote_addr)
+        g.load_level = decision.load_level
+        if not decision.allowed:
+            return Response(
+                "Too Many Requests",
+                status=429,
+                headers={"Retry-After": str(decision.retry_after)},
+                mimetype="text/plain",
+            )
+        return None
 
 
 def _init_security_headers(app: Flask) -> None:
@@ -48,50 +188,162 @@ def _init_security_headers(app: Flask) -> None:
         return response
 
 
-# def _init_cache(app) -> None:
-#     cache = get_cache()
-#     cache_config = {
-#         "CACHE_TYPE": "RedisCache" if os.environ.get("UPSTASH_REDIS_REST_URL") else "NullCache",
-#         "CACHE_REDIS_URL": os.environ.get("UPSTASH_REDIS_REST_URL"),
-#         "CACHE_DEFAULT_TIMEOUT": CFG.server.CACHE_DEFAULT_TIMEOUT
-#     }
-#     cache.init_app(app, config=cache_config)
-
-#     @app.after_request
-#     def add_cache_control_headers(response: Response) -> Response:
-#         content_type = response.headers.get("Content-Type", "")
-
-#         def set_cache_headers(max_age: int, public: bool = True) -> None:
-#             response.cache_control.public = public
-#             response.cache_control.max_age = max_age
-#             response.expires = max_age
-
-#         # Static assets (js, images, fonts)
-#         if any(typ in content_type for typ in ContentType.STATIC.value):
-#             set_cache_headers(STATIC_CACHE_DURATION)
-            
-#             # Debug headers for images
-#             if "image/" in content_type:
-#                 response.headers["X-Cache-Debug"] = f"max-age={STATIC_CACHE_DURATION}"
-        
-#         # HTML and CSS
-#         elif any(typ in content_type for typ in ContentType.DOCUMENT.value):
-#             if os.environ.get("FLASK_ENV") != "deploy":
-#                 set_cache_headers(STATIC_CACHE_DURATION)
-#             else:
-#                 response.cache_control.no_store = True
-#                 response.cache_control.no_cache = True
-#                 set_cache_headers(0, public=False)
-        
-#         # API responses
-#         elif any(typ in content_type for typ in ContentType.API.value):
-#             set_cache_headers(API_CACHE_DURATION)
-        
-#         # Other content types
-#         else:
-#             set_cache_headers(DEFAULT_CACHE_DURATION)
-        
-#         return response
+def _init_static(app: Flask) -> None:
+    """Serves static files under fingerprinted names, so url_for('static', ...)
+    links change whenever the file content changes."""
+    # Only in debug are bundles and the committed manifest rebuilt at startup, elsewhere the built ones are served
+    if os.environ.get("DEBUG") == "True" and not CFG.server.FAST_STARTUP:
+        build_bundles()
+        build_static_manifest()
+    manifest = StaticManifest.load()
+    app.config["STATIC_MANIFEST"] = manifest
+    app.jinja_env.globals["critical_css"] = lambda name: Markup(get_critical_css(name))
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint: str, values: dict) -> None:
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = manifest.get_fingerprinted(values["filename"])
+
+    compressed_cache = TTLCache(maxsize=CFG.server.COMPRESS_STATIC_CACHE_SIZE)
+
+    def static(filename: str) -> Response:
+        filename = manifest.get_original(filename) or filename
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if not is_compressible(mimetype):
+            return app.send_static_file(filename)
+
+        encoding = get_accepted_encoding(request.accept_encodings)
+        if encoding is None:
+            response = app.send_static_file(filename)
+            response.vary.add("Accept-Encoding")
+            return response
+
+        # Precompressed sibling from the build, otherwise compressed once in memory
+        sibling = get_precompressed_path(app.static_folder, filename, encoding)
+        if sibling:
+            response = send_from_directory(app.static_folder, sibling, mimetype=mimetype)
+        else:
+            path = safe_join(app.static_folder, filename)
+            if path is None or not os.path.isfile(path):
+                abort(404)
+            key = (path, os.path.getmtime(path), encoding)
+            data = compressed_cache.get(key)
+            if data is MISSING:
+                with open(path, "rb") as file:
+                    data = compress(file.read(), encoding)
+                compressed_cache.set(key, data)
+            response = send_file(io.BytesIO(data), mimetype=mimetype, etag=f"{key[1]}-{encoding}-{len(data)}")
+            response.make_conditional(request)
+
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.view_functions["static"] = static
+
+
+def _init_templates(app: Flask) -> None:
+    """Caches compiled templates on disk, so a new worker loads them instead
+    of compiling each one again on its first render."""
+    cache_dir = CFG.server.TEMPLATE_CACHE_DIR
+    if not cache_dir:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(app: Flask) -> int:
+    """Compiles all templates into the bytecode cache, returns the number compiled."""
+    templates = app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in templates:
+        app.jinja_env.get_template(name)
+    return len(templates)
+
+
+def _init_cache(app: Flask) -> None:
+    cache = get_cache()
+    cache_config = {
+        "CACHE_TYPE": CFG.server.CACHE_TYPE,
+        "CACHE_DEFAULT_TIMEOUT": CFG.server.CACHE_DEFAULT_TIMEOUT,
+        "CACHE_THRESHOLD": CFG.server.CACHE_THRESHOLD,
+        "CACHE_LOCAL_TIMEOUT": CFG.server.CACHE_LOCAL_TIMEOUT,
+    }
+    cache.init_app(app, config=cache_config)
+    manifest = app.config["STATIC_MANIFEST"]
+
+    @app.after_request
+    def add_cache_control_headers(response: Response) -> Response:
+        content_type = response.headers.get("Content-Type", "")
+
+        def set_cache_headers(max_age: int, public: bool = True) -> None:
+            response.cache_control.public = public
+            response.cache_control.max_age = max_age
+            response.cache_control.no_cache = None
+
+        # Static files, fingerprinted ones never change under the same URL
+        if request.endpoint == "static":
+            if manifest.get_original((request.view_args or {}).get("filename", "")):
+                set_cache_headers(IMMUTABLE_CACHE_DURATION)
+                response.cache_control.immutable = True
+            else:
+                set_cache_headers(STATIC_CACHE_DURATION)
+            return response
+
+        # Views that set their own policy, like rendered graphs
+        if "Cache-Control" in response.headers or response.status_code != 200:
+            return response
+
+        # Pages and API responses are per user, browsers revalidate them by ETag
+        if any(typ in content_type for typ in ContentType.DOCUMENT.value + ContentType.API.value):
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            if request.method == "GET" and not response.is_streamed:
+                response.add_etag()
+                response.make_conditional(request)
+
+        elif any(typ in content_type for typ in ContentType.STATIC.value):
+            set_cache_headers(STATIC_CACHE_DURATION)
+
+        # Other content types
+        else:
+            set_cache_headers(DEFAULT_CACHE_DURATION)
+
+        return response
+
+
+def _init_compression(app: Flask) -> None:
+    """Compresses large dynamic responses. Registered after the cache headers
+    hook, so it runs before it and ETags are computed on the compressed body."""
+    if not CFG.server.COMPRESS_DYNAMIC:
+        return
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or not is_compressible(response.mimetype or "")):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = get_accepted_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, CFG.server.COMPRESS_LEVEL)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < CFG.server.COMPRESS_MIN_BYTES:
+                return response
+            response.set_data(compress(data, encoding, CFG.server.COMPRESS_LEVEL))
+
+        response.headers["Content-Encoding"] = encoding
+        return response
 
 
 def _init_session(app: Flask) -> None:
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from typing import Any, Final
+
+
+RESULTS_DIR: Final = os.path.join(os.path.dirname(__file__), "results")
+# Relative change above which compare flags a latency or throughput difference
+REGRESSION_THRESHOLD: Final = 0.10
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(results: dict[str, Any], output: str | None) -> str:
+    if output is None:
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{timestamp}-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    return output
+
+
+def print_load(load: dict[str, Any]) -> None:
+    print(f"{'concurrency':>11} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for level in load["levels"]:
+        latency = level["latency"]
+        statuses = {name: route["statuses"] for name, route in level["routes"].items()}
+        print(f"{level['concurrency']:>11} {level['throughput_rps']:>9} {latency['p50_ms']:>9} "
+              f"{latency['p95_ms']:>9} {latency['p99_ms']:>9}  {statuses}")
+
+
+def print_micro(micro: dict[str, Any]) -> None:
+    print(f"{'benchmark':<45} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for group, benchmarks in micro.items():
+        for name, summary in benchmarks.items():
+            print(f"{group + '.' + name:<45} {summary['mean_ms']:>9} {summary['p50_ms']:>9} {summary['p99_ms']:>9}")
+
+
+def flatten(results: dict[str, Any]) -> dict[str, float]:
+    """Gets the comparable numbers of a result file by name."""
+    values = {}
+    for level in results.get("load", {}).get("levels", []):
+        prefix = f"load.c{level['concurrency']}"
+        values[f"{prefix}.throughput_rps"] = level["throughput_rps"]
+        values[f"{prefix}.p50_ms"] = level["latency"]["p50_ms"]
+        values[f"{prefix}.p99_ms"] = level["latency"]["p99_ms"]
+    for group, benchmarks in results.get("micro", {}).items():
+        for name, summary in benchmarks.items():
+            values[f"micro.{group}.{name}.p50_ms"] = summary["p50_ms"]
+    return values
+
+
+def compare(baseline_path: str, current_path: str) -> int:
+    """Prints the change per number, returns 1 if anything regressed."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(current_path) as file:
+        current = json.load(file)
+
+    print(f"{baseline['commit']} -> {current['commit']}")
+    regressed = False
+    before, after = flatten(baseline), flatten(current)
+    for name in sorted(before.keys() & after.keys()):
+        if not before[name]:
+            continue
+        change = (after[name] - before[name]) / before[name]
+        # Higher throughput is better, higher latency is worse
+        worse = -change if name.endswith("throughput_rps") else change
+        flag = "REGRESSED" if worse > REGRESSION_THRESHOLD else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:<55} {before[name]:>10} {after[name]:>10} {change:>+8.1%} {flag}")
+    return 1 if regressed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the app against fake upstreams")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("load", "micro", "all"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("--redis-latency", type=float, default=0.002, help="Seconds per fake Upstash call")
+        subparser.add_argument("--geo-latency", type=float, default=0.02, help="Seconds per fake ip-api call")
+        subparser.add_argument("--output", help="Result file, defaults to benchmarks/results/<time>-<commit>.json")
+        if command in ("load", "all"):
+            subparser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+            subparser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level")
+        if command in ("micro", "all"):
+            subparser.add_argument("--iterations", type=int, default=200)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        return compare(args.baseline, args.current)
+
+    results = {
+        "commit": get_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": {name: value for name, value in vars(args).items() if name not in ("command", "output")},
+    }
+    if args.command in ("load", "all"):
+        from benchmarks.load import run_load
+
+        results["load"] = run_load(args.concurrency, args.requests, args.redis_latency, args.geo_latency)
+        print_load(results["load"])
+    if args.command in ("micro", "all"):
+        from benchmarks.micro import run_micro
+
+        results["micro"] = run_micro(args.iterations, args.redis_latency, args.geo_latency)
+        print_micro(results["micro"])
+
+    print(f"Saved {save_results(results, args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
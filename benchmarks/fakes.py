@@ -0,0 +1,273 @@
+import base64
+import fnmatch
+import json
+import sys
+import threading
+import time
+
+from email.message import Message
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+
+class FakeRedis:
+    """In-memory Redis with the commands the app uses, thread-safe."""
+
+    def __init__(self):
+        self.data: dict[str, Any] = {}
+        self.expiry: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    def execute(self, command: list) -> Any:
+        with self.lock:
+            self.commands += 1
+            name, args = command[0].lower(), [str(arg) for arg in command[1:]]
+            handler = getattr(self, f"_{name}", None)
+            if handler is None:
+                raise ValueError(f"unknown command '{name}'")
+            return handler(*args)
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self.expiry.get(key)
+        if expires_at is not None and expires_at < time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+    def _ping(self) -> str:
+        return "PONG"
+
+    def _get(self, key: str) -> str | None:
+        return self.data[key] if self._alive(key) else None
+
+    def _set(self, key: str, value: str, *options: str) -> str | None:
+        options = [option.upper() for option in options]
+        if "NX" in options and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expiry.pop(key, None)
+        if "EX" in options:
+            self.expiry[key] = time.time() + float(options[options.index("EX") + 1])
+        return "OK"
+
+    def _mget(self, *keys: str) -> list[str | None]:
+        return [self._get(key) for key in keys]
+
+    def _keys(self, pattern: str) -> list[str]:
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    def _del(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                deleted += 1
+        return deleted
+
+    def _exists(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._alive(key))
+
+    def _expire(self, key: str, seconds: str) -> int:
+        if not self._alive(key):
+            return 0
+        self.expiry[key] = time.time() + float(seconds)
+        return 1
+
+    def _incrby(self, key: str, amount: str) -> int:
+        value = int(self._get(key) or 0) + int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def _hincrby(self, key: str, field: str, amount: str) -> int:
+        fields = self.data[key] if self._alive(key) else self.data.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + int(amount))
+        return int(fields[field])
+
+    def _hgetall(self, key: str) -> list[str]:
+        fields = self.data[key] if self._alive(key) else {}
+        return [item for pair in fields.items() for item in pair]
+
+    def _sorted(self, key: str) -> list[tuple[str, float]]:
+        members = self.data[key] if self._alive(key) else {}
+        return sorted(members.items(), key=lambda item: (item[1], item[0]))
+
+    def _zadd(self, key: str, *args: str) -> int:
+        members = self.data[key] if self._alive(key) else self.data.setdefault(key, {})
+        args = [arg for arg in args if arg.upper() not in ("NX", "XX", "GT", "LT", "CH", "INCR")]
+        added = 0
+        for position in range(0, len(args), 2):
+            score, member = args[position], args[position + 1]
+            added += member not in members
+            members[member] = float(score)
+        return added
+
+    def _zcard(self, key: str) -> int:
+        return len(self._sorted(key))
+
+    @staticmethod
+    def _parse_score(score: str) -> tuple[float, bool]:
+        """Returns (score, exclusive) of a ZRANGE BYSCORE bound."""
+        score = score.lower()
+        if score in ("+inf", "inf"):
+            return float("inf"), False
+        if score == "-inf":
+            return float("-inf"), False
+        if score.startswith("("):
+            return float(score[1:]), True
+        return float(score), False
+
+    def _in_range(self, score: float, low: str, high: str) -> bool:
+        low_score, low_exclusive = self._parse_score(low)
+        high_score, high_exclusive = self._parse_score(high)
+        above = score > low_score if low_exclusive else score >= low_score
+        below = score < high_score if high_exclusive else score <= high_score
+        return above and below
+
+    def _zrange(self, key: str, start: str, stop: str, *options: str) -> list[str]:
+        upper = [option.upper() for option in options]
+        items = self._sorted(key)
+        if "BYSCORE" in upper:
+            low, high = (stop, start) if "REV" in upper else (start, stop)
+            items = [item for item in items if self._in_range(item[1], low, high)]
+            if "REV" in upper:
+                items.reverse()
+            if "LIMIT" in upper:
+                position = upper.index("LIMIT")
+                offset, count = int(options[position + 1]), int(options[position + 2])
+                items = items[offset:] if count < 0 else items[offset:offset + count]
+        else:
+            if "REV" in upper:
+                items.reverse()
+            start, stop = int(start), int(stop)
+            start += len(items) if start < 0 else 0
+            stop += len(items) if stop < 0 else 0
+            items = items[max(start, 0):stop + 1]
+        return [member for member, _ in items]
+
+    def _zremrangebyrank(self, key: str, start: str, stop: str) -> int:
+        items = self._sorted(key)
+        start, stop = int(start), int(stop)
+        start += len(items) if start < 0 else 0
+        stop += len(items) if stop < 0 else 0
+        removed = items[max(start, 0):stop + 1]
+        for member, _ in removed:
+            del self.data[key][member]
+        return len(removed)
+
+    def _zremrangebyscore(self, key: str, low: str, high: str) -> int:
+        removed = [member for member, score in self._sorted(key) if self._in_range(score, low, high)]
+        for member in removed:
+            del self.data[key][member]
+        return len(removed)
+
+
+def _encode(value: Any) -> Any:
+    """Upstash base64 response encoding of strings."""
+    if isinstance(value, str):
+        return base64.b64encode(value.encode()).decode()
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    return value
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # The app process is killed with kept-alive connections still open
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """Threaded HTTP/1.1 server on a free local port, with a fixed latency
+    added to every response. Keep-alive works as with the real services."""
+
+    def __init__(self, handle: Callable[[str, str, bytes, Message], tuple[int, Any]], latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # One write per response, without Nagle delays on kept-alive connections
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _respond(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                status, payload = handle(self.command, self.path, body, self.headers)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _respond
+
+        self.httpd = _HTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self) -> 'FakeServer':
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_upstash_server(latency: float = 0.0, redis: FakeRedis | None = None) -> FakeServer:
+    """Fake Upstash REST API: single commands on /, lists of commands on /pipeline."""
+    redis = redis or FakeRedis()
+
+    def run(command: list, encoding: bool) -> dict[str, Any]:
+        try:
+            result = redis.execute(command)
+            return {"result": _encode(result) if encoding else result}
+        except Exception as e:
+            return {"error": f"ERR {e}"}
+
+    def handle(method: str, path: str, body: bytes, headers: Message) -> tuple[int, Any]:
+        commands = json.loads(body)
+        encoding = headers.get("Upstash-Encoding") == "base64"
+        if path.rstrip("/") in ("/pipeline", "/multi-exec"):
+            return 200, [run(command, encoding) for command in commands]
+        return 200, run(commands, encoding)
+
+    server = FakeServer(handle, latency)
+    server.redis = redis
+    return server
+
+
+def make_geolocation_server(latency: float = 0.0) -> FakeServer:
+    """Fake ip-api.com: every IP is found, in a country picked from its last octet."""
+    countries = [("Netherlands", "NL"), ("Germany", "DE"), ("United States", "US"), ("Japan", "JP")]
+
+    def handle(method: str, path: str, body: bytes, headers: Message) -> tuple[int, Any]:
+        ip_address = path.rstrip("/").rsplit("/", 1)[-1]
+        country, country_code = countries[sum(map(ord, ip_address)) % len(countries)]
+        return 200, {
+            "status": "success",
+            "query": ip_address,
+            "country": country,
+            "countryCode": country_code,
+            "city": "Benchmark City",
+            "regionName": "Benchmark Region",
+            "isp": "Benchmark ISP",
+            "timezone": "Europe/Amsterdam",
+        }
+
+    return FakeServer(handle, latency)
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from typing import Any, Final
+
+import httpx
+
+from benchmarks.fakes import make_geolocation_server, make_upstash_server
+from benchmarks.stats import summarize
+
+
+SECRET_KEY: Final = "benchmark-secret-key"
+USERNAME: Final = "benchmark"
+SESSION_COOKIE_NAME: Final = "tracker_session"
+# endpoint: path, the pages a visitor and an admin see
+ROUTES: Final = {
+    "landing": "/",
+    "weight": "/weight",
+    "calories": "/calories",
+    "admin.requests": "/admin/requests",
+}
+IP_POOL_SIZE: Final = 500
+STARTUP_TIMEOUT: Final = 60
+
+
+def _serve(env: dict[str, str], ports: multiprocessing.Queue, log_path: str) -> None:
+    """Runs the app in a fresh interpreter, so the config is read from env."""
+    os.environ.update(env)
+    log = open(log_path, "a")
+    os.dup2(log.fileno(), 2)
+
+    from werkzeug.serving import make_server
+    from run import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def get_session_cookie() -> str:
+    """Signs a logged-in session the way the app does."""
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    return app.session_interface.get_signing_serializer(app).dumps({"username": USERNAME})
+
+
+class AppServer:
+    """The app in a subprocess, backed by a fake Upstash and ip-api."""
+
+    def __init__(self, redis_latency: float, geo_latency: float, directory: str):
+        self.directory = directory
+        self.upstash = make_upstash_server(redis_latency).start()
+        self.geolocation = make_geolocation_server(geo_latency).start()
+        self.log_path = os.path.join(directory, "app.log")
+        self.env = {
+            "DEBUG": "False",
+            "SECRET_KEY": SECRET_KEY,
+            "UPSTASH_REDIS_REST_URL": self.upstash.url,
+            "UPSTASH_REDIS_REST_TOKEN": "benchmark",
+            "TRACKING_GEO_API_URL": f"{self.geolocation.url}/json",
+            # Every simulated client is a different IP, but the limiter would still hit the same fake Redis
+            "RATE_LIMIT_ENABLED": "False",
+            # Clients connect directly, the simulated IP is the one entry a proxy would add
+            "PROXY_HOPS": "1",
+            "METRICS_DIR": os.path.join(directory, "metrics"),
+            "TEMPLATE_CACHE_DIR": os.path.join(directory, "templates"),
+            "GRAPHS_CACHE_DIR": os.path.join(directory, "graphs"),
+        }
+        self.process: multiprocessing.Process | None = None
+        self.url: str | None = None
+
+    def start(self) -> 'AppServer':
+        context = multiprocessing.get_context("spawn")
+        ports = context.Queue()
+        self.process = context.Process(target=_serve, args=(self.env, ports, self.log_path), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{ports.get(timeout=STARTUP_TIMEOUT)}"
+        self.upstash.redis.execute(["SET", f"users_{USERNAME}", USERNAME])
+        return self
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        self.upstash.stop()
+        self.geolocation.stop()
+
+
+def run_level(url: str, concurrency: int, requests: int, routes: dict[str, str]) -> dict[str, Any]:
+    """Sends requests spread over routes from concurrency threads, each
+    request from a random client IP."""
+    cookies = {SESSION_COOKIE_NAME: get_session_cookie()}
+    ips = [f"203.0.{index // 250}.{index % 250 + 1}" for index in range(IP_POOL_SIZE)]
+    names = list(routes)
+    work = [names[index % len(names)] for index in range(requests)]
+    random.Random(concurrency).shuffle(work)
+    work_lock = threading.Lock()
+    latencies: dict[str, list[float]] = {name: [] for name in routes}
+    statuses: dict[str, Counter] = {name: Counter() for name in routes}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(base_url=url, cookies=cookies, limits=limits, timeout=30) as client:
+        def worker() -> None:
+            while True:
+                with work_lock:
+                    if not work:
+                        return
+                    name = work.pop()
+                headers = {"X-Forwarded-For": random.choice(ips)}
+                started_at = time.perf_counter()
+                try:
+                    status = str(client.get(routes[name], headers=headers).status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies[name].append((time.perf_counter() - started_at) * 1000)
+                statuses[name][status] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency": summarize([value for values in latencies.values() for value in values]),
+        "routes": {
+            name: {"latency": summarize(latencies[name]), "statuses": dict(statuses[name])}
+            for name in routes
+        },
+    }
+
+
+def run_load(concurrency: list[int], requests: int, redis_latency: float, geo_latency: float,
+             warmup: int = 50) -> dict[str, Any]:
+    """Starts the app against the fakes and runs every concurrency level."""
+    with tempfile.TemporaryDirectory(prefix="tracking-benchmark-") as directory:
+        server = AppServer(redis_latency, geo_latency, directory).start()
+        try:
+            # Fills template, page and geolocation caches before measuring
+            run_level(server.url, 4, warmup, ROUTES)
+            levels = [run_level(server.url, level, requests, ROUTES) for level in concurrency]
+            upstream = {
+                "upstash_requests": server.upstash.requests,
+                "upstash_commands": server.upstash.redis.commands,
+                "geolocation_requests": server.geolocation.requests,
+            }
+        finally:
+            server.stop()
+    return {"levels": levels, "upstream": upstream}
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import time
+
+from typing import Any, Callable, Final
+
+from benchmarks.fakes import make_geolocation_server, make_upstash_server
+from benchmarks.stats import summarize
+
+
+USER_AGENTS: Final = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+)
+STORAGE_BACKENDS: Final = ("redis", "file", "memory")
+
+
+def measure(func: Callable[[int], Any], iterations: int) -> dict[str, float]:
+    """Times func(iteration) once per iteration."""
+    durations = []
+    for iteration in range(iterations):
+        started_at = time.perf_counter()
+        func(iteration)
+        durations.append((time.perf_counter() - started_at) * 1000)
+    return summarize(durations)
+
+
+def bench_request_monitor(iterations: int) -> dict[str, Any]:
+    """get_request_details with a cached and an unseen IP per call, and
+    get_device_info with a cached and an unseen user agent per call."""
+    from flask import Flask
+    from utils.request_monitor import RequestMonitor
+
+    monitor = RequestMonitor()
+    app = Flask(__name__)
+    app.add_url_rule("/", "landing", lambda: "")
+
+    def request_details(ip_address: str) -> dict[str, Any]:
+        headers = {"User-Agent": USER_AGENTS[0]}
+        with app.test_request_context("/", headers=headers, environ_base={"REMOTE_ADDR": ip_address}):
+            return monitor.get_request_details()
+
+    request_details("203.0.113.1")
+    monitor.context.get_device_info(USER_AGENTS[0])
+    return {
+        "get_request_details.warm": measure(lambda _: request_details("203.0.113.1"), iterations),
+        "get_request_details.cold": measure(
+            lambda index: request_details(f"198.{index // 65025 % 255}.{index // 255 % 255}.{index % 255 + 1}"),
+            iterations,
+        ),
+        "get_device_info.warm": measure(lambda _: monitor.context.get_device_info(USER_AGENTS[0]), iterations),
+        "get_device_info.cold": measure(
+            lambda index: monitor.context.get_device_info(f"{USER_AGENTS[index % len(USER_AGENTS)]} bench/{index}"),
+            iterations,
+        ),
+    }
+
+
+def make_storage(backend: str, upstash_url: str, log_dir: str) -> Any:
+    """An Upstash instance on one backend, the module singleton is left alone."""
+    from utils.config import CFG
+    from utils.upstash import Upstash
+
+    redis_env = {"UPSTASH_REDIS_REST_URL": upstash_url, "UPSTASH_REDIS_REST_TOKEN": "benchmark"}
+    for name, value in redis_env.items():
+        if backend == "redis":
+            os.environ[name] = value
+        else:
+            os.environ.pop(name, None)
+    CFG.tracking.LOG_DIR = log_dir if backend == "file" else None
+    return Upstash()
+
+
+def bench_storage(backend: str, upstash_url: str, log_dir: str, iterations: int) -> dict[str, Any]:
+    """Every storage path of Upstash on one backend."""
+    from utils.config import CFG
+
+    storage = make_storage(backend, upstash_url, log_dir)
+    now = time.time()
+
+    def entry(index: int) -> dict[str, Any]:
+        return {"epoch": now - iterations + index, "ip_address": "203.0.113.1", "route": "landing"}
+
+    results = {
+        # Buffered for Redis, every WRITE_BUFFER_SIZE-th save also flushes
+        "save": measure(lambda index: storage._save_request_data(entry(index)), iterations),
+    }
+    if backend == "redis":
+        storage.flush_request_data()
+
+        def flush(index: int) -> None:
+            for offset in range(CFG.tracking.WRITE_BUFFER_SIZE - 1):
+                storage._buffer_request_data(entry(index + offset))
+            storage.flush_request_data()
+
+        batches = max(1, iterations // CFG.tracking.WRITE_BUFFER_SIZE)
+        results["flush"] = measure(flush, batches)
+
+    counter_keys = [f"benchmark:counters:{index}" for index in range(24)]
+    results.update({
+        "get_requests": measure(lambda _: storage._get_request_data(limit=50), iterations),
+        "get_requests_between": measure(
+            lambda _: storage._get_requests_between(before=now, since=now - iterations / 2, count=50),
+            iterations,
+        ),
+        "increment_counters": measure(
+            lambda index: storage.increment_counters(counter_keys[index % 24], {"total": 1, "landing": 1}, 3600),
+            iterations,
+        ),
+    })
+    if backend == "redis":
+        storage.flush_request_data()
+    results.update({
+        "get_counters": measure(lambda _: storage.get_counters(counter_keys), iterations),
+        "get_user": measure(lambda _: storage.get_user("test"), iterations),
+    })
+    if storage.request_log:
+        storage.request_log.close()
+    return results
+
+
+def run_micro(iterations: int, redis_latency: float, geo_latency: float) -> dict[str, Any]:
+    """Runs the micro-benchmarks in this process against the fakes."""
+    upstash_server = make_upstash_server(redis_latency).start()
+    geolocation_server = make_geolocation_server(geo_latency).start()
+    environ = dict(os.environ)
+    try:
+        os.environ.update({
+            "UPSTASH_REDIS_REST_URL": upstash_server.url,
+            "UPSTASH_REDIS_REST_TOKEN": "benchmark",
+            "TRACKING_GEO_API_URL": f"{geolocation_server.url}/json",
+        })
+        with tempfile.TemporaryDirectory(prefix="tracking-benchmark-") as directory:
+            from utils.config import CFG
+            CFG.tracking.GEO_API_URL = f"{geolocation_server.url}/json"
+
+            results = {"request_monitor": bench_request_monitor(iterations)}
+            for backend in STORAGE_BACKENDS:
+                log_dir = os.path.join(directory, f"log-{backend}")
+                results[f"storage.{backend}"] = bench_storage(backend, upstash_server.url, log_dir, iterations)
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        upstash_server.stop()
+        geolocation_server.stop()
+    return results
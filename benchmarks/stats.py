@@ -0,0 +1,27 @@
+import math
+
+from typing import Final
+
+
+PERCENTILES: Final = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(durations_ms: list[float]) -> dict[str, float]:
+    """Gets count, mean, percentiles and max of durations in milliseconds."""
+    values = sorted(durations_ms)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 4) if values else 0.0,
+        "max_ms": round(values[-1], 4) if values else 0.0,
+    }
+    for q in PERCENTILES:
+        summary[f"p{q}_ms"] = round(percentile(values, q), 4)
+    return summary
@@ -1,15 +1,26 @@
 from flask import (
     Blueprint,
+    Response,
     flash,
+    jsonify,
     render_template,
     redirect,
+    request,
     url_for,
 )
 
+from utils.analytics import PERIODS, analytics
+from utils.metrics import metrics as metrics_registry
 from utils.upstash import upstash
 from utils.request_monitor import request_monitor
-from .admin_utils import AddUserForm
-from utils.misc import login_required
+from .admin_utils import (
+    AddUserForm,
+    format_cursor,
+    get_page_size,
+    get_request_filter,
+    parse_cursor,
+)
+from utils.misc import login_required, token_or_login_required
 from utils.logger import logger
 from utils.config import CFG
 
@@ -20,14 +31,45 @@ admin_bp = Blueprint("admin", __name__)
 @admin_bp.route(CFG.route.requests, methods=["GET"])
 @login_required
 def requests():
-    """Displays requests."""
-    tracking_data = request_monitor.get_request_data()
-
+    """Displays requests, rows are fetched page by page from requests_data."""
     return render_template(
         CFG.template.requests,
         title="Requests",
-        tracking_data=tracking_data,
+        data_url=url_for(CFG.redirect.requests_data),
+    )
+
+
+@admin_bp.route(CFG.route.requests_data, methods=["GET"])
+@login_required
+def requests_data():
+    """Returns a page of filtered requests as JSON."""
+    try:
+        request_filter = get_request_filter(request.args)
+        cursor = parse_cursor(request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    items, next_cursor = request_monitor.get_request_page(
+        request_filter,
+        cursor=cursor,
+        limit=get_page_size(request.args),
     )
+    return jsonify({
+        "items": items,
+        "next_cursor": format_cursor(next_cursor),
+    })
+
+
+@admin_bp.route(CFG.route.requests_summary, methods=["GET"])
+@login_required
+def requests_summary():
+    """Returns pre-aggregated traffic counters per hour or day as JSON."""
+    period = request.args.get("period", "hour")
+    if period not in PERIODS:
+        return jsonify({"error": f"Unknown period: {period}"}), 400
+
+    buckets = request.args.get("buckets", 24, type=int) or 24
+    return jsonify(analytics.get_summary(period, buckets))
 
 
 @admin_bp.route(CFG.route.add_user, methods=["GET", "POST"])
@@ -56,3 +98,14 @@ def add_user():
         title="Add User",
         add_user_form=add_user_form,
     )
+
+
+@admin_bp.route(CFG.route.metrics, methods=["GET"])
+@token_or_login_required(CFG.server.METRICS_TOKEN)
+def metrics():
+    """Returns the metrics of all workers in the Prometheus text format."""
+    return Response(
+        metrics_registry.render(),
+        mimetype="text/plain; version=0.0.4",
+        headers={"Cache-Control": "no-store"},
+    )
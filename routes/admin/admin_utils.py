@@ -1,7 +1,79 @@
+import pytz
+
+from datetime import datetime
 from flask_wtf import FlaskForm
+from typing import Final
+from werkzeug.datastructures import MultiDict
 from wtforms import StringField, HiddenField, SubmitField
 from wtforms.validators import DataRequired, EqualTo
 
+from utils.request_monitor import RequestFilter
+
+
+DEFAULT_PAGE_SIZE: Final = 25
+MAX_PAGE_SIZE: Final = 100
+DEVICE_TYPES: Final = ("mobile", "tablet", "pc", "bot")
+# Timezone of the stored request timestamps, shown in the admin table
+TIMEZONE: Final = "Europe/Amsterdam"
+
+
+def parse_epoch(value: str | None) -> float | None:
+    """Parses an epoch or ISO datetime query value. Datetimes without an
+    offset, as sent by datetime-local inputs, are in TIMEZONE."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = pytz.timezone(TIMEZONE).localize(moment)
+    return moment.timestamp()
+
+
+def parse_cursor(value: str | None) -> tuple[float, int] | None:
+    """Parses an 'epoch:seen' page cursor, a bare epoch has seen 0."""
+    if not value:
+        return None
+    epoch, _, seen = value.partition(":")
+    return float(epoch), int(seen or 0)
+
+
+def format_cursor(cursor: tuple[float, int] | None) -> str | None:
+    """Formats a page cursor as parsed by parse_cursor."""
+    if cursor is None:
+        return None
+    epoch, seen = cursor
+    return f"{epoch!r}:{seen}"
+
+
+def parse_bool(value: str | None) -> bool | None:
+    """Parses a true/false query value."""
+    if value is None or value == "":
+        return None
+    return value.lower() in ("1", "true", "yes")
+
+
+def get_request_filter(args: MultiDict) -> RequestFilter:
+    """Builds a request filter from query arguments."""
+    device = args.get("device") or None
+    if device not in DEVICE_TYPES:
+        device = None
+    return RequestFilter(
+        route=args.get("route") or None,
+        country=args.get("country") or None,
+        device=device,
+        is_bot=parse_bool(args.get("is_bot")),
+        since=parse_epoch(args.get("since")),
+        until=parse_epoch(args.get("until")),
+    )
+
+
+def get_page_size(args: MultiDict) -> int:
+    """Gets the requested page size, clamped to MAX_PAGE_SIZE."""
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int) or DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
 
 class AddUserForm(FlaskForm):
     username = StringField(
@@ -1,23 +1,35 @@
+import io
+
 from flask import (
     Blueprint,
+    abort,
     render_template,
+    send_file,
+    session,
 )
 from typing import Final
 
 from utils.request_monitor import request_monitor
+from utils.graphs import GRAPH_SIZES, METRICS, PERIOD_PATTERN, graph_renderer
 from .home_utils import (
     get_2025_calories_dict,
     get_2025_weight_dict,
     get_calories_image_paths,
+    get_graph_sources,
+    get_graph_urls,
+    get_measurement_stats,
+    get_page_cache_key,
     get_weight_image_paths,
     get_image_title
 )
 from utils.misc import login_required
 from utils.config import CFG
+from utils.extensions import get_cache
 from utils.logger import logger
 
 
 home_bp = Blueprint("home", __name__)
+cache = get_cache()
 CACHE_DURATION: Final = 3600
 
 
@@ -37,20 +49,35 @@ def weight(month=None):
     """Displays weight images and month selection."""
     request_monitor.monitor()
 
-    path_s, path_l = get_weight_image_paths(month)
+    # Pages are the same for users with the same measurements, so they are cached per month and stats
+    stats = get_measurement_stats("weight", month)
+    key = get_page_cache_key("weight", month, stats)
+    page = cache.get(key) if key else None
+    if page is not None:
+        return page
+
+    path_s, _ = get_weight_image_paths(month)
     title = get_image_title(path_s, month)
+    src_s, src_l = get_graph_urls("weight", month)
+    sources_s, sources_l = get_graph_sources("weight", month)
     months2025 = get_2025_weight_dict()
     url = CFG.redirect.weight
 
-    return render_template(
+    page = render_template(
         CFG.template.graph,
         title=title,
-        path_s=path_s,
-        path_l=path_l,
+        src_s=src_s,
+        src_l=src_l,
+        sources_s=sources_s,
+        sources_l=sources_l,
         months2025=months2025,
         current_month=month,
         url=url,
+        stats=stats,
     )
+    if key:
+        cache.set(key, page, timeout=CFG.server.PAGE_CACHE_DURATION)
+    return page
 
 
 @home_bp.route(CFG.route.calories, methods=["GET"])
@@ -60,17 +87,53 @@ def calories(month=None):
     """Displays weight images and month selection."""
     request_monitor.monitor()
 
-    path_s, path_l = get_calories_image_paths(month)
+    # Pages are the same for users with the same measurements, so they are cached per month and stats
+    stats = get_measurement_stats("calories", month)
+    key = get_page_cache_key("calories", month, stats)
+    page = cache.get(key) if key else None
+    if page is not None:
+        return page
+
+    path_s, _ = get_calories_image_paths(month)
     title = get_image_title(path_s, month)
+    src_s, src_l = get_graph_urls("calories", month)
+    sources_s, sources_l = get_graph_sources("calories", month)
     months2025 = get_2025_calories_dict()
     url = CFG.redirect.calories
 
-    return render_template(
+    page = render_template(
         CFG.template.graph,
         title=title,
-        path_s=path_s,
-        path_l=path_l,
+        src_s=src_s,
+        src_l=src_l,
+        sources_s=sources_s,
+        sources_l=sources_l,
         months2025=months2025,
         current_month=month,
         url=url,
+        stats=stats,
+    )
+    if key:
+        cache.set(key, page, timeout=CFG.server.PAGE_CACHE_DURATION)
+    return page
+
+
+@home_bp.route(CFG.route.graph_image, methods=["GET"])
+@login_required
+def graph_image(metric, period, size):
+    """Serves a graph rendered from the metric data."""
+    if metric not in METRICS or size not in GRAPH_SIZES or not PERIOD_PATTERN.fullmatch(period):
+        abort(404)
+
+    graph = graph_renderer.get_graph(session["username"], metric, period, size)
+    if graph is None:
+        abort(404)
+
+    key, png = graph
+    return send_file(
+        io.BytesIO(png),
+        mimetype="image/png",
+        etag=key,
+        max_age=CFG.graphs.CACHE_DURATION,
+        conditional=True,
     )
@@ -1,47 +1,151 @@
+from flask import current_app, session, url_for
+from typing import Any, Final
+
+from utils.assets import get_image_sources
+from utils.config import CFG
+from utils.graphs import graph_renderer
+from utils.logger import logger
+
+
 all_months = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+YEAR: Final = CFG.graphs.YEAR
+# Months with hand-made images in static/images
+STATIC_MONTHS: Final = {
+    "weight": ["July", "August"],
+    "calories": ["July", "August"],
+}
 
 
 def get_2025_weight_dict() -> dict[str, str]:
     """Returns a dictionary of weight image paths for 2025."""
-    data = {
-        "July": "weight_july_2025_",
-        "August": "weight_august_2025_",
-    }
-    return data
+    return get_months_dict("weight")
 
 
 def get_2025_calories_dict() -> dict[str, str]:
     """Returns a dictionary of calories image paths for 2025."""
-    data = {
-        "July": "calories_july_2025_",
-        "August": "calories_august_2025_",
+    return get_months_dict("calories")
+
+
+def get_months_dict(metric: str) -> dict[str, str]:
+    """Returns months with a static image or measurements of the user, in calendar order."""
+    months = set(STATIC_MONTHS[metric])
+    try:
+        series = graph_renderer.get_series(session["username"], metric)
+        months.update(all_months[month - 1] for month in series.get_months(YEAR))
+
+    except Exception as e:
+        logger.error(f"Failed to load {metric} series: {e}")
+
+    return {
+        month: f"{metric}_{month.lower()}_{YEAR}_"
+        for month in all_months if month in months
     }
-    return data
 
 
+def get_page_cache_key(metric: str, month: str | None, stats: dict[str, Any] | None = None) -> str | None:
+    """Returns the cache key of a graph page, None for unknown months.
+
+    The key holds the version of the user's measurements, which covers the
+    month index and graph URLs, the version of the stats, which also covers
+    the weight series used by the calorie balance, and the static files
+    version, so any change gives a new key."""
+    if month is not None and month not in all_months:
+        return None
+
+    try:
+        series = graph_renderer.get_series(session["username"], metric)
+    except Exception as e:
+        logger.error(f"Failed to load {metric} series: {e}")
+        return None
+
+    data_version = series.version
+    static_version = current_app.config["STATIC_MANIFEST"].version
+    stats_version = stats["version"] if stats else "none"
+    return f"page_{metric}_{month or 'all'}_{data_version}_{stats_version}_{static_version}"
+
+
+def get_period(month: str | None) -> str:
+    """Returns the graph period of a month, or the whole year."""
+    if month is None:
+        return str(YEAR)
+    return f"{YEAR}-{all_months.index(month) + 1:02d}"
+
+
+def get_measurement_stats(metric: str, month: str | None) -> dict[str, Any] | None:
+    """Returns the stats of the user's measurements in the month or year, None without data."""
+    if month is not None and month not in all_months:
+        return None
+
+    try:
+        # Imported here, so numpy is only loaded once a graph page is served
+        from utils.measurements import measurement_store
+
+        return measurement_store.get_stats(session["username"], metric, get_period(month))
+
+    except Exception as e:
+        logger.error(f"Failed to get {metric} stats: {e}")
+        return None
+
+
+def has_rendered_graph(metric: str, month: str | None) -> bool:
+    """Returns whether the graph of a month can be rendered from the user's measurements."""
+    if month is not None and month not in all_months:
+        return False
+
+    period = get_period(month)
+    try:
+        return graph_renderer.has_graph(session["username"], metric, period)
+
+    except Exception as e:
+        logger.error(f"Failed to check {metric} graph for {period}: {e}")
+        return False
+
+
+def get_graph_urls(metric: str, month: str | None) -> tuple[str, str]:
+    """Returns small and large graph URLs, rendered from data when available
+    and falling back to the static images otherwise. Rendered graph URLs carry
+    the data version, so browsers do not keep showing a graph after an import."""
+    if has_rendered_graph(metric, month):
+        period = get_period(month)
+        version = graph_renderer.get_series(session["username"], metric).get_period(period).version
+        return tuple(
+            url_for(CFG.redirect.graph_image, metric=metric, period=period, size=size, v=version)
+            for size in ("s", "l")
+        )
+
+    path_s, path_l = get_static_image_paths(metric, month)
+    return url_for("static", filename=path_s), url_for("static", filename=path_l)
+
+
+def get_graph_sources(metric: str, month: str | None) -> tuple[list[dict], list[dict]]:
+    """Returns small and large WebP/AVIF <source> entries of the static images,
+    empty when the graph is rendered from data or no variants were built."""
+    if has_rendered_graph(metric, month):
+        return [], []
+
+    path_s, path_l = get_static_image_paths(metric, month)
+    return get_image_sources(path_s, url_for), get_image_sources(path_l, url_for)
+
 
 def get_weight_image_paths(month: str | None) -> tuple[str, str]:
     """Returns a tuple of weight image paths for a given month."""
-    if month is None:
-        path_s = "images/weight_2025_s.png"
-        path_l = "images/weight_2025_l.png"
-    
-    else:
-        path_s = f"images/weight_{month.lower()}_2025_s.png"
-        path_l = f"images/weight_{month.lower()}_2025_l.png"
-    
-    return path_s, path_l
+    return get_static_image_paths("weight", month)
 
 
 def get_calories_image_paths(month: str | None) -> tuple[str, str]:
     """Returns a tuple of calories image paths for a given month."""
+    return get_static_image_paths("calories", month)
+
+
+def get_static_image_paths(metric: str, month: str | None) -> tuple[str, str]:
+    """Returns a tuple of static image paths for a given metric and month."""
     if month is None:
-        path_s = "images/calories_2025_s.png"
-        path_l = "images/calories_2025_l.png"
-    
+        path_s = f"images/{metric}_{YEAR}_s.png"
+        path_l = f"images/{metric}_{YEAR}_l.png"
+
     else:
-        path_s = f"images/calories_{month.lower()}_2025_s.png"
-        path_l = f"images/calories_{month.lower()}_2025_l.png"
+        path_s = f"images/{metric}_{month.lower()}_{YEAR}_s.png"
+        path_l = f"images/{metric}_{month.lower()}_{YEAR}_l.png"
 
     return path_s, path_l
 
@@ -0,0 +1,136 @@
+(() => {
+const navLinks = document.querySelectorAll(".nav-link");
+navLinks.forEach(link => {
+link.addEventListener("mouseenter", () => {
+navLinks.forEach(otherLink => {
+const animation = otherLink.animate(
+[
+{ color: getComputedStyle(otherLink).color },
+{ color: otherLink === link ? "var(--text-hovered)" : "var(--text-unhovered)" }
+],
+{
+duration: 400,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+});
+link.addEventListener("mouseleave", () => {
+navLinks.forEach(otherLink => {
+const animation = otherLink.animate(
+[
+{ color: getComputedStyle(otherLink).color },
+{ color: "var(--text-white)" }
+],
+{
+duration: 1500,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+});
+});
+})();
+(() => {
+const addUserForm = document.querySelector(".add-user-form");
+const formInputs = document.querySelectorAll(".form-input-field");
+function runAnimation(element, isEntering) {
+if (!element.value) {
+element.animate(
+[
+{
+color: isEntering ? "var(--text-unhovered)" : "var(--text-hovered)",
+borderBottomColor: isEntering ? "var(--text-unhovered)" : "var(--text-hovered)"
+},
+{
+color: isEntering ? "var(--text-hovered)" : "var(--text-unhovered)",
+borderBottomColor: isEntering ? "var(--text-hovered)" : "var(--text-unhovered)"
+}
+],
+{
+duration: 300,
+easing: "ease",
+fill: "forwards"
+}
+);
+}
+}
+formInputs.forEach(input => {
+input.addEventListener("mouseenter", () => {
+if (!input.value) {
+runAnimation(input, true);
+}
+});
+input.addEventListener("mouseleave", () => {
+if (!input.value && !input.matches(":focus")) {
+runAnimation(input, false);
+}
+});
+input.addEventListener("focus", () => {
+if (!input.value) {
+runAnimation(input, true);
+}
+});
+input.addEventListener("blur", () => {
+if (!input.value) {
+runAnimation(input, false);
+}
+});
+});
+const formBtn = document.querySelector(".form-btn");
+formBtn.addEventListener("mouseenter", () => {
+formBtn.animate(
+[
+{ color: "var(--text-unhovered)" },
+{ color: "var(--text-hovered)" }
+],
+{
+duration: 300,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+formBtn.addEventListener("mouseleave", () => {
+formBtn.animate(
+[
+{ color: "var(--text-hovered)" },
+{ color: "var(--text-unhovered)" }
+],
+{
+duration: 300,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+const formDivider = document.querySelector(".form-devider");
+formDivider.addEventListener("mouseenter", () => {
+formDivider.animate(
+[
+{ borderBottomColor: "var(--text-unhovered)" },
+{ borderBottomColor: "var(--text-hovered)" }
+],
+{
+duration: 300,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+formDivider.addEventListener("mouseleave", () => {
+formDivider.animate(
+[
+{ borderBottomColor: "var(--text-hovered)" },
+{ borderBottomColor: "var(--text-unhovered)" }
+],
+{
+duration: 300,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+})();
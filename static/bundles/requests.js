@@ -0,0 +1,126 @@
+(() => {
+const navLinks = document.querySelectorAll(".nav-link");
+navLinks.forEach(link => {
+link.addEventListener("mouseenter", () => {
+navLinks.forEach(otherLink => {
+const animation = otherLink.animate(
+[
+{ color: getComputedStyle(otherLink).color },
+{ color: otherLink === link ? "var(--text-hovered)" : "var(--text-unhovered)" }
+],
+{
+duration: 400,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+});
+link.addEventListener("mouseleave", () => {
+navLinks.forEach(otherLink => {
+const animation = otherLink.animate(
+[
+{ color: getComputedStyle(otherLink).color },
+{ color: "var(--text-white)" }
+],
+{
+duration: 1500,
+easing: "ease",
+fill: "forwards"
+}
+);
+});
+});
+});
+})();
+(() => {
+const trackingContent = document.getElementById("tracking-content");
+const dataUrl = trackingContent.getAttribute("data-url");
+const filtersForm = document.getElementById("filters");
+const rows = document.getElementById("tracking-rows");
+const noData = document.getElementById("no-data");
+const loadMoreButton = document.getElementById("load-more");
+const modal = document.getElementById("detailsModal");
+const modalContent = document.getElementById("modalContent");
+const closeButton = document.getElementsByClassName("close")[0];
+let nextCursor = null;
+let loading = false;
+function showDetails(entry) {
+modalContent.textContent = JSON.stringify(entry, null, 2);
+modal.style.display = "block";
+}
+function addCell(row, text, className) {
+const cell = document.createElement("td");
+cell.textContent = text;
+if (className) {
+cell.className = className;
+}
+row.appendChild(cell);
+}
+function addRow(entry) {
+const geoData = entry.geo_data || {};
+const deviceInfo = entry.device_info;
+const row = document.createElement("tr");
+addCell(row, entry.timestamp);
+addCell(row, entry.route, "unimportant");
+addCell(row, entry.ip_address, "super-unimportant");
+addCell(row, `${geoData.country} (${geoData.country_code})`);
+addCell(row, deviceInfo ? deviceInfo.device : "Unknown", "super-unimportant");
+addCell(row, deviceInfo ? entry.os : "Unknown", "super-unimportant");
+const actions = document.createElement("td");
+const button = document.createElement("button");
+button.className = "details-btn";
+button.textContent = "Details";
+button.addEventListener("click", () => showDetails(entry));
+actions.appendChild(button);
+row.appendChild(actions);
+rows.appendChild(row);
+}
+function getQuery() {
+const params = new URLSearchParams();
+new FormData(filtersForm).forEach((value, key) => {
+if (value) {
+params.set(key, value);
+}
+});
+if (nextCursor !== null) {
+params.set("cursor", nextCursor);
+}
+return params.toString();
+}
+async function loadPage() {
+if (loading) {
+return;
+}
+loading = true;
+loadMoreButton.hidden = true;
+try {
+const response = await fetch(`${dataUrl}?${getQuery()}`, { credentials: "same-origin" });
+const page = await response.json();
+(page.items || []).forEach(addRow);
+nextCursor = page.next_cursor;
+loadMoreButton.hidden = nextCursor === null;
+noData.hidden = rows.children.length > 0;
+} catch (error) {
+console.error("Failed to load requests:", error);
+} finally {
+loading = false;
+}
+}
+filtersForm.addEventListener("submit", event => {
+event.preventDefault();
+rows.replaceChildren();
+nextCursor = null;
+loadPage();
+});
+loadMoreButton.addEventListener("click", loadPage);
+closeButton.onclick = function() {
+modal.style.display = "none";
+}
+window.onclick = function(event) {
+if (event.target == modal) {
+modal.style.display = "none";
+}
+}
+loadPage();
+})();
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """An Upstash without Redis or request log, the flusher thread is not started."""
+    monkeypatch.delenv("UPSTASH_REDIS_REST_URL", raising=False)
+    from utils.config import CFG
+    from utils.upstash import Upstash
+
+    monkeypatch.setattr(CFG.tracking, "LOG_DIR", None)
+    upstash = Upstash()
+    monkeypatch.setattr(upstash, "_ensure_flusher", lambda: None)
+    return upstash
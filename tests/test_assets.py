@@ -0,0 +1,27 @@
+import json
+import os
+
+from utils import assets
+from utils.assets import STATIC_MANIFEST, get_static_fingerprints
+
+
+def test_committed_manifest_matches_the_static_files():
+    """Deployments serve the committed manifest as it is, a stale one would
+    give changed files their old immutable URLs. Rebuild it with
+    python -m utils.assets static."""
+    with open(STATIC_MANIFEST) as file:
+        assert json.load(file) == get_static_fingerprints()
+
+
+def test_variants_no_longer_in_the_manifest_are_removed(tmp_path, monkeypatch):
+    optimized_dir = tmp_path / assets.OPTIMIZED_DIR
+    optimized_dir.mkdir(parents=True)
+    monkeypatch.setattr(assets, "STATIC_DIR", str(tmp_path))
+    monkeypatch.setattr(assets, "IMAGE_MANIFEST", str(optimized_dir / "manifest.json"))
+    for filename in ("logo-480.webp", "logo-480.webp.br", "logo-960.webp", "logo-960.webp.gz",
+                     "removed-480.webp", "manifest.json", "manifest.json.gz"):
+        (optimized_dir / filename).write_bytes(b"")
+
+    manifest = {"images/logo.png": {"variants": {"webp": [{"width": 480, "path": "images/optimized/logo-480.webp"}]}}}
+    assert assets.remove_stale_variants(manifest) == 3
+    assert sorted(os.listdir(optimized_dir)) == ["logo-480.webp", "logo-480.webp.br", "manifest.json", "manifest.json.gz"]
@@ -0,0 +1,170 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils import circuit_breaker, http_client
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the breaker, advanced by the test."""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker("upstream", failure_threshold=3, recovery_timeout=30, half_open_calls=1)
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.record_failure()
+
+
+def test_opens_after_failures_in_a_row(breaker):
+    fail(breaker, 2)
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.get_status() == {"state": OPEN, "failures": 3, "opened": 1, "rejected": 1}
+
+
+def test_success_resets_the_failure_count(breaker):
+    fail(breaker, 2)
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+
+def test_turns_half_open_after_the_recovery_timeout(breaker, clock):
+    fail(breaker, 3)
+    clock[0] += 29.9
+    assert not breaker.allow()
+
+    clock[0] += 0.1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only half_open_calls trial calls go through
+    assert not breaker.allow()
+
+
+def test_trial_success_closes_it(breaker, clock):
+    fail(breaker, 3)
+    clock[0] += 30
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert not breaker.is_open()
+    assert all(breaker.allow() for _ in range(5))
+
+
+def test_trial_failure_opens_it_again(breaker, clock):
+    fail(breaker, 3)
+    clock[0] += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.get_status()["opened"] == 2
+    # The recovery timeout starts over from the failed trial
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+def test_trial_that_never_reports_back_is_given_up_on(breaker, clock):
+    fail(breaker, 3)
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+class InterruptedTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Transport whose calls end with an error that is not an httpx.TransportError."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        raise self.error
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        raise self.error
+
+
+@pytest.fixture
+def half_open_breaker(breaker, clock, monkeypatch) -> CircuitBreaker:
+    """The breaker of trial.test, waiting for its trial call."""
+    monkeypatch.setitem(http_client._breakers, "trial.test", breaker)
+    fail(breaker, 3)
+    clock[0] += 30
+    return breaker
+
+
+def test_interrupted_trial_call_is_released(half_open_breaker):
+    transport = http_client.RetryTransport(InterruptedTransport(KeyboardInterrupt()), retries=2)
+    with pytest.raises(KeyboardInterrupt):
+        transport.handle_request(httpx.Request("POST", "http://trial.test/"))
+    assert half_open_breaker.state == OPEN
+
+
+def test_cancelled_async_trial_call_is_released(half_open_breaker):
+    transport = http_client.AsyncRetryTransport(InterruptedTransport(asyncio.CancelledError()), retries=2)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(transport.handle_async_request(httpx.Request("POST", "http://trial.test/")))
+    assert half_open_breaker.state == OPEN
+
+
+class FailingRedis:
+    """Redis whose pipelines fail with error on exec."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def pipeline(self) -> "FailingRedis":
+        return self
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: None
+
+    def exec(self) -> None:
+        raise self.error
+
+
+def flush_failing(storage, error: Exception) -> None:
+    storage.redis = FailingRedis(error)
+    storage._buffer_request_data({"epoch": 1.0, "route": "landing"})
+    storage.increment_counters("stats_day_20261018", {"total": 1}, 3600)
+    storage.flush_request_data()
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("refused"),
+    CircuitOpenError("upstash"),
+])
+def test_writes_that_were_not_sent_are_replayed(storage, error):
+    flush_failing(storage, error)
+    assert len(storage.replay_buffer) == 1
+    assert storage.replay_counters == {"stats_day_20261018": {"total": 1}}
+
+
+def test_counters_that_may_have_been_applied_are_not_replayed(storage):
+    flush_failing(storage, httpx.ReadTimeout("timed out"))
+    # Re-adding the same entry is idempotent, incrementing a counter again is not
+    assert len(storage.replay_buffer) == 1
+    assert storage.replay_counters == {}
+    assert storage.fallbacks["counters_dropped"] == 1
+    # Still counted for reads from memory
+    assert storage.counters_memory["stats_day_20261018"]["total"] == 1
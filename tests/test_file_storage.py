@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+from datetime import datetime
+
+import pytest
+
+from utils.file_storage import INDEX_ENTRY, RequestLogFile
+
+
+NOW = time.time()
+
+
+def write_segment(directory, date: str, pid: int, epochs: list[float], mtime: float | None = None) -> str:
+    """Writes a complete segment of another process, entries in the given order."""
+    path = os.path.join(directory, f"requests-{date}-{pid}-0000.jsonl")
+    with open(path, "wb") as segment, open(path[:-len(".jsonl")] + ".idx", "wb") as index:
+        for epoch in epochs:
+            index.write(INDEX_ENTRY.pack(segment.tell(), epoch))
+            segment.write((json.dumps({"epoch": epoch, "pid": pid}) + "\n").encode())
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def log(tmp_path):
+    request_log = RequestLogFile(str(tmp_path), rotate_bytes=1024 * 1024, max_segments=30, flush_interval=0.05)
+    yield request_log
+    request_log.close()
+
+
+def get_epochs(data_list):
+    return [data["epoch"] for data in data_list]
+
+
+def test_out_of_order_appends_are_read_newest_first(log):
+    epochs = [NOW - 5, NOW - 1, NOW - 3, NOW - 2, NOW - 4]
+    for epoch in epochs:
+        log.append({"epoch": epoch})
+
+    assert get_epochs(log.latest()) == sorted(epochs, reverse=True)
+    assert get_epochs(log.latest(limit=2, offset=1)) == [NOW - 2, NOW - 3]
+    assert get_epochs(log.between(before=NOW - 1, since=NOW - 4, count=10)) == [NOW - 2, NOW - 3, NOW - 4]
+
+
+def test_entries_appended_after_a_read_are_merged_into_the_order(log):
+    log.append({"epoch": NOW - 1})
+    log.append({"epoch": NOW - 3})
+    assert get_epochs(log.latest()) == [NOW - 1, NOW - 3]
+
+    log.append({"epoch": NOW - 2})
+    log.append({"epoch": NOW})
+    assert get_epochs(log.latest()) == [NOW, NOW - 1, NOW - 2, NOW - 3]
+
+
+def test_segments_of_workers_are_merged_by_epoch(log, tmp_path):
+    date = datetime.fromtimestamp(NOW).strftime("%Y%m%d")
+    write_segment(str(tmp_path), date, 1, [NOW - 6, NOW - 4, NOW - 2])
+    write_segment(str(tmp_path), date, 2, [NOW - 5, NOW - 1, NOW - 3])
+    log.append({"epoch": NOW - 7})
+
+    assert get_epochs(log.latest()) == [NOW - i for i in range(1, 8)]
+    assert get_epochs(log.latest(limit=3, offset=2)) == [NOW - 3, NOW - 4, NOW - 5]
+    assert get_epochs(log.between(before=NOW - 2, since=None, count=3)) == [NOW - 3, NOW - 4, NOW - 5]
+
+
+def test_between_keeps_entries_with_equal_epochs(log, tmp_path):
+    date = datetime.fromtimestamp(NOW).strftime("%Y%m%d")
+    write_segment(str(tmp_path), date, 1, [NOW - 2, NOW - 1])
+    log.append({"epoch": NOW - 1})
+    log.append({"epoch": NOW - 1})
+
+    assert get_epochs(log.between(before=NOW, since=NOW - 1, count=10)) == [NOW - 1] * 3
+
+
+def test_partially_written_line_is_skipped(log, tmp_path):
+    date = datetime.fromtimestamp(NOW).strftime("%Y%m%d")
+    path = write_segment(str(tmp_path), date, 1, [NOW - 2, NOW - 1])
+    with open(path, "rb+") as file:
+        file.truncate(os.path.getsize(path) - 1)
+
+    assert get_epochs(log.latest()) == [NOW - 2]
+
+
+def test_buffered_lines_are_flushed_periodically(log, tmp_path):
+    log.append({"epoch": NOW})
+    reader = RequestLogFile(str(tmp_path), rotate_bytes=1024 * 1024, max_segments=30)
+
+    deadline = time.monotonic() + 2
+    while not reader.latest() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert get_epochs(reader.latest()) == [NOW]
+
+
+def test_only_segments_that_cannot_be_open_are_pruned(tmp_path):
+    today = datetime.fromtimestamp(NOW).strftime("%Y%m%d")
+    yesterday = datetime.fromtimestamp(NOW - 86400).strftime("%Y%m%d")
+    old_worker = write_segment(str(tmp_path), yesterday, 1, [NOW - 86400], mtime=NOW - 86400)
+    live_worker = write_segment(str(tmp_path), today, 2, [NOW - 10], mtime=NOW - 10)
+
+    request_log = RequestLogFile(str(tmp_path), rotate_bytes=1024 * 1024, max_segments=1)
+    request_log.append({"epoch": NOW})
+    request_log.close()
+
+    assert not os.path.exists(old_worker)
+    assert os.path.exists(live_worker)
+    assert get_epochs(request_log.latest()) == [NOW, NOW - 10]
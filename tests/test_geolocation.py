@@ -0,0 +1,94 @@
+import pytest
+
+from utils.geolocation import IPRangeDatabase, IPRangeTable
+
+
+HEADER = "start,end,version,country,country_code,city\n"
+
+
+def write_csv(tmp_path, content: str) -> str:
+    path = tmp_path / "ranges.csv"
+    path.write_text(content)
+    return str(path)
+
+
+@pytest.fixture
+def database(tmp_path) -> IPRangeDatabase:
+    return IPRangeDatabase.from_csv(write_csv(tmp_path, (
+        "network,country,country_code,city\n"
+        "203.0.113.0/24,Netherlands,NL,Amsterdam\n"
+        "198.51.100.0/25,Germany,DE,Berlin\n"
+        "2001:db8::/32,Japan,JP,Tokyo\n"
+    )))
+
+
+def test_ipv4_lookup(database):
+    assert database.lookup("203.0.113.7")["countryCode"] == "NL"
+    assert database.lookup("198.51.100.127")["city"] == "Berlin"
+    assert database.lookup("198.51.100.128") is None
+    assert database.lookup("8.8.8.8") is None
+
+
+def test_ipv6_lookup(database):
+    assert database.lookup("2001:db8::1")["country"] == "Japan"
+    assert database.lookup("2001:db9::1") is None
+
+
+def test_ipv4_mapped_ipv6_uses_the_ipv4_table(database):
+    assert database.lookup("::ffff:203.0.113.7")["countryCode"] == "NL"
+
+
+def test_invalid_addresses_are_not_found(database):
+    assert database.lookup("not-an-ip") is None
+    assert database.lookup("") is None
+    assert database.lookup("203.0.113.256") is None
+
+
+def test_missing_fields_are_unknown(database):
+    assert database.lookup("203.0.113.7")["isp"] == "Unknown"
+
+
+def test_integer_and_address_ranges(tmp_path):
+    database = IPRangeDatabase.from_csv(write_csv(tmp_path, HEADER + (
+        "3405803776,3405804031,,Netherlands,NL,Amsterdam\n"
+        "2001:db8::,2001:db8::ffff,,Japan,JP,Tokyo\n"
+    )))
+    assert database.lookup("203.0.113.1")["city"] == "Amsterdam"
+    assert database.lookup("2001:db8::abcd")["city"] == "Tokyo"
+    assert len(database) == 2
+
+
+def test_integer_ipv6_range_below_32_bits_with_version(tmp_path):
+    database = IPRangeDatabase.from_csv(write_csv(tmp_path, HEADER + "1,255,6,Local,LL,Nowhere\n"))
+    assert database.lookup("::1")["country"] == "Local"
+    assert database.lookup("0.0.0.1") is None
+
+
+@pytest.mark.parametrize("line", [
+    "10,5,,Reversed,RV,Nowhere",
+    "0,4294967296,4,Too large,TL,Nowhere",
+    "1,2,5,Bad version,BV,Nowhere",
+    "203.0.113.0,2001:db8::1,,Mixed,MX,Nowhere",
+    "203.0.113.x,203.0.113.9,,Invalid,IV,Nowhere",
+])
+def test_invalid_ranges_are_rejected(tmp_path, line):
+    with pytest.raises(ValueError):
+        IPRangeDatabase.from_csv(write_csv(tmp_path, HEADER + line + "\n"))
+
+
+def test_overlapping_ranges_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Overlapping"):
+        IPRangeDatabase.from_csv(write_csv(tmp_path, (
+            "network,country\n"
+            "203.0.113.0/24,Netherlands\n"
+            "203.0.113.128/25,Germany\n"
+        )))
+
+
+def test_table_finds_range_bounds():
+    table = IPRangeTable.compile([(20, 29, 1), (10, 19, 0)], "I")
+    assert table.find(10) == 0
+    assert table.find(19) == 0
+    assert table.find(29) == 1
+    assert table.find(9) is None
+    assert table.find(30) is None
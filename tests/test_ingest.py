@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.ingest import AsyncIngestQueue
+from utils.request_monitor import RawRequest, RequestMonitor
+
+
+def wait_for(condition, timeout: float = 2) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def make_queue(handler, maxsize: int = 10, concurrency: int = 2) -> AsyncIngestQueue:
+    return AsyncIngestQueue(handler, maxsize=maxsize, concurrency=concurrency, name="test-ingest", shutdown_timeout=2)
+
+
+def test_items_are_handled_on_the_loop():
+    handled = []
+
+    async def handler(item):
+        handled.append((item, threading.current_thread().name))
+
+    ingest = make_queue(handler)
+    assert all(ingest.submit(item) for item in range(3))
+    ingest.stop()
+
+    assert sorted(item for item, _ in handled) == [0, 1, 2]
+    assert {thread for _, thread in handled} == {"test-ingest"}
+    assert ingest.get_status() | {"running": None} == {
+        "running": None, "concurrency": 2, "queued": 0, "max_size": 10,
+        "accepted": 3, "dropped": 0, "processed": 3, "failed": 0,
+    }
+
+
+def test_items_past_maxsize_are_dropped():
+    release = threading.Event()
+
+    async def handler(item):
+        await asyncio.to_thread(release.wait)
+
+    ingest = make_queue(handler, maxsize=3)
+    results = [ingest.submit(item) for item in range(5)]
+    release.set()
+    ingest.stop()
+
+    assert results == [True, True, True, False, False]
+    assert ingest.get_status()["dropped"] == 2
+    assert ingest.get_status()["processed"] == 3
+
+
+def test_concurrency_is_limited_by_the_semaphore():
+    running, peak = 0, 0
+
+    async def handler(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    ingest = make_queue(handler, concurrency=3)
+    for item in range(10):
+        ingest.submit(item)
+    ingest.stop()
+
+    assert peak == 3
+    assert ingest.get_status()["processed"] == 10
+
+
+def test_stop_drains_pending_items():
+    async def handler(item):
+        await asyncio.sleep(0.02)
+
+    ingest = make_queue(handler, concurrency=1)
+    for item in range(5):
+        ingest.submit(item)
+    ingest.stop()
+
+    status = ingest.get_status()
+    assert status["processed"] == 5
+    assert status["queued"] == 0
+    assert not status["running"]
+
+
+def test_failed_items_are_counted():
+    async def handler(item):
+        if item % 2:
+            raise ValueError("bad item")
+
+    ingest = make_queue(handler)
+    for item in range(4):
+        ingest.submit(item)
+    ingest.stop()
+
+    assert ingest.get_status()["processed"] == 2
+    assert ingest.get_status()["failed"] == 2
+
+
+def test_loop_is_created_again_after_a_fork():
+    handled = []
+
+    async def handler(item):
+        handled.append(item)
+
+    ingest = make_queue(handler)
+    ingest.submit("parent")
+    wait_for(lambda: handled)
+    parent_loop = ingest.loop
+
+    # A forked child inherits the state but not the loop thread, it sees another pid
+    ingest.pid = -1
+    ingest.queued = 4
+    ingest.submit("child")
+    wait_for(lambda: len(handled) == 2)
+
+    assert ingest.loop is not parent_loop
+    assert handled == ["parent", "child"]
+    assert ingest.get_status()["queued"] == 0
+    parent_loop.call_soon_threadsafe(parent_loop.stop)
+    ingest.stop()
+
+
+def test_file_and_memory_saves_run_off_the_loop(storage, monkeypatch):
+    threads = []
+    monkeypatch.setattr(storage, "_save_request_data", lambda data: threads.append(threading.current_thread()))
+
+    asyncio.run(storage.save_request_data_async({"epoch": 1.0}))
+    assert threads and threads[0] is not threading.current_thread()
+
+
+@pytest.fixture
+def monitor(storage, monkeypatch) -> RequestMonitor:
+    request_monitor = RequestMonitor()
+    monkeypatch.setattr(request_monitor, "storage", storage)
+    return request_monitor
+
+
+def test_async_store_saves_the_enriched_request(monitor, storage):
+    raw_request = RawRequest(
+        ip_address="203.0.113.1",
+        user_agent="Mozilla/5.0 (X11; Linux x86_64) Firefox/125.0",
+        route="landing",
+        method="GET",
+        referrer="Direct",
+        timestamp=time.time(),
+        skip_geolocation=True,
+    )
+    asyncio.run(monitor._store_request_async(raw_request))
+
+    [data] = storage.requests_memory.latest()
+    assert data["ip_address"] == "203.0.113.1"
+    assert data["route"] == "landing"
+    assert data["geo_data"]["country"] == "Unknown"
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from utils.config import CFG
+from utils.measurements import TimeSeries, get_calorie_balance, get_stats, parse_csv, parse_json
+
+
+WEIGHT = {
+    "2026-01-05": 80.0,  # Monday
+    "2026-01-06": 81.0,
+    "2026-01-08": 79.0,
+    "2026-01-12": 78.0,  # Monday
+    "2026-01-14": 78.4,
+    "2026-02-02": 77.0,
+    "2026-02-20": 79.0,
+}
+
+
+def make_series(points: dict[str, float]) -> TimeSeries:
+    return TimeSeries.from_points(list(points), list(points.values()))
+
+
+@pytest.fixture
+def weight() -> TimeSeries:
+    return make_series(WEIGHT)
+
+
+def get_days(days: np.ndarray) -> list[str]:
+    return [str(day) for day in days]
+
+
+def test_from_points_sorts_and_keeps_the_last_value_of_a_day():
+    series = TimeSeries.from_points(
+        ["2026-01-03", "2026-01-01", "2026-01-03", "NaT", "2026-01-02"],
+        [3.0, 1.0, 4.0, 9.0, float("nan")],
+    )
+    assert get_days(series.days) == ["2026-01-01", "2026-01-03"]
+    assert series.values.tolist() == [1.0, 4.0]
+
+
+def test_bytes_round_trip(weight):
+    restored = TimeSeries.from_bytes(weight.to_bytes())
+    assert get_days(restored.days) == get_days(weight.days)
+    assert restored.values.tolist() == weight.values.tolist()
+    assert restored.version == weight.version
+    assert make_series({"2026-01-05": 80.1}).version != make_series({"2026-01-05": 80.0}).version
+
+
+def test_merge_replaces_days_of_the_other_series(weight):
+    merged = weight.merge(make_series({"2026-01-06": 80.5, "2026-03-01": 76.0}))
+    assert len(merged) == len(weight) + 1
+    assert merged.values[1] == 80.5
+    assert get_days(merged.days)[-1] == "2026-03-01"
+
+
+def test_period_bounds(weight):
+    assert len(weight.get_period("2026-01")) == 5
+    assert len(weight.get_period("2026-02")) == 2
+    assert len(weight.get_period("2026")) == 7
+    assert len(weight.get_period("2025")) == 0
+
+
+def test_months_with_values(weight):
+    assert weight.get_months(2026) == {1, 2}
+    assert weight.get_months(2025) == set()
+
+
+def test_rolling_mean_leaves_out_days_without_values(weight):
+    january = weight.get_period("2026-01")
+    assert january.rolling_mean(3) == pytest.approx([80.0, 80.5, 80.0, 78.0, 78.2])
+
+
+def test_weekly_means_and_deltas(weight):
+    january = weight.get_period("2026-01")
+    weeks, means = january.weekly_means()
+    assert get_days(weeks) == ["2026-01-05", "2026-01-12"]
+    assert means == pytest.approx([80.0, 78.2])
+
+    weeks, deltas = january.weekly_deltas()
+    assert get_days(weeks) == ["2026-01-12"]
+    assert deltas == pytest.approx([-1.8])
+
+
+def test_monthly_extremes(weight):
+    months, minimums, maximums = weight.monthly_extremes()
+    assert get_days(months) == ["2026-01", "2026-02"]
+    assert minimums.tolist() == [78.0, 77.0]
+    assert maximums.tolist() == [81.0, 79.0]
+
+
+def test_empty_series_statistics():
+    series = TimeSeries.empty()
+    assert len(series.weekly_means()[0]) == 0
+    assert len(series.monthly_extremes()[0]) == 0
+    assert get_stats(series, "weight", "2026") is None
+
+
+def test_calorie_balance_estimates_maintenance_from_the_weight_trend():
+    days = np.arange(np.datetime64("2026-01-05"), np.datetime64("2026-01-19"))
+    calories = TimeSeries(days, np.full(len(days), 2000.0))
+    weight = TimeSeries(days, 80.0 - 0.1 * np.arange(len(days)))
+
+    assert get_calorie_balance(calories, weight, target=2200) == {
+        "average_intake": 2000,
+        "average_balance": -200,
+        "total_balance": -2800,
+        "expected_weight_change": -0.36,
+        "maintenance": 2770,
+    }
+    assert get_calorie_balance(calories, TimeSeries.empty(), target=2200)["maintenance"] is None
+
+
+def test_stats_of_a_month(weight, monkeypatch):
+    monkeypatch.setattr(CFG.graphs, "ROLLING_WINDOW", 7)
+    assert get_stats(weight, "weight", "2026-01") == {
+        "unit": "kg",
+        "days": 5,
+        "latest": 78.4,
+        "window": 7,
+        "rolling_mean": 78.5,
+        "weekly_delta": -1.8,
+        "minimum": 78.0,
+        "maximum": 81.0,
+    }
+    assert get_stats(weight, "weight", "2025-12") is None
+
+
+def test_parse_csv_and_json_give_the_same_series():
+    from_csv = parse_csv("date,weight,calories\n2026-01-05,80,2100\n2026-01-06,,1900\n")
+    from_json = parse_json('[{"date": "2026-01-05", "weight": 80, "calories": 2100},'
+                           ' {"date": "2026-01-06", "calories": 1900}]')
+    for series in (from_csv, from_json):
+        assert len(series["weight"]) == 1
+        assert series["calories"].values.tolist() == [2100.0, 1900.0]
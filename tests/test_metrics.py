@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from flask import Flask, session
+
+from utils.metrics import ARCHIVE_FILENAME, MetricsRegistry
+from utils.misc import token_or_login_required
+
+
+REQUESTS = ("tracking_http_requests_total", (("route", "landing"),))
+QUEUED = ("tracking_ingest_queued", ())
+
+
+@pytest.fixture
+def registry(tmp_path) -> MetricsRegistry:
+    return MetricsRegistry(str(tmp_path), write_interval=60)
+
+
+@pytest.fixture
+def exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_snapshot(directory, pid: int, started_at: float, requests: int, queued: int = 0) -> str:
+    filename = f"{pid}-{int(started_at * 1e9)}.json"
+    samples = [
+        ("tracking_http_requests_total", {"route": "landing"}, requests),
+        ("tracking_ingest_queued", {}, queued),
+    ]
+    with open(os.path.join(directory, filename), "w") as file:
+        json.dump({"pid": pid, "started_at": started_at, "samples": samples}, file)
+    return filename
+
+
+def test_running_workers_are_merged(registry, tmp_path):
+    registry.inc("tracking_http_requests_total", route="landing")
+    write_snapshot(tmp_path, os.getppid(), 1.0, requests=5, queued=2)
+
+    merged = registry.collect()
+    assert merged[REQUESTS] == 6
+    assert merged[QUEUED] == 2
+
+
+def test_exited_workers_are_archived(registry, tmp_path, exited_pid):
+    filename = write_snapshot(tmp_path, exited_pid, 1.0, requests=5, queued=2)
+
+    merged = registry.collect()
+    assert merged[REQUESTS] == 5
+    assert QUEUED not in merged
+    assert not os.path.exists(tmp_path / filename)
+
+    # Read from the archive from now on, and only once
+    assert registry.collect()[REQUESTS] == 5
+    write_snapshot(tmp_path, exited_pid, 2.0, requests=3)
+    assert registry.collect()[REQUESTS] == 8
+
+
+def test_reused_pid_does_not_overwrite_the_exited_worker(registry, tmp_path):
+    older = write_snapshot(tmp_path, os.getppid(), 1.0, requests=5, queued=4)
+    newer = write_snapshot(tmp_path, os.getppid(), 2.0, requests=1, queued=1)
+
+    merged = registry.collect()
+    assert merged[REQUESTS] == 6
+    assert merged[QUEUED] == 1
+    assert not os.path.exists(tmp_path / older)
+    assert os.path.exists(tmp_path / newer)
+
+
+def test_snapshot_left_behind_by_an_interrupted_archive_is_not_counted_twice(registry, tmp_path, exited_pid):
+    filename = write_snapshot(tmp_path, exited_pid, 1.0, requests=5)
+    with open(tmp_path / ARCHIVE_FILENAME, "w") as file:
+        json.dump({"folded": [filename], "samples": [("tracking_http_requests_total", {"route": "landing"}, 5)]}, file)
+
+    assert registry.collect()[REQUESTS] == 5
+
+
+def test_own_snapshot_is_read_live(registry, tmp_path):
+    registry.inc("tracking_http_requests_total", route="landing")
+    registry.write_snapshot()
+    registry.inc("tracking_http_requests_total", route="landing")
+
+    assert registry.collect()[REQUESTS] == 2
+    assert "tracking_http_requests_total{route=\"landing\"} 2" in registry.render()
+
+
+def test_metrics_accept_the_token_or_a_logged_in_user():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.add_url_rule("/metrics", "metrics", token_or_login_required("secret")(lambda: "samples"))
+
+    @app.route("/login")
+    def login():
+        session["username"] = "admin"
+        return "ok"
+
+    with app.test_client() as client:
+        assert client.get("/metrics").status_code == 401
+        assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).text == "samples"
+
+        client.get("/login")
+        assert client.get("/metrics").text == "samples"
@@ -0,0 +1,130 @@
+import pytest
+
+from flask import Flask, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from utils.rate_limit import (
+    LOAD_NORMAL,
+    LOAD_SKIP_GEOLOCATION,
+    LOAD_SKIP_TRACKING,
+    SlidingWindowLimiter,
+    WindowState,
+)
+
+
+class FakeRedis:
+    """Counters shared by limiters, through the pipeline commands the limiter sends."""
+
+    def __init__(self):
+        self.data: dict[str, int] = {}
+
+    def pipeline(self) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def incrby(self, key: str, amount: int) -> None:
+        self.commands.append(("incrby", key, amount))
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.commands.append(("expire", key, seconds))
+
+    def get(self, key: str) -> None:
+        self.commands.append(("get", key, None))
+
+    def exec(self) -> list:
+        results = []
+        for name, key, amount in self.commands:
+            if name == "incrby":
+                self.redis.data[key] = self.redis.data.get(key, 0) + amount
+                results.append(self.redis.data[key])
+            elif name == "expire":
+                results.append(1)
+            else:
+                results.append(self.redis.data.get(key))
+        return results
+
+
+def make_limiter(redis=None, limit: int = 3, sync_ratio: float = 0.5) -> SlidingWindowLimiter:
+    return SlidingWindowLimiter(
+        redis,
+        limits={"default": (limit, 60), "login": (1, 60)},
+        sync_interval=60,
+        sync_ratio=sync_ratio,
+        max_keys=100,
+        shed_ratios=(0.5, 0.8),
+    )
+
+
+def test_rejects_hits_past_the_limit():
+    limiter = make_limiter()
+    decisions = [limiter.hit("landing", "203.0.113.1") for _ in range(4)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert 1 <= decisions[-1].retry_after <= 60
+    assert limiter.get_status()["allowed"] == 3
+    assert limiter.get_status()["rejected"] == 1
+
+
+def test_clients_and_routes_are_limited_separately():
+    limiter = make_limiter()
+    assert limiter.hit("login", "203.0.113.1").allowed
+    assert not limiter.hit("login", "203.0.113.1").allowed
+
+    assert limiter.hit("login", "203.0.113.2").allowed
+    assert limiter.hit("landing", "203.0.113.1").allowed
+
+
+def test_previous_window_is_weighted_by_its_overlap():
+    state = WindowState(limit=10, window=60)
+    state.current, state.pending = 4, 2
+
+    state.roll(1)
+    assert state.estimate(0.25) == pytest.approx(4.5)
+    state.pending = 1
+    assert state.estimate(0.5) == pytest.approx(4)
+
+    # A skipped window leaves nothing to carry over
+    state.roll(3)
+    assert state.estimate(0) == 0
+
+
+def test_roll_returns_hits_not_sent_for_the_old_window():
+    state = WindowState(limit=10, window=60)
+    state.window_index, state.pending = 7, 3
+    assert state.roll(8) == (7, 3)
+
+
+def test_load_is_shed_as_a_client_nears_its_limit():
+    limiter = make_limiter(limit=10)
+    levels = [limiter.hit("landing", "203.0.113.1").load_level for _ in range(10)]
+
+    assert levels[:4] == [LOAD_NORMAL] * 4
+    assert levels[4:7] == [LOAD_SKIP_GEOLOCATION] * 3
+    assert levels[7:] == [LOAD_SKIP_TRACKING] * 3
+
+
+def test_limit_is_shared_between_processes_through_redis():
+    redis = FakeRedis()
+    first, second = make_limiter(redis, limit=4, sync_ratio=0), make_limiter(redis, limit=4, sync_ratio=0)
+
+    assert all(first.hit("landing", "203.0.113.1").allowed for _ in range(4))
+    # The last hit of the first process is sent with the next sync, so one more gets through
+    assert second.hit("landing", "203.0.113.1").allowed
+    assert not second.hit("landing", "203.0.113.1").allowed
+
+
+def test_client_address_comes_from_the_trusted_proxy():
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    app.add_url_rule("/", "landing", lambda: request.remote_addr)
+
+    with app.test_client() as client:
+        # The client wrote the first entry itself, the proxy appended the address it saw
+        response = client.get("/", headers={"X-Forwarded-For": "198.51.100.9, 203.0.113.1"})
+        assert response.text == "203.0.113.1"
+        assert client.get("/").text == "127.0.0.1"
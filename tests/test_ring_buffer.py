@@ -0,0 +1,44 @@
+from utils.ring_buffer import RequestRingBuffer
+
+
+def get_epochs(data_list):
+    return [data["epoch"] for data in data_list]
+
+
+def make_buffer(epochs: list[float], capacity: int = 10) -> RequestRingBuffer:
+    buffer = RequestRingBuffer(capacity)
+    for epoch in epochs:
+        buffer.append({"epoch": epoch, "route": "landing"})
+    return buffer
+
+
+def test_out_of_order_appends_are_read_newest_first():
+    buffer = make_buffer([100, 105, 103, 110, 101])
+    assert get_epochs(buffer.latest()) == [110, 105, 103, 101, 100]
+    assert get_epochs(buffer.latest(limit=2, offset=1)) == [105, 103]
+
+
+def test_between_does_not_stop_at_an_older_entry_appended_late():
+    buffer = make_buffer([100, 105, 103, 110, 101])
+    assert get_epochs(buffer.between(None, 102, 10)) == [110, 105, 103]
+    assert get_epochs(buffer.between(110, 101, 2)) == [105, 103]
+
+
+def test_failed_batch_put_back_is_merged_by_epoch():
+    buffer = make_buffer([200, 201, 202])
+    buffer.extend([{"epoch": 150}, {"epoch": 201.5}, {"epoch": 120}])
+    assert get_epochs(buffer.latest()) == [202, 201.5, 201, 200, 150, 120]
+
+
+def test_full_buffer_drops_the_oldest_entries():
+    buffer = make_buffer([1, 5, 3, 4, 2, 6], capacity=4)
+    assert len(buffer) == 4
+    assert get_epochs(buffer.latest()) == [6, 5, 4, 3]
+
+
+def test_equal_epochs_keep_their_insertion_order():
+    buffer = RequestRingBuffer(5)
+    for route in ("first", "second", "third"):
+        buffer.append({"epoch": 100, "route": route})
+    buffer.append({"epoch": 99, "route": "late"})
+    assert [data["route"] for data in buffer.latest()] == ["third", "second", "first", "late"]
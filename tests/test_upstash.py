@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from upstash_redis import Redis
+from upstash_redis.asyncio import Redis as AsyncRedis
+
+from utils.upstash import Upstash
+
+
+def test_concurrent_memory_counter_increments_are_not_lost(storage):
+    increments, threads = 500, 8
+
+    def increment(thread: int) -> None:
+        for index in range(increments):
+            storage.increment_counters("stats_day_20261018", {"total": 1}, 3600)
+            # New keys prune expired ones while the other threads insert
+            storage.increment_counters(f"stats_hour_{thread}_{index}", {"total": 1}, 3600)
+
+    workers = [threading.Thread(target=increment, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert storage.get_counters(["stats_day_20261018"])["stats_day_20261018"]["total"] == increments * threads
+    assert len(storage.counters_memory) == 1 + increments * threads
+
+
+def test_expired_memory_counters_are_pruned(storage):
+    storage.increment_counters("stats_hour_old", {"total": 1}, 0)
+    time.sleep(0.01)
+    storage.increment_counters("stats_hour_new", {"total": 1}, 3600)
+    assert list(storage.counters_memory) == ["stats_hour_new"]
+
+
+@pytest.mark.parametrize("redis_class", [Redis, AsyncRedis])
+def test_replaced_http_client_is_closed(redis_class):
+    redis = redis_class(url="https://example.upstash.io", token="token")
+    own_client = redis._http._client
+    shared_client = object()
+
+    Upstash._use_http_client(redis, shared_client)
+    assert own_client.is_closed
+    assert redis._http._client is shared_client
+
+
+def test_replaced_async_http_client_is_closed_on_the_running_loop():
+    async def replace():
+        redis = AsyncRedis(url="https://example.upstash.io", token="token")
+        own_client = redis._http._client
+        Upstash._use_http_client(redis, object())
+        await asyncio.sleep(0)
+        return own_client
+
+    assert asyncio.run(replace()).is_closed
@@ -0,0 +1,114 @@
+import re
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Final
+from urllib.parse import urlparse
+
+from utils.upstash import upstash
+from utils.logger import logger
+
+
+STATS_PREFIX: Final = "stats_"
+PERIODS: Final = {
+    # period: (bucket format, bucket size, retention in seconds)
+    "hour": ("%Y%m%d%H", timedelta(hours=1), 8 * 24 * 3600),
+    "day": ("%Y%m%d", timedelta(days=1), 400 * 24 * 3600),
+}
+DIMENSIONS: Final = ("route", "country", "os", "device", "referrer")
+TOTAL_FIELD: Final = "total"
+MAX_BUCKETS: Final = 366
+OS_VERSION_PATTERN: Final = re.compile(r"\s[\d._]*$")
+
+
+class TrafficAnalytics:
+    """Maintains hourly and daily traffic counters, updated at ingest time."""
+
+    def __init__(self):
+        self.storage = upstash
+
+    def record(self, data: dict[str, Any]) -> None:
+        """Increments all counters for a stored request entry."""
+        try:
+            fields = Counter(self._get_fields(data))
+            moment = datetime.fromtimestamp(data.get("epoch", 0), timezone.utc)
+            for period, (bucket_format, _, retention) in PERIODS.items():
+                key = self._get_key(period, moment.strftime(bucket_format))
+                self.storage.increment_counters(key, fields, retention)
+
+        except Exception as e:
+            logger.error(f"Failed to record traffic analytics: {e}")
+
+    def get_summary(self, period: str = "hour", buckets: int = 24) -> dict[str, Any]:
+        """Gets per-bucket and combined counters for the last buckets periods.
+        Reads one hash per bucket, independent of the number of requests."""
+        bucket_format, bucket_size, _ = PERIODS[period]
+        buckets = max(1, min(buckets, MAX_BUCKETS))
+        now = datetime.now(timezone.utc)
+        bucket_names = [(now - bucket_size * index).strftime(bucket_format) for index in range(buckets)]
+        counters = self.storage.get_counters([self._get_key(period, name) for name in bucket_names])
+
+        totals: dict[str, Counter] = {dimension: Counter() for dimension in DIMENSIONS}
+        series = []
+        for name in bucket_names:
+            fields = counters.get(self._get_key(period, name), {})
+            grouped = self._group_fields(fields)
+            for dimension, counts in grouped.items():
+                totals[dimension].update(counts)
+            series.append({
+                "bucket": name,
+                "total": fields.get(TOTAL_FIELD, 0),
+                **grouped,
+            })
+
+        return {
+            "period": period,
+            "buckets": series,
+            "total": sum(bucket["total"] for bucket in series),
+            **{dimension: dict(counts.most_common()) for dimension, counts in totals.items()},
+        }
+
+    def _get_fields(self, data: dict[str, Any]) -> list[str]:
+        """Gets the counter fields a request entry increments."""
+        device_info = data.get("device_info") or {}
+        geo_data = data.get("geo_data") or {}
+        values = {
+            "route": data.get("route") or "Unknown",
+            "country": geo_data.get("country_code") or "Unknown",
+            "os": OS_VERSION_PATTERN.sub("", device_info.get("os") or "Unknown").strip() or "Unknown",
+            "device": self._get_device_type(device_info),
+            "referrer": self._get_referrer_host(data.get("referrer")),
+        }
+        return [TOTAL_FIELD] + [f"{dimension}:{values[dimension]}" for dimension in DIMENSIONS]
+
+    @staticmethod
+    def _get_device_type(device_info: dict[str, Any]) -> str:
+        """Gets bot/mobile/tablet/pc/other from device info."""
+        for device_type in ("bot", "mobile", "tablet", "pc"):
+            if device_info.get(f"is_{device_type}"):
+                return device_type
+        return "other"
+
+    @staticmethod
+    def _get_referrer_host(referrer: str | None) -> str:
+        """Gets the referrer host, so counters do not grow per URL."""
+        if not referrer or referrer == "Direct":
+            return "Direct"
+        return urlparse(referrer).netloc or "Direct"
+
+    @staticmethod
+    def _group_fields(fields: dict[str, int]) -> dict[str, dict[str, int]]:
+        """Groups dimension:value fields per dimension."""
+        grouped: dict[str, dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+        for field, count in fields.items():
+            dimension, _, value = field.partition(":")
+            if dimension in grouped:
+                grouped[dimension][value] = count
+        return grouped
+
+    @staticmethod
+    def _get_key(period: str, bucket: str) -> str:
+        return f"{STATS_PREFIX}{period}_{bucket}"
+
+
+analytics = TrafficAnalytics()
@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Final
+
+from utils.bundles import build_bundles
+from utils.compression import SUFFIXES, compress_static_files
+from utils.logger import logger
+
+
+STATIC_DIR: Final = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+IMAGES_DIR: Final = "images"
+OPTIMIZED_DIR: Final = os.path.join(IMAGES_DIR, "optimized")
+IMAGE_MANIFEST: Final = os.path.join(STATIC_DIR, OPTIMIZED_DIR, "manifest.json")
+IMAGE_EXTENSIONS: Final = (".png", ".jpg", ".jpeg")
+IMAGE_WIDTHS: Final = (480, 960, 1440)
+STATIC_MANIFEST: Final = os.path.join(STATIC_DIR, "manifest.json")
+FINGERPRINT_LENGTH: Final = 10
+# format: (Pillow format, mime type, save options), best compression first
+IMAGE_FORMATS: Final = {
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+    "webp": ("WEBP", "image/webp", {"quality": 85, "method": 6}),
+}
+
+
+def get_file_hash(path: str) -> str:
+    """Returns the sha256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_image_formats() -> dict[str, tuple[str, str, dict[str, Any]]]:
+    """Returns the formats the installed Pillow can write."""
+    from PIL import features
+
+    supported = features.get_supported()
+    return {
+        name: image_format for name, image_format in IMAGE_FORMATS.items()
+        if name in supported and features.check(name)
+    }
+
+
+def _build_image(source: str, source_hash: str, formats: dict) -> tuple[str, dict[str, Any]]:
+    """Writes all width/format variants of one image, runs in a worker process."""
+    from PIL import Image
+
+    name = os.path.splitext(os.path.basename(source))[0]
+    variants: dict[str, list[dict[str, Any]]] = {}
+    with Image.open(os.path.join(STATIC_DIR, source)) as image:
+        widths = [width for width in IMAGE_WIDTHS if width < image.width * 0.9] + [image.width]
+        for format_name, (pillow_format, mime_type, options) in formats.items():
+            variants[format_name] = []
+            for width in widths:
+                height = round(image.height * width / image.width)
+                path = os.path.join(OPTIMIZED_DIR, f"{name}-{width}.{format_name}")
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                resized.save(os.path.join(STATIC_DIR, path), pillow_format, **options)
+                variants[format_name].append({
+                    "width": width,
+                    "path": path.replace(os.sep, "/"),
+                    "bytes": os.path.getsize(os.path.join(STATIC_DIR, path)),
+                })
+
+    return source, {
+        "hash": source_hash,
+        "types": {name: formats[name][1] for name in variants},
+        "variants": variants,
+    }
+
+
+def build_image_variants(workers: int | None = None, force: bool = False) -> dict[str, Any]:
+    """Generates resized modern-format variants of static images in parallel,
+    skipping images whose content hash matches the existing manifest."""
+    os.makedirs(os.path.join(STATIC_DIR, OPTIMIZED_DIR), exist_ok=True)
+    manifest = load_image_manifest(reload=True) if not force else {}
+    formats = get_image_formats()
+    images_dir = os.path.join(STATIC_DIR, IMAGES_DIR)
+
+    jobs, sources = {}, set()
+    for filename in sorted(os.listdir(images_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        source = f"{IMAGES_DIR}/{filename}"
+        sources.add(source)
+        source_hash = get_file_hash(os.path.join(images_dir, filename))
+        entry = manifest.get(source)
+        if entry and entry["hash"] == source_hash and set(entry["variants"]) == set(formats):
+            continue
+        jobs[source] = source_hash
+    # Images removed since the last build
+    for source in set(manifest) - sources:
+        del manifest[source]
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_build_image, source, source_hash, formats)
+                       for source, source_hash in jobs.items()]
+            for future in futures:
+                source, entry = future.result()
+                manifest[source] = entry
+
+    removed = remove_stale_variants(manifest)
+    with open(IMAGE_MANIFEST, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    logger.info(f"Built variants for {len(jobs)} images, {len(manifest) - len(jobs)} unchanged, removed {removed} stale files")
+    _image_manifest.clear()
+    return manifest
+
+
+def remove_stale_variants(manifest: dict[str, Any]) -> int:
+    """Deletes variant files, and their compressed copies, that no manifest
+    entry points to, left behind by removed images or widths."""
+    optimized_dir = os.path.join(STATIC_DIR, OPTIMIZED_DIR)
+    current = {
+        os.path.basename(variant["path"])
+        for entry in manifest.values()
+        for variants in entry["variants"].values()
+        for variant in variants
+    }
+    current.add(os.path.basename(IMAGE_MANIFEST))
+    removed = 0
+    for filename in os.listdir(optimized_dir):
+        path = os.path.join(optimized_dir, filename)
+        original = filename
+        for suffix in SUFFIXES.values():
+            original = original.removesuffix(suffix)
+        if original in current or not os.path.isfile(path):
+            continue
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+_image_manifest: dict[str, Any] = {}
+
+
+def load_image_manifest(reload: bool = False) -> dict[str, Any]:
+    """Loads the generated image manifest, empty when it was not built."""
+    if reload or not _image_manifest:
+        _image_manifest.clear()
+        try:
+            with open(IMAGE_MANIFEST) as file:
+                _image_manifest.update(json.load(file))
+        except (OSError, ValueError):
+            pass
+    return _image_manifest
+
+
+def get_fingerprinted_name(path: str, file_hash: str) -> str:
+    """Returns 'css/base.css' as 'css/base.<hash>.css'."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{file_hash[:FINGERPRINT_LENGTH]}{extension}"
+
+
+def get_static_files() -> list[str]:
+    """Returns all static file paths relative to the static folder."""
+    paths = []
+    for directory, _, filenames in os.walk(STATIC_DIR):
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(directory, filename), STATIC_DIR).replace(os.sep, "/")
+            if os.path.join(STATIC_DIR, path) == STATIC_MANIFEST or path.endswith(tuple(SUFFIXES.values())):
+                continue
+            paths.append(path)
+    return sorted(paths)
+
+
+def get_static_fingerprints() -> dict[str, str]:
+    """Maps every static file to its content-hashed name."""
+    return {
+        path: get_fingerprinted_name(path, get_file_hash(os.path.join(STATIC_DIR, path)))
+        for path in get_static_files()
+    }
+
+
+def build_static_manifest() -> dict[str, str]:
+    """Writes the static file fingerprints to the static manifest."""
+    manifest = get_static_fingerprints()
+    with open(STATIC_MANIFEST, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    logger.info(f"Fingerprinted {len(manifest)} static files")
+    return manifest
+
+
+class StaticManifest:
+    """Maps static files to fingerprinted names and back.
+
+    Uses the committed manifest, rebuilt with the bundles, so deployments
+    without a build step do not hash every file at startup. Without it the
+    files are hashed, so a fingerprint always matches the content it is served with.
+    """
+
+    def __init__(self, fingerprints: dict[str, str]):
+        self.fingerprints = fingerprints
+        self.originals = {name: path for path, name in fingerprints.items()}
+        # Changes with any static file, for caches of pages linking to them
+        self.version = hashlib.sha1(json.dumps(fingerprints, sort_keys=True).encode()).hexdigest()[:12]
+
+    @classmethod
+    def load(cls, rebuild: bool = False) -> 'StaticManifest':
+        if not rebuild:
+            try:
+                with open(STATIC_MANIFEST) as file:
+                    return cls(json.load(file))
+            except (OSError, ValueError):
+                pass
+        return cls(get_static_fingerprints())
+
+    def get_fingerprinted(self, path: str) -> str:
+        """Returns the fingerprinted name, or the path when it is unknown."""
+        return self.fingerprints.get(path, path)
+
+    def get_original(self, name: str) -> str | None:
+        """Returns the file a fingerprinted name points to, None otherwise."""
+        return self.originals.get(name)
+
+
+def get_image_sources(path: str, url_for) -> list[dict[str, str]]:
+    """Returns <source> type/srcset pairs for a static image, best format first."""
+    entry = load_image_manifest().get(path)
+    if not entry:
+        return []
+    return [
+        {
+            "type": entry["types"][format_name],
+            "srcset": ", ".join(
+                f"{url_for('static', filename=variant['path'])} {variant['width']}w"
+                for variant in variants
+            ),
+        }
+        for format_name, variants in entry["variants"].items()
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build static asset variants")
+    parser.add_argument("steps", nargs="*", help="Build steps to run (images, bundles, static, compress, templates), defaults to all")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the CPU count")
+    parser.add_argument("--force", action="store_true", default=False, help="Rebuild unchanged inputs")
+    args = parser.parse_args()
+    steps = args.steps or ["images", "bundles", "static", "compress", "templates"]
+    unknown = set(steps) - {"images", "bundles", "static", "compress", "templates"}
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(sorted(unknown))}")
+
+    if "images" in steps:
+        build_image_variants(args.workers, args.force)
+    if "bundles" in steps:
+        build_bundles()
+    # After the generated files, so the fingerprints include them
+    if "static" in steps:
+        build_static_manifest()
+    if "compress" in steps:
+        compress_static_files(STATIC_DIR)
+    if "templates" in steps:
+        from app import get_app, precompile_templates
+
+        compiled = precompile_templates(get_app())
+        logger.info(f"Compiled {compiled} templates")
@@ -0,0 +1,187 @@
+import os
+import re
+
+from typing import Final
+
+from utils.logger import logger
+
+
+STATIC_DIR: Final = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+TEMPLATES_DIR: Final = os.path.join(os.path.dirname(STATIC_DIR), "templates")
+BUNDLES_DIR: Final = "bundles"
+DEFAULT_BUNDLE: Final = "landing"
+
+BASE_CSS: Final = [
+    "css/reset.css",
+    "css/settings.css",
+    "css/styles.css",
+    "css/base.css",
+    "css/landing/landing.css",
+]
+PAGE_CSS: Final = BASE_CSS + ["css/navigation.css"]
+PAGE_TEMPLATES: Final = ["base.html", "navigation.html"]
+# name: files of one page type, templates are scanned for the critical CSS
+BUNDLES: Final = {
+    "landing": {
+        "css": BASE_CSS,
+        "js": ["js/base.js", "js/landing.js"],
+        "templates": ["base.html", "landing/landing.html"],
+    },
+    "home": {
+        "css": PAGE_CSS + ["css/home/home.css"],
+        "js": ["js/base.js"],
+        "templates": PAGE_TEMPLATES + ["home/home.html"],
+    },
+    "graph": {
+        "css": PAGE_CSS + ["css/home/graph.css"],
+        "js": ["js/base.js"],
+        "templates": PAGE_TEMPLATES + ["home/graph.html"],
+    },
+    "requests": {
+        "css": PAGE_CSS + ["css/admin/requests.css"],
+        "js": ["js/base.js", "js/requests.js"],
+        "templates": PAGE_TEMPLATES + ["admin/requests.html"],
+    },
+    "add_user": {
+        "css": PAGE_CSS + ["css/admin/add_user.css"],
+        "js": ["js/base.js", "js/add_user.js"],
+        "templates": PAGE_TEMPLATES + ["admin/add_user.html"],
+    },
+}
+# Rendered by WTForms macros, so not literally in the templates
+FORM_TAGS: Final = {"input", "label", "button", "form"}
+ALWAYS_TOKENS: Final = {"*", "html", "body", ":root"}
+
+
+def minify_css(css: str) -> str:
+    """Removes comments and whitespace that do not change the stylesheet."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js: str) -> str:
+    """Removes full-line comments, indentation and blank lines. Deliberately
+    conservative, so no code inside strings or regexes is ever touched."""
+    lines = (line.strip() for line in js.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def split_rules(css: str) -> list[tuple[str, str]]:
+    """Splits minified CSS in top-level (prelude, body) pairs."""
+    rules = []
+    depth = 0
+    prelude_start = body_start = 0
+    for position, char in enumerate(css):
+        if char == "{":
+            if depth == 0:
+                body_start = position + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                prelude = css[prelude_start:css.index("{", prelude_start)]
+                rules.append((prelude.strip(), css[body_start:position]))
+                prelude_start = position + 1
+    return rules
+
+
+def get_template_tokens(templates: list[str]) -> set[str]:
+    """Gets the tags, classes and ids used in templates."""
+    tokens = set(ALWAYS_TOKENS) | FORM_TAGS
+    for template in templates:
+        with open(os.path.join(TEMPLATES_DIR, template)) as file:
+            markup = file.read()
+        tokens.update(tag.lower() for tag in re.findall(r"<([a-zA-Z][\w-]*)", markup))
+        for names in re.findall(r'class="([^"]*)"', markup):
+            tokens.update(f".{name}" for name in re.findall(r"[\w-]+", names))
+        for names in re.findall(r'id="([^"]*)"', markup):
+            tokens.update(f"#{name}" for name in re.findall(r"[\w-]+", names))
+    return tokens
+
+
+def selector_matches(selector: str, tokens: set[str]) -> bool:
+    """Returns whether every tag, class and id in a selector is used."""
+    selector = re.sub(r"::?[\w-]+(\([^)]*\))?", "", selector)
+    selector = re.sub(r"\[[^\]]*\]", "", selector)
+    for part in re.split(r"[\s>+~]+", selector):
+        if not part or part == "*":
+            continue
+        tag = re.match(r"[a-zA-Z][\w-]*", part)
+        if tag and tag.group().lower() not in tokens:
+            return False
+        if any(name not in tokens for name in re.findall(r"[.#][\w-]+", part)):
+            return False
+    return True
+
+
+def extract_critical_css(css: str, tokens: set[str]) -> str:
+    """Keeps the rules of a minified stylesheet that apply to the given tokens,
+    including fonts, custom properties and matching media query rules."""
+    critical = []
+    for prelude, body in split_rules(css):
+        if prelude.startswith(("@media", "@supports")):
+            inner = extract_critical_css(body, tokens)
+            if inner:
+                critical.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@font-face"):
+            critical.append(f"{prelude}{{{body}}}")
+        elif prelude.startswith("@"):
+            continue
+        elif any(selector_matches(selector, tokens) for selector in prelude.split(",")):
+            critical.append(f"{prelude}{{{body}}}")
+    return "".join(critical)
+
+
+def get_bundle_path(name: str, extension: str) -> str:
+    """Gets the bundle path relative to the static folder."""
+    return f"{BUNDLES_DIR}/{name}.{extension}"
+
+
+def _read_static(path: str) -> str:
+    with open(os.path.join(STATIC_DIR, path)) as file:
+        return file.read()
+
+
+def _write_if_changed(path: str, content: str) -> bool:
+    """Writes a file unless it already holds content, keeping its mtime stable."""
+    full_path = os.path.join(STATIC_DIR, path)
+    try:
+        with open(full_path) as file:
+            if file.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(full_path, "w") as file:
+        file.write(content)
+    return True
+
+
+def build_bundles() -> int:
+    """Writes one minified CSS and one JS bundle per page type. Each script is
+    wrapped in its own function scope, as it was in its own <script> before.
+    Returns the number of bundles that changed."""
+    os.makedirs(os.path.join(STATIC_DIR, BUNDLES_DIR), exist_ok=True)
+    changed = 0
+    for name, bundle in BUNDLES.items():
+        css = "".join(minify_css(_read_static(path)) for path in bundle["css"])
+        js = "\n".join(f"(() => {{\n{minify_js(_read_static(path))}\n}})();" for path in bundle["js"])
+        changed += _write_if_changed(get_bundle_path(name, "css"), css)
+        changed += _write_if_changed(get_bundle_path(name, "js"), js + "\n")
+
+    logger.info(f"Built {len(BUNDLES)} bundles, {changed} files changed")
+    return changed
+
+
+_critical_css: dict[str, str] = {}
+
+
+def get_critical_css(name: str) -> str:
+    """Gets the CSS to inline for a page type, from its built bundle."""
+    if name not in _critical_css:
+        bundle = BUNDLES.get(name, BUNDLES[DEFAULT_BUNDLE])
+        css = _read_static(get_bundle_path(name if name in BUNDLES else DEFAULT_BUNDLE, "css"))
+        _critical_css[name] = extract_critical_css(css, get_template_tokens(bundle["templates"]))
+    return _critical_css[name]
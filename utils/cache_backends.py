@@ -0,0 +1,135 @@
+import json
+
+from flask_caching.backends.base import BaseCache
+from typing import Any, Final
+
+from utils.logger import logger
+from utils.metrics import get_cache_samples
+from utils.ttl_cache import MISSING, TTLCache
+
+
+CACHE_PREFIX: Final = "cache_"
+
+
+class UpstashTieredCache(BaseCache):
+    """Flask-Caching backend with an in-process LRU tier in front of Upstash Redis.
+
+    Reads try the local tier first and fill it from Redis, writes go to both.
+    Values are stored in Redis as JSON. Without Redis only the local tier is used.
+    Local entries live at most local_timeout seconds, so deletes and clears in
+    other workers are picked up within that time. redis may be a callable that
+    returns the client, it is then resolved on first use.
+    """
+
+    def __init__(self, redis=None, threshold: int = 500, local_timeout: int = 60,
+                 default_timeout: int = 300, key_prefix: str = CACHE_PREFIX):
+        super().__init__(default_timeout=default_timeout)
+        self._redis = redis
+        self.local = TTLCache(maxsize=threshold)
+        self.local_timeout = local_timeout
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        from utils.upstash import upstash
+
+        kwargs.update(
+            redis=lambda: upstash.redis,
+            threshold=config["CACHE_THRESHOLD"],
+            local_timeout=config.get("CACHE_LOCAL_TIMEOUT", 60),
+            key_prefix=config.get("CACHE_KEY_PREFIX") or CACHE_PREFIX,
+        )
+        return cls(*args, **kwargs)
+
+    @property
+    def redis(self):
+        if callable(self._redis):
+            self._redis = self._redis()
+        return self._redis
+
+    def _get_local_timeout(self, timeout: int | None) -> int:
+        timeout = self._normalize_timeout(timeout)
+        return min(timeout, self.local_timeout) if timeout else self.local_timeout
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+        if self.redis is None:
+            return None
+
+        try:
+            raw_value = self.redis.get(self.key_prefix + key)
+        except Exception as e:
+            logger.error(f"Failed to read cache key {key}: {e}")
+            return None
+        if raw_value is None:
+            return None
+
+        value = json.loads(raw_value)
+        self.local.set(key, value, ttl=self.local_timeout)
+        return value
+
+    def set(self, key: str, value: Any, timeout: int | None = None) -> bool:
+        self.local.set(key, value, ttl=self._get_local_timeout(timeout))
+        if self.redis is None:
+            return True
+
+        timeout = self._normalize_timeout(timeout)
+        try:
+            self.redis.set(self.key_prefix + key, json.dumps(value), ex=timeout or None)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write cache key {key}: {e}")
+            return False
+
+    def add(self, key: str, value: Any, timeout: int | None = None) -> bool:
+        if self.redis is None:
+            if self.local.get(key) is not MISSING:
+                return False
+            return self.set(key, value, timeout)
+
+        timeout = self._normalize_timeout(timeout)
+        try:
+            added = self.redis.set(self.key_prefix + key, json.dumps(value), ex=timeout or None, nx=True)
+        except Exception as e:
+            logger.error(f"Failed to add cache key {key}: {e}")
+            return False
+        if added:
+            self.local.set(key, value, ttl=self._get_local_timeout(timeout))
+        return bool(added)
+
+    def delete(self, key: str) -> bool:
+        self.local.delete(key)
+        if self.redis is None:
+            return True
+        try:
+            return bool(self.redis.delete(self.key_prefix + key))
+        except Exception as e:
+            logger.error(f"Failed to delete cache key {key}: {e}")
+            return False
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def clear(self) -> bool:
+        self.local.clear()
+        if self.redis is None:
+            return True
+        try:
+            keys = self.redis.keys(f"{self.key_prefix}*")
+            if keys:
+                self.redis.delete(*keys)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to clear cache: {e}")
+            return False
+
+    def get_metric_samples(self) -> list[tuple[str, dict[str, str], Any]]:
+        return get_cache_samples("page", self.local)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "shared": self.redis is not None,
+            "local": self.local.get_stats(),
+        }
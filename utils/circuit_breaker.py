@@ -0,0 +1,89 @@
+import threading
+import time
+
+from typing import Any, Final
+
+from utils.logger import logger
+
+
+CLOSED: Final = "closed"
+OPEN: Final = "open"
+HALF_OPEN: Final = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency for a while, so callers fall back at
+    once instead of waiting for a timeout on every request.
+
+    Closed: calls go through, failure_threshold failures in a row open it.
+    Open: calls fail fast, after recovery_timeout seconds it turns half-open.
+    Half-open: up to half_open_calls trial calls go through, a success closes
+    it and a failure opens it again. Trials that never report back are given
+    up on after another recovery_timeout, so the breaker cannot stay stuck.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_calls = 0
+        self.trials_started_at = 0.0
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Returns whether a call may go through, counts trial calls when half-open."""
+        with self.lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+                self.trial_calls = 0
+                self.trials_started_at = now
+            elif (self.state == HALF_OPEN and self.trial_calls >= self.half_open_calls
+                    and now - self.trials_started_at >= self.recovery_timeout):
+                self.trial_calls = 0
+                self.trials_started_at = now
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.trial_calls < self.half_open_calls:
+                self.trial_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit of {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit of {self.name} opened after {self.failures} failures")
+                    self.opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def get_status(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,97 @@
+import gzip
+import os
+import zlib
+
+from typing import Final, Iterable, Iterator
+
+from utils.logger import logger
+
+try:
+    import brotli
+except ImportError:  # Optional, responses fall back to gzip
+    brotli = None
+
+
+# Best compression first, only encodings that can be produced here
+ENCODINGS: Final = ("br", "gzip") if brotli else ("gzip",)
+# encoding: suffix of the precompressed sibling file
+SUFFIXES: Final = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_TYPES: Final = (
+    "text/", "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+COMPRESSIBLE_EXTENSIONS: Final = (".css", ".js", ".json", ".html", ".svg", ".txt", ".xml")
+GZIP_LEVEL: Final = 9
+BROTLI_QUALITY: Final = 11
+
+
+def is_compressible(content_type: str) -> bool:
+    return any(content_type.startswith(typ) for typ in COMPRESSIBLE_TYPES)
+
+
+def get_accepted_encoding(accept_encodings) -> str | None:
+    """Returns the best encoding the client accepts, None for identity."""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str, level: int = GZIP_LEVEL) -> bytes:
+    """Compresses data at once. gzip output has no timestamp, so equal
+    input always gives equal output and ETags stay stable."""
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level, BROTLI_QUALITY))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    """Compresses a streamed body chunk by chunk, flushing after each chunk
+    so the client can start rendering before the stream ends."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=min(level, BROTLI_QUALITY))
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_static_files(static_dir: str) -> int:
+    """Writes .gz and, with brotli installed, .br siblings of the static text
+    files, skipping siblings newer than their file. Returns the number written."""
+    written = 0
+    for directory, _, filenames in os.walk(static_dir):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            for encoding in ENCODINGS:
+                sibling = path + SUFFIXES[encoding]
+                if os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path):
+                    continue
+                compressed = compress(data, encoding, BROTLI_QUALITY if encoding == "br" else GZIP_LEVEL)
+                # Not worth a sibling when it does not save anything
+                if len(compressed) >= len(data):
+                    continue
+                with open(sibling, "wb") as file:
+                    file.write(compressed)
+                written += 1
+
+    logger.info(f"Wrote {written} compressed static files ({', '.join(ENCODINGS)})")
+    return written
+
+
+def get_precompressed_path(static_dir: str, filename: str, encoding: str) -> str | None:
+    """Returns the precompressed sibling of a static file when it is up to date."""
+    sibling = filename + SUFFIXES[encoding]
+    sibling_path = os.path.join(static_dir, sibling)
+    try:
+        if os.path.getmtime(sibling_path) >= os.path.getmtime(os.path.join(static_dir, filename)):
+            return sibling
+    except OSError:
+        pass
+    return None
@@ -1,22 +1,69 @@
+import os
+
 from dataclasses import dataclass
 
 
 @dataclass
 class Server:
-    # Limiter
-    LIMITER_STORAGE_URI: str = "memory://"
-    LIMITER_DEFAULT_LIMITS: list[str] = None
+    # Limiter, per route and client: route: (requests, window in seconds)
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+    RATE_LIMITS: dict[str, tuple[int, int]] = None
+    RATE_LIMIT_SYNC_INTERVAL: float = 1.0
+    # Clients past this share of their limit are synced with Redis on every request
+    RATE_LIMIT_SYNC_RATIO: float = 0.5
+    RATE_LIMIT_MAX_CLIENTS: int = 10_000
+    # Proxies in front of the app, only the X-Forwarded-For entries they added are trusted
+    PROXY_HOPS: int = int(os.getenv("PROXY_HOPS", 1))
+    # Share of the limit from which geolocation and then tracking are skipped
+    SHED_GEOLOCATION_RATIO: float = 0.5
+    SHED_TRACKING_RATIO: float = 0.8
     # Cache
-    CACHE_TYPE: str = "SimpleCache"
+    CACHE_TYPE: str = "utils.cache_backends.UpstashTieredCache"
     CACHE_DEFAULT_TIMEOUT: int = 300
+    CACHE_THRESHOLD: int = 500
+    CACHE_LOCAL_TIMEOUT: int = 60
+    PAGE_CACHE_DURATION: int = int(os.getenv("PAGE_CACHE_DURATION", 3600))
     STATIC_CACHE_DURATION = 3600 * 24 * 7
+    # Fingerprinted static files never change under the same URL
+    IMMUTABLE_CACHE_DURATION = 3600 * 24 * 365
     API_CACHE_DURATION = 3600
+    # Compression of dynamic responses, static files use precompressed siblings
+    COMPRESS_DYNAMIC: bool = os.getenv("COMPRESS_DYNAMIC", "True") == "True"
+    COMPRESS_MIN_BYTES: int = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+    COMPRESS_LEVEL: int = 6
+    COMPRESS_STATIC_CACHE_SIZE: int = 128
+    # Startup, skips rebuilding bundles and the static manifest and uses the built ones
+    FAST_STARTUP: bool = os.getenv(
+        "FAST_STARTUP", "True" if os.getenv("VERCEL") else "False"
+    ) == "True"
+    # Compiled templates, shared by workers and kept across restarts
+    TEMPLATE_CACHE_DIR: str | None = os.getenv("TEMPLATE_CACHE_DIR", os.path.join("/tmp", "tracking-templates"))
+    # Stage timing, share of requests (and background stages) that are timed
+    TIMING_SAMPLE_RATE: float = float(os.getenv(
+        "TIMING_SAMPLE_RATE", "0.05" if os.getenv("DEBUG") == "False" else "1"
+    ))
+    # Stage durations in a Server-Timing header, not sent in production unless enabled
+    SERVER_TIMING_HEADER: bool = os.getenv(
+        "SERVER_TIMING_HEADER", "False" if os.getenv("DEBUG") == "False" else "True"
+    ) == "True"
+    # Sampled requests slower than this are logged with their stages
+    TIMING_LOG_THRESHOLD_MS: float = float(os.getenv("TIMING_LOG_THRESHOLD_MS", 250))
+    # Metrics, workers write snapshots to METRICS_DIR that /metrics merges
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True") == "True"
+    METRICS_DIR: str | None = os.getenv("METRICS_DIR", os.path.join("/tmp", "tracking-metrics"))
+    METRICS_WRITE_INTERVAL: float = float(os.getenv("METRICS_WRITE_INTERVAL", 10))
+    # Bearer token for scrapers, without it /metrics needs a logged in user
+    METRICS_TOKEN: str | None = os.getenv("METRICS_TOKEN")
     # Security headers
     SECURITY_HEADERS: dict[str, str] = None
 
     def __post_init__(self):
-        if self.LIMITER_DEFAULT_LIMITS is None:
-            self.LIMITER_DEFAULT_LIMITS = ["300 per day", "100 per hour", "20 per minute"]
+        if self.RATE_LIMITS is None:
+            self.RATE_LIMITS = {
+                "default": (20, 60),
+                "graph_image": (60, 60),
+                "requests_data": (60, 60),
+            }
         
         if self.SECURITY_HEADERS is None:
             self.SECURITY_HEADERS = {
@@ -66,14 +113,92 @@ class Server:
     }
 
 
+@dataclass
+class Tracking:
+    # Ingest
+    ASYNC_INGEST: bool = os.getenv(
+        "TRACKING_ASYNC_INGEST", "False" if os.getenv("VERCEL") else "True"
+    ) == "True"
+    INGEST_QUEUE_SIZE: int = int(os.getenv("TRACKING_INGEST_QUEUE_SIZE", 1000))
+    INGEST_WORKERS: int = int(os.getenv("TRACKING_INGEST_WORKERS", 2))
+    # Enrich on an event loop with async HTTP clients instead of worker threads
+    ASYNC_MODE: bool = os.getenv("TRACKING_ASYNC_MODE", "False") == "True"
+    INGEST_CONCURRENCY: int = int(os.getenv("TRACKING_INGEST_CONCURRENCY", 50))
+    INGEST_SHUTDOWN_TIMEOUT: float = 5.0
+    # Geolocation
+    GEO_CACHE_SIZE: int = int(os.getenv("TRACKING_GEO_CACHE_SIZE", 10_000))
+    GEO_CACHE_SHARED: bool = os.getenv("TRACKING_GEO_CACHE_SHARED", "True") == "True"
+    GEO_DB_PATH: str | None = os.getenv("TRACKING_GEO_DB_PATH")
+    GEO_HTTP_FALLBACK: bool = os.getenv("TRACKING_GEO_HTTP_FALLBACK", "True") == "True"
+    GEO_API_URL: str = os.getenv("TRACKING_GEO_API_URL", "http://ip-api.com/json")
+    # Storage
+    WRITE_BUFFER_SIZE: int = int(os.getenv(
+        "TRACKING_WRITE_BUFFER_SIZE", 1 if os.getenv("VERCEL") else 25
+    ))
+    WRITE_FLUSH_INTERVAL: float = float(os.getenv("TRACKING_WRITE_FLUSH_INTERVAL", 5))
+    MEMORY_CAPACITY: int = int(os.getenv("TRACKING_MEMORY_CAPACITY", 20_000))
+    # Entries that failed to reach Redis, sent with the first flush that succeeds
+    REPLAY_CAPACITY: int = int(os.getenv("TRACKING_REPLAY_CAPACITY", 5000))
+    LOG_DIR: str | None = os.getenv("TRACKING_LOG_DIR")
+    LOG_ROTATE_BYTES: int = int(os.getenv("TRACKING_LOG_ROTATE_BYTES", 16 * 1024 * 1024))
+    LOG_MAX_SEGMENTS: int = int(os.getenv("TRACKING_LOG_MAX_SEGMENTS", 30))
+    # Seconds before buffered log lines are visible to the other workers
+    LOG_FLUSH_INTERVAL: float = float(os.getenv("TRACKING_LOG_FLUSH_INTERVAL", 1))
+    # User agents
+    UA_CACHE_SIZE: int = int(os.getenv("TRACKING_UA_CACHE_SIZE", 2000))
+    UA_CACHE_DURATION: int | None = None
+
+
+@dataclass
+class Http:
+    # Shared per-process pool, used for geolocation and Upstash REST calls
+    MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+    MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+    KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+    # Used when the h2 package is installed
+    HTTP2: bool = os.getenv("HTTP_HTTP2", "True") == "True"
+    CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2))
+    READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", 5))
+    POOL_TIMEOUT: float = 2.0
+    # Retries with exponential backoff and full jitter
+    RETRIES: int = int(os.getenv("HTTP_RETRIES", 2))
+    RETRY_BACKOFF: float = 0.1
+    RETRY_BACKOFF_MAX: float = 1.0
+    # Circuit breaker per host: failures in a row before failing fast, seconds until a trial call
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("HTTP_BREAKER_FAILURE_THRESHOLD", 5))
+    BREAKER_RECOVERY_TIMEOUT: float = float(os.getenv("HTTP_BREAKER_RECOVERY_TIMEOUT", 30))
+    BREAKER_HALF_OPEN_CALLS: int = 1
+
+
+@dataclass
+class Graphs:
+    YEAR: int = 2025
+    CACHE_DIR: str = os.getenv("GRAPHS_CACHE_DIR", os.path.join("/tmp", "tracking-graphs"))
+    MEMORY_CACHE_SIZE: int = 32
+    DISK_CACHE_SIZE: int = 256
+    CACHE_DURATION: int = 3600
+    # Per-user measurements, in Redis or else in MEASUREMENTS_DIR
+    MEASUREMENTS_DIR: str = os.getenv("GRAPHS_MEASUREMENTS_DIR", os.path.join("data", "measurements"))
+    # Seconds other workers may serve a series from memory after an import
+    MEASUREMENTS_LOCAL_TIMEOUT: int = 60
+    MEASUREMENTS_CACHE_SIZE: int = 256
+    ROLLING_WINDOW: int = 7
+    # Daily intake the calorie balance is counted against
+    CALORIE_TARGET: int = int(os.getenv("GRAPHS_CALORIE_TARGET", 2500))
+
+
 @dataclass
 class Routes:
     landing: str = "/"
     home: str = "/home"
     weight: str = "/weight"
     calories: str = "/calories"
+    graph_image: str = "/graphs/<metric>/<period>/<size>.png"
     requests: str = "/admin/requests"
+    requests_data: str = "/admin/requests/data"
+    requests_summary: str = "/admin/requests/summary"
     add_user: str = "/admin/add-user"
+    metrics: str = "/metrics"
 
 
 @dataclass
@@ -93,13 +218,20 @@ class Redirects:
     home: str = "home.home"
     weight: str = "home.weight"
     calories: str = "home.calories"
+    graph_image: str = "home.graph_image"
     requests: str = "admin.requests"
+    requests_data: str = "admin.requests_data"
+    requests_summary: str = "admin.requests_summary"
     add_user: str = "admin.add_user"
+    metrics: str = "admin.metrics"
 
 
 @dataclass
 class Config:
     server: Server = None
+    tracking: Tracking = None
+    http: Http = None
+    graphs: Graphs = None
     route: Routes = None
     template: Templates = None
     redirect: Redirects = None
@@ -107,6 +239,12 @@ class Config:
     def __post_init__(self):
         if self.server is None:
             self.server = Server()
+        if self.tracking is None:
+            self.tracking = Tracking()
+        if self.http is None:
+            self.http = Http()
+        if self.graphs is None:
+            self.graphs = Graphs()
         if self.route is None:
             self.route = Routes()
         if self.template is None:
@@ -1,28 +1,24 @@
-from flask import Flask
 from flask_caching import Cache
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from utils.logger import logger
 
 from utils.config import CFG
+from utils.rate_limit import SlidingWindowLimiter
 
 
-limiter_: Limiter | None = None
-def get_limiter(app: Flask) -> Limiter:
+limiter_: SlidingWindowLimiter | None = None
+def get_limiter() -> SlidingWindowLimiter:
     global limiter_
-    try:
-        if limiter_ is None:
-            limiter_ = Limiter(
-                get_remote_address,
-                app=app,
-                default_limits=CFG.server.LIMITER_DEFAULT_LIMITS,
-                storage_uri=CFG.server.LIMITER_STORAGE_URI,
-            )
-        return limiter_
-    
-    except Exception as e:
-        logger.error(f"Failed to initialize limiter: {e}")
-        raise
+    if limiter_ is None:
+        from utils.upstash import upstash
+
+        limiter_ = SlidingWindowLimiter(
+            upstash.redis,
+            limits=CFG.server.RATE_LIMITS,
+            sync_interval=CFG.server.RATE_LIMIT_SYNC_INTERVAL,
+            sync_ratio=CFG.server.RATE_LIMIT_SYNC_RATIO,
+            max_keys=CFG.server.RATE_LIMIT_MAX_CLIENTS,
+            shed_ratios=(CFG.server.SHED_GEOLOCATION_RATIO, CFG.server.SHED_TRACKING_RATIO),
+        )
+    return limiter_
 
 
 cache_: Cache | None = None
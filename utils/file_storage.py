@@ -0,0 +1,283 @@
+import glob
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Final
+
+
+SEGMENT_PREFIX: Final = "requests-"
+SEGMENT_SUFFIX: Final = ".jsonl"
+INDEX_SUFFIX: Final = ".idx"
+# Sidecar index entry: byte offset of the line, epoch of the entry
+INDEX_ENTRY: Final = struct.Struct("<Qd")
+WRITE_BUFFER_BYTES: Final = 64 * 1024
+
+
+class SegmentIndex:
+    """Offsets and epochs of one segment, read incrementally from its sidecar.
+
+    Concurrent writers append entries slightly out of epoch order, so the
+    positions are also kept sorted by epoch in order and sorted_epochs.
+    """
+
+    def __init__(self):
+        self.offsets = array("Q")
+        self.epochs = array("d")
+        self.order = array("Q")
+        self.sorted_epochs = array("d")
+        self.index_size = 0
+
+    def refresh(self, index_path: str) -> None:
+        """Parses index entries appended since the last refresh."""
+        size = os.path.getsize(index_path)
+        size -= size % INDEX_ENTRY.size
+        if size <= self.index_size:
+            return
+
+        first = len(self.offsets)
+        with open(index_path, "rb") as file:
+            file.seek(self.index_size)
+            for offset, epoch in INDEX_ENTRY.iter_unpack(file.read(size - self.index_size)):
+                self.offsets.append(offset)
+                self.epochs.append(epoch)
+        self.index_size = size
+        self._sort_from(first)
+
+    def _sort_from(self, first: int) -> None:
+        """Adds positions from first on to the sorted order, re-sorting only
+        the tail of the order the earliest new epoch falls into."""
+        new = sorted(range(first, len(self.epochs)), key=self.epochs.__getitem__)
+        split = bisect_right(self.sorted_epochs, self.epochs[new[0]])
+        tail = sorted([*self.order[split:], *new], key=self.epochs.__getitem__)
+        del self.order[split:]
+        del self.sorted_epochs[split:]
+        self.order.extend(tail)
+        self.sorted_epochs.extend(self.epochs[position] for position in tail)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+class RequestLogFile:
+    """Append-only JSONL request log, split in per-process rotating segments.
+
+    Each segment has a sidecar index of (offset, epoch) entries, so reads of the
+    latest entries or a time range only parse the lines they return, via mmap.
+    """
+
+    def __init__(self, directory: str, rotate_bytes: int, max_segments: int, flush_interval: float = 1.0):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.indexes: dict[str, SegmentIndex] = {}
+        self.pid: int | None = None
+        self.flusher_pid: int | None = None
+        self.segment_path: str | None = None
+        self.segment_date: str | None = None
+        self.segment_file = None
+        self.index_file = None
+        self.segment_size = 0
+        os.makedirs(directory, exist_ok=True)
+        # Empty the write buffers before forking, so children never write them again
+        os.register_at_fork(before=self.flush)
+
+    def append(self, data: dict[str, Any]) -> None:
+        """Appends an entry through the buffered segment writer."""
+        line = (json.dumps(data, separators=(",", ":")) + "\n").encode()
+        epoch = data.get("epoch", time.time())
+        self._ensure_flusher()
+        with self.lock:
+            self._ensure_segment(epoch)
+            self.index_file.write(INDEX_ENTRY.pack(self.segment_size, epoch))
+            self.segment_file.write(line)
+            self.segment_size += len(line)
+
+    def flush(self) -> None:
+        """Writes buffered lines to disk, lines before their index entries."""
+        with self.lock:
+            if self.segment_file is not None:
+                self.segment_file.flush()
+                self.index_file.flush()
+
+    def close(self) -> None:
+        """Flushes and closes the current segment."""
+        with self.lock:
+            self._close_segment()
+
+    def latest(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]]:
+        """Gets entries newest first, skipping offset entries."""
+        stop = offset + limit if limit else None
+        return self._read_merged(islice(self._iter_merged(None, None), offset, stop))
+
+    def between(self, before: float | None, since: float | None, count: int) -> list[dict[str, Any]]:
+        """Gets up to count entries with since <= epoch < before, newest first."""
+        return self._read_merged(islice(self._iter_merged(before, since), count))
+
+    def clear(self) -> None:
+        """Deletes all segments."""
+        with self.lock:
+            self._close_segment()
+            for path in self._get_segment_paths():
+                self._remove_segment(path)
+
+    def get_status(self) -> dict[str, Any]:
+        """Gets segment count and size on disk."""
+        paths = self._get_segment_paths()
+        return {
+            "directory": self.directory,
+            "segments": len(paths),
+            "bytes": sum(os.path.getsize(path) for path in paths),
+        }
+
+    def _ensure_segment(self, epoch: float) -> None:
+        """Opens a new segment per process, per day and when the current one is full."""
+        date = datetime.fromtimestamp(epoch).strftime("%Y%m%d")
+        if (self.segment_file is not None
+                and self.pid == os.getpid()
+                and self.segment_date == date
+                and self.segment_size < self.rotate_bytes):
+            return
+
+        if self.pid == os.getpid():
+            self._close_segment()
+        self.pid = os.getpid()
+        self.segment_date = date
+        existing = glob.glob(self._get_segment_path(date, "*"))
+        sequence = max((int(path[-len(SEGMENT_SUFFIX) - 4:-len(SEGMENT_SUFFIX)]) for path in existing), default=0)
+        self.segment_path = self._get_segment_path(date, f"{sequence:04d}")
+        if os.path.exists(self.segment_path) and os.path.getsize(self.segment_path) >= self.rotate_bytes:
+            self.segment_path = self._get_segment_path(date, f"{sequence + 1:04d}")
+        self.segment_file = open(self.segment_path, "ab", buffering=WRITE_BUFFER_BYTES)
+        self.index_file = open(self._get_index_path(self.segment_path), "ab", buffering=WRITE_BUFFER_BYTES)
+        self.segment_size = self.segment_file.tell()
+        self._remove_old_segments()
+
+    def _ensure_flusher(self) -> None:
+        """Starts the interval flush thread, once per process."""
+        if self.flusher_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_periodically, name="request-log-flusher", daemon=True).start()
+
+    def _flush_periodically(self) -> None:
+        """Makes buffered lines readable by other workers within flush_interval seconds."""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _close_segment(self) -> None:
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.index_file.close()
+        self.segment_file = None
+        self.index_file = None
+
+    def _remove_old_segments(self) -> None:
+        """Keeps the newest max_segments segments. Segments of other processes
+        from today may still be open, so only earlier days of those are removed."""
+        paths = self._get_segment_paths()
+        for path in paths[:-max(1, self.max_segments)]:
+            date, pid = self._parse_segment_path(path)
+            if path != self.segment_path and (pid == self.pid or date != self.segment_date):
+                self._remove_segment(path)
+
+    def _remove_segment(self, path: str) -> None:
+        for file_path in (path, self._get_index_path(path)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.indexes.pop(path, None)
+
+    def _get_segment_paths(self) -> list[str]:
+        """Gets segment paths, oldest first."""
+        paths = glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+        return sorted(paths, key=os.path.getmtime)
+
+    def _iter_indexes(self):
+        """Yields (path, index) per non-empty segment, in path order."""
+        self.flush()
+        for path in sorted(self._get_segment_paths()):
+            index = self.indexes.setdefault(path, SegmentIndex())
+            index_path = self._get_index_path(path)
+            if os.path.exists(index_path):
+                index.refresh(index_path)
+            if len(index):
+                yield path, index
+
+    def _iter_merged(self, before: float | None, since: float | None):
+        """Yields (epoch, path, index, position) of entries with since <= epoch < before,
+        newest first, as a k-way merge of the segments by epoch."""
+        segments = []
+        for path, index in self._iter_indexes():
+            stop = bisect_left(index.sorted_epochs, before) if before is not None else len(index)
+            start = bisect_left(index.sorted_epochs, since) if since is not None else 0
+            segments.append(self._iter_segment(path, index, start, stop))
+        return heapq.merge(*segments, key=itemgetter(0), reverse=True)
+
+    @staticmethod
+    def _iter_segment(path: str, index: SegmentIndex, start: int, stop: int):
+        """Yields the entries of one segment between sorted ranks start and stop, newest first."""
+        for rank in range(stop - 1, start - 1, -1):
+            yield index.sorted_epochs[rank], path, index, index.order[rank]
+
+    def _read_merged(self, entries) -> list[dict[str, Any]]:
+        """Reads merged entries with one mmap per segment, keeping their order."""
+        entries = list(entries)
+        positions: dict[str, list[int]] = {}
+        indexes: dict[str, SegmentIndex] = {}
+        for _, path, index, position in entries:
+            positions.setdefault(path, []).append(position)
+            indexes[path] = index
+
+        lines = {path: self._read_entries(path, indexes[path], segment_positions)
+                 for path, segment_positions in positions.items()}
+        return [lines[path][position] for _, path, _, position in entries if position in lines[path]]
+
+    @staticmethod
+    def _read_entries(path: str, index: SegmentIndex, positions) -> dict[int, dict[str, Any]]:
+        """Reads the lines at positions through one mmap, using the next offset
+        as the end of each line. Lines not fully written yet are skipped."""
+        data_by_position = {}
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return data_by_position
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for position in positions:
+                    start = index.offsets[position]
+                    if position + 1 < len(index):
+                        end = index.offsets[position + 1]
+                    else:
+                        end = mapped.find(b"\n", start) + 1
+                    line = mapped[start:end]
+                    if line.endswith(b"\n"):
+                        data_by_position[position] = json.loads(line)
+        return data_by_position
+
+    def _get_segment_path(self, date: str, sequence: str) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{date}-{self.pid}-{sequence}{SEGMENT_SUFFIX}")
+
+    @staticmethod
+    def _parse_segment_path(path: str) -> tuple[str, int]:
+        """Gets the date and pid of a requests-<date>-<pid>-<sequence> segment."""
+        _, date, pid, _ = os.path.basename(path).split("-")
+        return date, int(pid)
+
+    @staticmethod
+    def _get_index_path(path: str) -> str:
+        return path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
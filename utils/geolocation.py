@@ -0,0 +1,211 @@
+import csv
+import ipaddress
+import threading
+
+from array import array
+from bisect import bisect_right
+from typing import Final, Protocol
+
+from utils.config import CFG
+from utils.logger import logger
+
+
+# Highest address of each IP version
+MAX_ADDRESS: Final = {4: 2**32 - 1, 6: 2**128 - 1}
+# Dataset columns mapped to the ip-api.com response keys used by GeolocationData
+FIELD_MAP: Final = {
+    "country": "country",
+    "country_code": "countryCode",
+    "city": "city",
+    "region": "regionName",
+    "isp": "isp",
+    "timezone": "timezone",
+}
+
+
+class GeolocationBackend(Protocol):
+    def lookup(self, ip_address: str) -> dict[str, str] | None: ...
+
+
+class HttpGeolocationBackend:
+    """Looks up geolocation data through the ip-api.com HTTP API, over the
+    pooled per-process clients so lookups reuse kept-alive connections."""
+
+    def lookup(self, ip_address: str) -> dict[str, str] | None:
+        """Request geolocation data from API."""
+        from utils.http_client import get_http_client
+
+        try:
+            response = get_http_client().get(f"{CFG.tracking.GEO_API_URL}/{ip_address}")
+            response.raise_for_status()
+            data = response.json()
+            return data if data.get("status") == "success" else None
+
+        except Exception as e:
+            logger.error(f"Geolocation request failed for IP {ip_address}: {e}")
+            return None
+
+    async def lookup_async(self, ip_address: str) -> dict[str, str] | None:
+        """Request geolocation data from API without blocking the event loop."""
+        from utils.http_client import get_async_http_client
+
+        try:
+            response = await get_async_http_client().get(f"{CFG.tracking.GEO_API_URL}/{ip_address}")
+            response.raise_for_status()
+            data = response.json()
+            return data if data.get("status") == "success" else None
+
+        except Exception as e:
+            logger.error(f"Geolocation request failed for IP {ip_address}: {e}")
+            return None
+
+
+class IPRangeTable:
+    """Sorted, non-overlapping integer IP ranges searched with bisect."""
+
+    def __init__(self, starts: array | list[int], ends: array | list[int], rows: array):
+        self.starts = starts
+        self.ends = ends
+        self.rows = rows
+
+    @classmethod
+    def compile(cls, ranges: list[tuple[int, int, int]], typecode: str | None) -> 'IPRangeTable':
+        """Builds the table from (start, end, row) tuples, raises ValueError on
+        overlapping ranges. IPv6 values do not fit an array typecode and are
+        kept as int lists."""
+        ranges.sort()
+        for (_, previous_end, _), (start, end, _) in zip(ranges, ranges[1:]):
+            if start <= previous_end:
+                raise ValueError(f"Overlapping IP ranges: {start} starts at or before {previous_end}")
+        starts = [start for start, _, _ in ranges]
+        ends = [end for _, end, _ in ranges]
+        if typecode:
+            starts, ends = array(typecode, starts), array(typecode, ends)
+        return cls(starts, ends, array("I", [row for _, _, row in ranges]))
+
+    def find(self, value: int) -> int | None:
+        """Gets the row index of the range containing value."""
+        index = bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.rows[index]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class IPRangeDatabase:
+    """Local IP range → country/city/ISP dataset compiled for fast lookups."""
+
+    def __init__(self, ipv4: IPRangeTable, ipv6: IPRangeTable, rows: list[dict[str, str]]):
+        self.ipv4 = ipv4
+        self.ipv6 = ipv6
+        self.rows = rows
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'IPRangeDatabase':
+        """Loads a CSV with either start/end (IPs or integers) or network (CIDR)
+        columns, followed by any of the FIELD_MAP columns. Integer ranges take
+        their IP version from a version column, or else from their size.
+        Raises ValueError on invalid or overlapping ranges."""
+        ranges: dict[int, list[tuple[int, int, int]]] = {4: [], 6: []}
+        rows: list[dict[str, str]] = []
+        row_indexes: dict[tuple[str, ...], int] = {}
+
+        with open(path, newline="", encoding="utf-8") as file:
+            for line in csv.DictReader(file):
+                version, start, end = cls._parse_range(line)
+                row = tuple(line.get(column) or "Unknown" for column in FIELD_MAP)
+                if row not in row_indexes:
+                    row_indexes[row] = len(rows)
+                    rows.append(dict(zip(FIELD_MAP.values(), row)))
+                ranges[version].append((start, end, row_indexes[row]))
+
+        return cls(
+            ipv4=IPRangeTable.compile(ranges[4], "I"),
+            ipv6=IPRangeTable.compile(ranges[6], None),
+            rows=rows,
+        )
+
+    @staticmethod
+    def _parse_range(line: dict[str, str]) -> tuple[int, int, int]:
+        """Gets (version, start, end) from a dataset line."""
+        if line.get("network"):
+            network = ipaddress.ip_network(line["network"], strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+
+        start, end = line["start"].strip(), line["end"].strip()
+        if start.isdigit() and end.isdigit():
+            start, end = int(start), int(end)
+            if line.get("version"):
+                version = int(line["version"])
+                if version not in MAX_ADDRESS:
+                    raise ValueError(f"Invalid IP version: {line['version']}")
+            else:
+                # Without a version column, ranges within 32 bits are read as IPv4
+                version = 4 if end <= MAX_ADDRESS[4] else 6
+        else:
+            start_address, end_address = ipaddress.ip_address(start), ipaddress.ip_address(end)
+            if start_address.version != end_address.version:
+                raise ValueError(f"Mixed IP versions in range {start} - {end}")
+            version, start, end = start_address.version, int(start_address), int(end_address)
+
+        if not 0 <= start <= end <= MAX_ADDRESS[version]:
+            raise ValueError(f"Invalid IPv{version} range: {line['start']} - {line['end']}")
+        return version, start, end
+
+    def lookup(self, ip_address: str) -> dict[str, str] | None:
+        """Gets the dataset row for an IP address."""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        table = self.ipv4 if address.version == 4 else self.ipv6
+        row = table.find(int(address))
+        return self.rows[row] if row is not None else None
+
+    def __len__(self) -> int:
+        return len(self.ipv4) + len(self.ipv6)
+
+
+class LocalGeolocationBackend:
+    """Looks up geolocation data in a local IP range dataset, loaded on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.database: IPRangeDatabase | None = None
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def _load(self) -> IPRangeDatabase | None:
+        """Loads and compiles the dataset once."""
+        if self.database is not None or self.failed:
+            return self.database
+
+        with self.lock:
+            if self.database is None and not self.failed:
+                try:
+                    self.database = IPRangeDatabase.from_csv(self.path)
+                    logger.info(f"Loaded {len(self.database)} IP ranges from {self.path}")
+
+                except Exception as e:
+                    logger.error(f"Failed to load geolocation database {self.path}: {e}")
+                    self.failed = True
+        return self.database
+
+    def lookup(self, ip_address: str) -> dict[str, str] | None:
+        database = self._load()
+        return database.lookup(ip_address) if database else None
+
+
+def get_geolocation_backends() -> list[GeolocationBackend]:
+    """Gets configured backends in lookup order, local dataset first."""
+    backends: list[GeolocationBackend] = []
+    if CFG.tracking.GEO_DB_PATH:
+        backends.append(LocalGeolocationBackend(CFG.tracking.GEO_DB_PATH))
+    if CFG.tracking.GEO_HTTP_FALLBACK or not backends:
+        backends.append(HttpGeolocationBackend())
+    return backends
@@ -0,0 +1,165 @@
+import glob
+import hashlib
+import io
+import os
+import re
+import threading
+
+from typing import TYPE_CHECKING, Final
+
+from utils.config import CFG
+from utils.logger import logger
+from utils.ttl_cache import MISSING, TTLCache
+
+if TYPE_CHECKING:
+    from utils.measurements import TimeSeries
+
+try:
+    import fcntl
+except ImportError:  # Windows, single-flight stays per process
+    fcntl = None
+
+
+# size: (figure size in inches, dpi)
+GRAPH_SIZES: Final = {
+    "s": ((8, 5), 150),
+    "l": ((12, 6.8), 170),
+}
+METRICS: Final = ("weight", "calories")
+PERIOD_PATTERN: Final = re.compile(r"\d{4}(-\d{2})?")
+# Lock files live apart from the graphs so eviction never removes one in use
+LOCK_DIR: Final = "locks"
+BACKGROUND_COLOR: Final = "#0e0e0e"
+LINE_COLOR: Final = "#4499ff"
+GRID_COLOR: Final = "#444444"
+
+
+class GraphRenderer:
+    """Renders graphs of the users' measurements on demand, with memory and disk
+    caches keyed by (metric, period, size, data version) and single-flight rendering.
+    Users with the same data share the cached graphs."""
+
+    def __init__(self, cache_dir: str, memory_entries: int, disk_entries: int):
+        self.cache_dir = cache_dir
+        self.disk_entries = disk_entries
+        self.memory_cache = TTLCache(maxsize=memory_entries)
+        self.lock = threading.Lock()
+        self.inflight: dict[str, threading.Lock] = {}
+        self.renders = 0
+
+    @staticmethod
+    def get_series(username: str, metric: str) -> 'TimeSeries':
+        """Gets the user's measurements, empty without data."""
+        # Imported here, so numpy is only loaded once a graph page is served
+        from utils.measurements import measurement_store
+
+        return measurement_store.get_series(username, metric)
+
+    def has_graph(self, username: str, metric: str, period: str) -> bool:
+        return len(self.get_series(username, metric).get_period(period)) > 0
+
+    @staticmethod
+    def get_cache_key(points: 'TimeSeries', metric: str, period: str, size: str) -> str:
+        """Gets the content address of a graph of the points of a period."""
+        return hashlib.sha256(f"{metric}|{period}|{size}|{points.version}".encode()).hexdigest()[:32]
+
+    def get_graph(self, username: str, metric: str, period: str, size: str) -> tuple[str, bytes] | None:
+        """Gets (cache key, PNG bytes) from memory, disk or a fresh render,
+        None when the user has no data in the period."""
+        points = self.get_series(username, metric).get_period(period)
+        if not len(points):
+            return None
+        key = self.get_cache_key(points, metric, period, size)
+
+        png = self.memory_cache.get(key)
+        if png is not MISSING:
+            return key, png
+
+        with self.lock:
+            key_lock = self.inflight.setdefault(key, threading.Lock())
+
+        # Concurrent first hits wait here and then find the rendered file
+        with key_lock:
+            png = self.memory_cache.get(key)
+            if png is MISSING:
+                png = self._get_from_disk_or_render(key, points, metric, period, size)
+                self.memory_cache.set(key, png)
+
+        with self.lock:
+            self.inflight.pop(key, None)
+        return key, png
+
+    def _get_from_disk_or_render(self, key: str, points: 'TimeSeries', metric: str, period: str, size: str) -> bytes:
+        """Reads the disk cache, rendering under a file lock shared by all workers.
+        Locks are per graph rather than per key, so they stay few as the data changes."""
+        lock_dir = os.path.join(self.cache_dir, LOCK_DIR)
+        os.makedirs(lock_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        with open(os.path.join(lock_dir, f"{metric}-{period}-{size}.lock"), "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    with open(path, "rb") as file:
+                        return file.read()
+
+                png = self._render(points, metric, period, size)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, "wb") as file:
+                    file.write(png)
+                os.replace(temp_path, path)
+                self._evict_disk_cache()
+                return png
+
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _render(self, points: 'TimeSeries', metric: str, period: str, size: str) -> bytes:
+        """Renders a graph in the style of the original images."""
+        from matplotlib.figure import Figure
+        from matplotlib.dates import DateFormatter
+
+        dates, values = points.days, points.values
+        figure_size, dpi = GRAPH_SIZES[size]
+        figure = Figure(figsize=figure_size, dpi=dpi, facecolor=BACKGROUND_COLOR)
+        axes = figure.add_subplot()
+        axes.set_facecolor(BACKGROUND_COLOR)
+        axes.plot(dates, values, color=LINE_COLOR, linewidth=2.5,
+                  marker="o", markersize=6, markeredgecolor="white")
+        axes.grid(color=GRID_COLOR, linewidth=0.5)
+        axes.xaxis.set_major_formatter(DateFormatter("%d-%m"))
+        axes.tick_params(colors="white", labelsize=12)
+        for spine in axes.spines.values():
+            spine.set_color("white")
+        for label in axes.get_xticklabels():
+            label.set_rotation(45)
+        figure.tight_layout()
+
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", facecolor=BACKGROUND_COLOR)
+        self.renders += 1
+        logger.info(f"Rendered {metric} graph for {period} ({size})")
+        return buffer.getvalue()
+
+    def _evict_disk_cache(self) -> None:
+        """Keeps the most recently written disk_entries graphs."""
+        paths = sorted(glob.glob(os.path.join(self.cache_dir, "*.png")), key=os.path.getmtime)
+        for path in paths[:-self.disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self) -> dict[str, int | dict]:
+        return {
+            "renders": self.renders,
+            "memory_cache": self.memory_cache.get_stats(),
+        }
+
+
+graph_renderer = GraphRenderer(
+    cache_dir=CFG.graphs.CACHE_DIR,
+    memory_entries=CFG.graphs.MEMORY_CACHE_SIZE,
+    disk_entries=CFG.graphs.DISK_CACHE_SIZE,
+)
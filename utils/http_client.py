@@ -0,0 +1,238 @@
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+
+from typing import Any, Callable, Final
+
+import httpx
+
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.config import CFG
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+# Safe to send again whatever happened to the first attempt
+IDEMPOTENT_METHODS: Final = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS_CODES: Final = {429, 502, 503, 504}
+# Raised before the request reached the server, so any method can be retried
+NOT_SENT_ERRORS: Final = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def get_retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so workers that failed together
+    do not retry together."""
+    return random.uniform(0, min(CFG.http.RETRY_BACKOFF_MAX, CFG.http.RETRY_BACKOFF * 2 ** attempt))
+
+
+def should_retry(request: httpx.Request, response: httpx.Response | None, error: Exception | None) -> bool:
+    """Connection failures are retried for every request, failed responses
+    and read errors only for idempotent ones. Upstash commands are POSTs
+    and may not be idempotent, like INCRBY."""
+    if isinstance(error, NOT_SENT_ERRORS):
+        return True
+    if request.method not in IDEMPOTENT_METHODS:
+        return False
+    if error is not None:
+        return isinstance(error, httpx.TransportError)
+    return response.status_code in RETRY_STATUS_CODES
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """Gets the breaker of a host[:port], each is one dependency (ip-api.com, Upstash)."""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(
+                host,
+                failure_threshold=CFG.http.BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=CFG.http.BREAKER_RECOVERY_TIMEOUT,
+                half_open_calls=CFG.http.BREAKER_HALF_OPEN_CALLS,
+            ))
+    return breaker
+
+
+def get_circuit_breakers_status() -> dict[str, dict[str, Any]]:
+    return {host: breaker.get_status() for host, breaker in list(_breakers.items())}
+
+
+def get_metric_samples() -> list[tuple[str, dict[str, str], Any]]:
+    return [
+        ("tracking_circuit_open", {"upstream": host}, int(breaker.is_open()))
+        for host, breaker in list(_breakers.items())
+    ]
+
+
+def _check_breaker(request: httpx.Request) -> CircuitBreaker:
+    """Gets the breaker of the request's host, raises CircuitOpenError when it is open."""
+    breaker = get_circuit_breaker(request.url.netloc.decode("ascii"))
+    if not breaker.allow():
+        metrics.inc("tracking_upstream_requests_total", upstream=breaker.name, outcome="rejected")
+        raise CircuitOpenError(f"Circuit of {breaker.name} is open")
+    return breaker
+
+
+def _record_outcome(breaker: CircuitBreaker, response: httpx.Response | None) -> None:
+    """Server errors and transport errors (response None) count as failures."""
+    if response is None or response.status_code >= 500:
+        breaker.record_failure()
+        metrics.inc("tracking_upstream_requests_total", upstream=breaker.name, outcome="error")
+    else:
+        breaker.record_success()
+        metrics.inc("tracking_upstream_requests_total", upstream=breaker.name, outcome="ok")
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Retries failed requests and fails fast while the host's breaker is open,
+    raising CircuitOpenError without a connection attempt."""
+
+    def __init__(self, transport: httpx.BaseTransport, retries: int):
+        self.transport = transport
+        self.retries = retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = _check_breaker(request)
+        try:
+            for attempt in range(self.retries + 1):
+                response = error = None
+                try:
+                    response = self.transport.handle_request(request)
+                except httpx.TransportError as e:
+                    error = e
+                if attempt == self.retries or not should_retry(request, response, error):
+                    break
+                if response is not None:
+                    response.close()
+                time.sleep(get_retry_delay(attempt))
+        except BaseException:
+            # Interrupted or failed otherwise, still reported so a half-open trial is released
+            _record_outcome(breaker, None)
+            raise
+
+        _record_outcome(breaker, response)
+        if error is not None:
+            raise error
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async RetryTransport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int):
+        self.transport = transport
+        self.retries = retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = _check_breaker(request)
+        try:
+            for attempt in range(self.retries + 1):
+                response = error = None
+                try:
+                    response = await self.transport.handle_async_request(request)
+                except httpx.TransportError as e:
+                    error = e
+                if attempt == self.retries or not should_retry(request, response, error):
+                    break
+                if response is not None:
+                    await response.aclose()
+                await asyncio.sleep(get_retry_delay(attempt))
+        except BaseException:
+            # Cancelled or failed otherwise, still reported so a half-open trial is released
+            _record_outcome(breaker, None)
+            raise
+
+        _record_outcome(breaker, response)
+        if error is not None:
+            raise error
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _get_client_options() -> dict[str, Any]:
+    http2 = CFG.http.HTTP2 and importlib.util.find_spec("h2") is not None
+    return {
+        "limits": httpx.Limits(
+            max_connections=CFG.http.MAX_CONNECTIONS,
+            max_keepalive_connections=CFG.http.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=CFG.http.KEEPALIVE_EXPIRY,
+        ),
+        "http2": http2,
+    }
+
+
+def _get_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        CFG.http.READ_TIMEOUT,
+        connect=CFG.http.CONNECT_TIMEOUT,
+        pool=CFG.http.POOL_TIMEOUT,
+    )
+
+
+_client: httpx.Client | None = None
+_client_pid: int | None = None
+_async_client: httpx.AsyncClient | None = None
+_async_client_owner: tuple[int, asyncio.AbstractEventLoop] | None = None
+_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Gets the pooled client of this process. Connections are not shared with
+    forked workers, each process creates its own client on first use."""
+    global _client, _client_pid
+    if _client_pid != os.getpid():
+        with _lock:
+            if _client_pid != os.getpid():
+                options = _get_client_options()
+                _client = httpx.Client(
+                    timeout=_get_timeout(),
+                    transport=RetryTransport(httpx.HTTPTransport(**options), CFG.http.RETRIES),
+                )
+                _client_pid = os.getpid()
+                logger.info(f"Created HTTP client pool (http2: {options['http2']})")
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Gets the pooled async client of this process and the running loop, used
+    by the async ingest loop. Async connections can not move between loops."""
+    global _async_client, _async_client_owner
+    owner = (os.getpid(), asyncio.get_running_loop())
+    if _async_client_owner != owner:
+        with _lock:
+            if _async_client_owner != owner:
+                _async_client = httpx.AsyncClient(
+                    timeout=_get_timeout(),
+                    transport=AsyncRetryTransport(httpx.AsyncHTTPTransport(**_get_client_options()), CFG.http.RETRIES),
+                )
+                _async_client_owner = owner
+    return _async_client
+
+
+class ProcessLocalClient:
+    """Forwards to the client of the current process, for libraries that keep
+    a reference to one client, like the Upstash REST client."""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        self.get_client = get_client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_client(), name)
+
+    def close(self) -> None:
+        # The pool is shared, it is closed with the process
+        pass
+
+    async def aclose(self) -> None:
+        pass
@@ -0,0 +1,249 @@
+import asyncio
+import atexit
+import os
+import queue
+import threading
+
+from typing import Any, Awaitable, Callable, Final
+
+from utils.logger import logger
+
+
+_STOP: Final = object()
+
+
+class IngestQueue:
+    """Bounded in-process queue drained by background worker threads."""
+
+    def __init__(self,
+                 handler: Callable[[Any], None],
+                 maxsize: int,
+                 workers: int,
+                 name: str = "ingest",
+                 shutdown_timeout: float | None = None):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.name = name
+        self.shutdown_timeout = shutdown_timeout
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.threads: list[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.pid: int | None = None
+        self.accepted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        atexit.register(self.stop)
+
+    def submit(self, item: Any) -> bool:
+        """Queues item without blocking, drops it when the queue is full."""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(item)
+            with self.lock:
+                self.accepted += 1
+            return True
+
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            logger.warning(f"{self.name} queue full, dropped item ({self.dropped} total)")
+            return False
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Drains queued items and stops the workers."""
+        timeout = timeout if timeout is not None else self.shutdown_timeout
+        if not self._is_running():
+            return
+
+        for _ in self.threads:
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.error(f"{self.name} queue did not drain in time")
+                return
+
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def get_status(self) -> dict[str, Any]:
+        """Gets queue size and counters."""
+        return {
+            "running": self._is_running(),
+            "workers": len(self.threads),
+            "queued": self.queue.qsize(),
+            "max_size": self.maxsize,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    def _is_running(self) -> bool:
+        """Checks if workers were started in this process."""
+        return self.pid == os.getpid() and bool(self.threads)
+
+    def _ensure_started(self) -> None:
+        """Starts workers lazily, and again after a fork (gunicorn workers)."""
+        if self._is_running():
+            return
+
+        with self.lock:
+            if self._is_running():
+                return
+
+            self.pid = os.getpid()
+            self.threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    name=f"{self.name}-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self) -> None:
+        """Processes queued items until a stop sentinel is received."""
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+
+                self.handler(item)
+                with self.lock:
+                    self.processed += 1
+
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                logger.error(f"{self.name} worker failed to process item: {e}")
+
+            finally:
+                self.queue.task_done()
+
+
+class AsyncIngestQueue:
+    """Bounded ingest queue drained by an event loop in a background thread.
+
+    Items are handled by coroutines, at most concurrency at a time under a
+    semaphore, so one process can have many enrichments waiting on network
+    I/O at once. Same interface as IngestQueue.
+    """
+
+    def __init__(self,
+                 handler: Callable[[Any], Awaitable[None]],
+                 maxsize: int,
+                 concurrency: int,
+                 name: str = "async-ingest",
+                 shutdown_timeout: float | None = None):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.concurrency = max(1, concurrency)
+        self.name = name
+        self.shutdown_timeout = shutdown_timeout
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: threading.Thread | None = None
+        self.tasks: set[asyncio.Task] = set()
+        self.semaphore: asyncio.Semaphore | None = None
+        self.lock = threading.Lock()
+        self.pid: int | None = None
+        self.queued = 0
+        self.accepted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        atexit.register(self.stop)
+
+    def submit(self, item: Any) -> bool:
+        """Schedules item without blocking, drops it when maxsize items are pending."""
+        self._ensure_started()
+        with self.lock:
+            if self.queued >= self.maxsize:
+                self.dropped += 1
+                logger.warning(f"{self.name} queue full, dropped item ({self.dropped} total)")
+                return False
+            self.queued += 1
+            self.accepted += 1
+
+        self.loop.call_soon_threadsafe(self._schedule, item)
+        return True
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Waits for pending items and stops the loop."""
+        timeout = timeout if timeout is not None else self.shutdown_timeout
+        if not self._is_running():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(timeout)
+        except Exception:
+            logger.error(f"{self.name} queue did not drain in time")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def get_status(self) -> dict[str, Any]:
+        """Gets pending items and counters."""
+        return {
+            "running": self._is_running(),
+            "concurrency": self.concurrency,
+            "queued": self.queued,
+            "max_size": self.maxsize,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    def _is_running(self) -> bool:
+        """Checks if the loop was started in this process."""
+        return self.pid == os.getpid() and self.thread is not None
+
+    def _ensure_started(self) -> None:
+        """Starts the loop thread lazily, and again after a fork (gunicorn workers)."""
+        if self._is_running():
+            return
+
+        with self.lock:
+            if self._is_running():
+                return
+
+            self.pid = os.getpid()
+            self.queued = 0
+            self.tasks = set()
+            self.loop = asyncio.new_event_loop()
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.thread = threading.Thread(target=self.loop.run_forever, name=self.name, daemon=True)
+            self.thread.start()
+
+    def _schedule(self, item: Any) -> None:
+        task = self.loop.create_task(self._work(item))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _work(self, item: Any) -> None:
+        """Handles one item once the semaphore allows it."""
+        async with self.semaphore:
+            try:
+                await self.handler(item)
+                with self.lock:
+                    self.processed += 1
+
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                logger.error(f"{self.name} failed to process item: {e}")
+
+            finally:
+                with self.lock:
+                    self.queued -= 1
+
+    async def _drain(self) -> None:
+        # Items scheduled by call_soon_threadsafe before stop() are tasks by now
+        await asyncio.sleep(0)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,365 @@
+import argparse
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+
+from functools import cached_property
+from typing import Any, Final
+from urllib.parse import quote
+
+import numpy as np
+
+from utils.config import CFG
+from utils.graphs import METRICS
+from utils.logger import logger
+from utils.ttl_cache import MISSING, TTLCache
+
+
+UNITS: Final = {"weight": "kg", "calories": "kcal"}
+DECIMALS: Final = {"weight": 1, "calories": 0}
+MEASUREMENTS_PREFIX: Final = "measurements_"
+# Energy of one kg of body weight, to turn a calorie balance into a weight change
+KCAL_PER_KG: Final = 7700
+# Stored as all days (int32 days since epoch) followed by all values (float64)
+DAY_BYTES: Final = 4
+VALUE_BYTES: Final = 8
+
+
+class TimeSeries:
+    """Daily values of one metric as numpy arrays, sorted by day with one value per day."""
+
+    def __init__(self, days: np.ndarray, values: np.ndarray):
+        self.days = days
+        self.values = values
+
+    @classmethod
+    def empty(cls) -> 'TimeSeries':
+        return cls(np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def from_points(cls, days, values) -> 'TimeSeries':
+        """Builds a series from ISO dates or datetime64 days and values, in any
+        order. Missing values are dropped, the last value of a day wins."""
+        days = np.asarray(days, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=np.float64)
+        known = ~np.isnat(days) & ~np.isnan(values)
+        days, values = days[known], values[known]
+        order = np.argsort(days, kind="stable")
+        days, values = days[order], values[order]
+        last = np.append(days[1:] != days[:-1], True)
+        return cls(days[last], values[last])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TimeSeries':
+        count = len(data) // (DAY_BYTES + VALUE_BYTES)
+        days = np.frombuffer(data, dtype="<i4", count=count).astype("datetime64[D]")
+        values = np.frombuffer(data, dtype="<f8", count=count, offset=count * DAY_BYTES)
+        return cls(days, values)
+
+    def to_bytes(self) -> bytes:
+        return self.days.astype("<i4").tobytes() + self.values.astype("<f8").tobytes()
+
+    @cached_property
+    def version(self) -> str:
+        return hashlib.sha1(self.to_bytes()).hexdigest()[:12]
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def merge(self, other: 'TimeSeries') -> 'TimeSeries':
+        """Returns both series combined, days in other replace days in self."""
+        return TimeSeries.from_points(
+            np.concatenate((self.days, other.days)),
+            np.concatenate((self.values, other.values)),
+        )
+
+    def get_bounds(self, period: str) -> tuple[int, int]:
+        """Gets the index range of a 'YYYY' or 'YYYY-MM' period."""
+        start = np.datetime64(period)
+        end = (start + 1).astype("datetime64[D]")
+        low, high = np.searchsorted(self.days, [start.astype("datetime64[D]"), end])
+        return int(low), int(high)
+
+    def get_period(self, period: str) -> 'TimeSeries':
+        low, high = self.get_bounds(period)
+        return TimeSeries(self.days[low:high], self.values[low:high])
+
+    def get_months(self, year: int) -> set[int]:
+        """Gets the months (1-12) of a year with values."""
+        low, high = self.get_bounds(str(year))
+        months = self.days[low:high].astype("datetime64[M]").astype(np.int64) % 12 + 1
+        return set(months.tolist())
+
+    def rolling_mean(self, window: int) -> np.ndarray:
+        """Mean per day of the values in the window days up to it, days
+        without a value are left out rather than counted as zero."""
+        offsets = self.days.astype(np.int64)
+        sums = np.concatenate(([0.0], np.cumsum(self.values)))
+        starts = np.searchsorted(offsets, offsets - window + 1)
+        ends = np.arange(1, len(self) + 1)
+        return (sums[ends] - sums[starts]) / (ends - starts)
+
+    def weekly_means(self) -> tuple[np.ndarray, np.ndarray]:
+        """Gets (Monday, mean) of every week with values."""
+        if not len(self):
+            return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+        # Day 0 is Thursday 1970-01-01, shifted by 3 so weeks start on Monday
+        weeks = (self.days.astype(np.int64) + 3) // 7
+        starts = np.flatnonzero(np.append(True, weeks[1:] != weeks[:-1]))
+        counts = np.diff(np.append(starts, len(self)))
+        means = np.add.reduceat(self.values, starts) / counts
+        return (weeks[starts] * 7 - 3).astype("datetime64[D]"), means
+
+    def weekly_deltas(self) -> tuple[np.ndarray, np.ndarray]:
+        """Gets (Monday, change of the weekly mean since the previous week with values)."""
+        weeks, means = self.weekly_means()
+        return weeks[1:], np.diff(means)
+
+    def monthly_extremes(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gets (month, min, max) of every month with values."""
+        if not len(self):
+            return np.empty(0, dtype="datetime64[M]"), np.empty(0), np.empty(0)
+        months = self.days.astype("datetime64[M]")
+        starts = np.flatnonzero(np.append(True, months[1:] != months[:-1]))
+        return (
+            months[starts],
+            np.minimum.reduceat(self.values, starts),
+            np.maximum.reduceat(self.values, starts),
+        )
+
+
+def get_calorie_balance(calories: TimeSeries, weight: TimeSeries, target: float) -> dict[str, float | None]:
+    """Balance of the intake against target, and the maintenance intake
+    estimated from the weight trend over the same days."""
+    if not len(calories):
+        return {}
+
+    balance = calories.values - target
+    total = float(balance.sum())
+    low, high = np.searchsorted(weight.days, [calories.days[0], calories.days[-1] + 1])
+    weight = TimeSeries(weight.days[low:high], weight.values[low:high])
+    maintenance = None
+    if len(weight) >= 2:
+        # Least-squares slope of the weight over the days
+        offsets = weight.days.astype(np.int64)
+        offsets = offsets - offsets.mean()
+        kg_per_day = (offsets @ (weight.values - weight.values.mean())) / (offsets @ offsets)
+        maintenance = round(float(calories.values.mean() - kg_per_day * KCAL_PER_KG))
+
+    return {
+        "average_intake": round(float(calories.values.mean())),
+        "average_balance": round(float(balance.mean())),
+        "total_balance": round(total),
+        "expected_weight_change": round(total / KCAL_PER_KG, 2),
+        "maintenance": maintenance,
+    }
+
+
+def get_stats(series: TimeSeries, metric: str, period: str, weight: TimeSeries | None = None) -> dict[str, Any] | None:
+    """Summary of a 'YYYY' or 'YYYY-MM' period, None without data. The
+    calorie balance needs the weight series for its maintenance estimate."""
+    low, high = series.get_bounds(period)
+    if low == high:
+        return None
+
+    # The window may start before the period, like rolling_mean over the whole series
+    window_start = np.searchsorted(series.days, series.days[high - 1] - CFG.graphs.ROLLING_WINDOW + 1)
+    points = series.get_period(period)
+    _, deltas = points.weekly_deltas()
+    stats = {
+        "unit": UNITS[metric],
+        "days": len(points),
+        "latest": _round(points.values[-1], metric),
+        "window": CFG.graphs.ROLLING_WINDOW,
+        "rolling_mean": _round(series.values[window_start:high].mean(), metric),
+        "weekly_delta": _round(deltas[-1], metric) if len(deltas) else None,
+        "minimum": _round(points.values.min(), metric),
+        "maximum": _round(points.values.max(), metric),
+    }
+    if weight is not None:
+        stats["balance"] = get_calorie_balance(points, weight, CFG.graphs.CALORIE_TARGET)
+    return stats
+
+
+def _round(value: float, metric: str) -> float | int:
+    decimals = DECIMALS[metric]
+    return round(float(value), decimals) if decimals else round(float(value))
+
+
+def parse_csv(content: str, metric: str | None = None) -> dict[str, TimeSeries]:
+    """Parses 'date,weight,calories' rows, or 'date,value' rows of metric.
+    Empty cells are skipped, so both metrics can be in one file."""
+    rows = list(csv.DictReader(io.StringIO(content)))
+    columns = {"value": metric} if metric else {name: name for name in METRICS}
+    days = [row.get("date") or "NaT" for row in rows]
+    return {
+        name: TimeSeries.from_points(days, [row.get(column) or "nan" for row in rows])
+        for column, name in columns.items()
+        if any(row.get(column) for row in rows)
+    }
+
+
+def parse_json(content: str | bytes) -> dict[str, TimeSeries]:
+    """Parses a list of {"date", "weight", "calories"} records, or
+    {metric: {date: value}} mappings."""
+    data = json.loads(content)
+    if isinstance(data, dict):
+        return {
+            name: TimeSeries.from_points(list(points), list(points.values()))
+            for name, points in data.items()
+        }
+
+    series = {}
+    for name in METRICS:
+        points = [(record["date"], record[name]) for record in data if record.get(name) is not None]
+        if points:
+            series[name] = TimeSeries.from_points(*zip(*points))
+    return series
+
+
+class MeasurementStore:
+    """Daily measurements per user and metric.
+
+    Series are stored in Redis, or as files in directory without Redis, and
+    kept in memory for local_timeout seconds so imports in other workers are
+    picked up within that time. redis may be a callable that returns the
+    client, it is then resolved on first use.
+    """
+
+    def __init__(self, redis=None, directory: str | None = None, local_timeout: int = 60, maxsize: int = 256):
+        self._redis = redis
+        self.directory = directory
+        self.local_timeout = local_timeout
+        self.memory = TTLCache(maxsize=maxsize, ttl=local_timeout)
+        self.stats = TTLCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    @property
+    def redis(self):
+        if callable(self._redis):
+            self._redis = self._redis()
+        return self._redis
+
+    def get_series(self, username: str, metric: str) -> TimeSeries:
+        """Gets a series, empty when there is none or it cannot be read."""
+        series = self.memory.get((username, metric))
+        if series is not MISSING:
+            return series
+        try:
+            series = self._load(username, metric)
+        except Exception as e:
+            logger.error(f"Failed to load {metric} measurements of {username}: {e}")
+            return TimeSeries.empty()
+        self.memory.set((username, metric), series)
+        return series
+
+    def add(self, username: str, metric: str, series: TimeSeries) -> TimeSeries:
+        """Merges series into the stored series and saves it."""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        with self.lock:
+            merged = self._load(username, metric).merge(series)
+            self._save(username, metric, merged)
+            self.memory.set((username, metric), merged)
+        return merged
+
+    def import_series(self, username: str, series: dict[str, TimeSeries]) -> dict[str, int]:
+        """Adds parsed series, returns the number of days per metric."""
+        return {metric: len(self.add(username, metric, points)) for metric, points in series.items()}
+
+    def import_csv(self, username: str, content: str, metric: str | None = None) -> dict[str, int]:
+        return self.import_series(username, parse_csv(content, metric))
+
+    def import_json(self, username: str, content: str | bytes) -> dict[str, int]:
+        return self.import_series(username, parse_json(content))
+
+    def get_stats(self, username: str, metric: str, period: str) -> dict[str, Any] | None:
+        """Gets the summary of a 'YYYY' or 'YYYY-MM' period, None without data.
+        Summaries are kept per data version, so repeated queries skip numpy."""
+        series = self.get_series(username, metric)
+        weight = self.get_series(username, "weight") if metric == "calories" else None
+        version = series.version + (weight.version if weight is not None else "")
+        key = (username, metric, period, version)
+        stats = self.stats.get(key)
+        if stats is MISSING:
+            stats = get_stats(series, metric, period, weight)
+            if stats:
+                stats["version"] = version
+            self.stats.set(key, stats)
+        return stats
+
+    def _get_key(self, username: str, metric: str) -> str:
+        return f"{MEASUREMENTS_PREFIX}{username}_{metric}"
+
+    def _get_path(self, username: str, metric: str) -> str:
+        return os.path.join(self.directory, quote(username, safe=""), f"{metric}.bin")
+
+    def _load(self, username: str, metric: str) -> TimeSeries:
+        if self.redis is not None:
+            data = self.redis.get(self._get_key(username, metric))
+            return TimeSeries.from_bytes(base64.b64decode(data)) if data else TimeSeries.empty()
+
+        if not self.directory:
+            return TimeSeries.empty()
+        try:
+            with open(self._get_path(username, metric), "rb") as file:
+                return TimeSeries.from_bytes(file.read())
+        except FileNotFoundError:
+            return TimeSeries.empty()
+
+    def _save(self, username: str, metric: str, series: TimeSeries) -> None:
+        if self.redis is not None:
+            self.redis.set(self._get_key(username, metric), base64.b64encode(series.to_bytes()).decode())
+            return
+
+        if not self.directory:
+            return
+        path = self._get_path(username, metric)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(series.to_bytes())
+        os.replace(temp_path, path)
+
+
+def _get_redis():
+    from utils.upstash import upstash
+
+    return upstash.redis
+
+
+measurement_store = MeasurementStore(
+    redis=_get_redis,
+    directory=CFG.graphs.MEASUREMENTS_DIR,
+    local_timeout=CFG.graphs.MEASUREMENTS_LOCAL_TIMEOUT,
+    maxsize=CFG.graphs.MEASUREMENTS_CACHE_SIZE,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import and query daily measurements")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import a CSV or JSON file")
+    import_parser.add_argument("username")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--metric", choices=METRICS, help="Metric of a 'date,value' CSV file")
+    stats_parser = subparsers.add_parser("stats", help="Print the stats of a period")
+    stats_parser.add_argument("username")
+    stats_parser.add_argument("metric", choices=METRICS)
+    stats_parser.add_argument("period", help="YYYY or YYYY-MM")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        with open(args.path, "rb") as file:
+            content = file.read()
+        if args.path.endswith(".json"):
+            imported = measurement_store.import_json(args.username, content)
+        else:
+            imported = measurement_store.import_csv(args.username, content.decode(), args.metric)
+        logger.info(f"Imported measurements of {args.username}: {imported}")
+    else:
+        print(json.dumps(measurement_store.get_stats(args.username, args.metric, args.period), indent=2))
@@ -0,0 +1,324 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+from typing import Any, Callable, Final, Iterable
+
+from utils.config import CFG
+from utils.logger import logger
+from utils.timing import BUCKET_BOUNDS, Histogram
+
+try:
+    import fcntl
+except ImportError:  # Windows, snapshots of exited workers are kept as they are
+    fcntl = None
+
+
+# name: (type, help), every exported metric is declared here
+METRICS: Final = {
+    "tracking_http_requests_total": ("counter", "Requests served, per route, method and status."),
+    "tracking_http_request_duration_seconds": ("histogram", "Request latency per route."),
+    "tracking_stage_duration_seconds": ("histogram", "Latency of sampled hot-path stages."),
+    "tracking_cache_hits_total": ("counter", "Cache hits per cache."),
+    "tracking_cache_misses_total": ("counter", "Cache misses per cache."),
+    "tracking_cache_evictions_total": ("counter", "Cache evictions per cache."),
+    "tracking_cache_entries": ("gauge", "Entries per cache."),
+    "tracking_upstream_requests_total": ("counter", "HTTP calls to Upstash and geolocation, per upstream and outcome."),
+    "tracking_circuit_open": ("gauge", "Whether the circuit breaker of an upstream is open or half-open."),
+    "tracking_storage_fallbacks_total": ("counter", "Storage operations served by the local fallback, per operation."),
+    "tracking_buffer_entries": ("gauge", "Entries in the in-memory write, replay and fallback buffers."),
+    "tracking_ingest_items_total": ("counter", "Tracked requests per ingest outcome."),
+    "tracking_ingest_queued": ("gauge", "Tracked requests waiting for ingest."),
+    "tracking_shed_requests_total": ("counter", "Requests not tracked because their client neared its rate limit."),
+    "tracking_rate_limit_decisions_total": ("counter", "Rate limit decisions per outcome."),
+}
+SNAPSHOT_SUFFIX: Final = ".json"
+# Counters and histograms of exited workers, folded into one file
+ARCHIVE_FILENAME: Final = "archive.json"
+ARCHIVE_LOCK_FILENAME: Final = "archive.lock"
+
+# (name, labels, value), value is a number or Histogram.to_dict() for histograms
+Sample = tuple[str, dict[str, str], Any]
+
+
+class MetricsRegistry:
+    """Counters and histograms of this process, plus collectors that read the
+    state of other components when a snapshot is taken.
+
+    Every worker writes its snapshot to a <pid>-<start>.json file in directory,
+    the metrics endpoint merges the files of all workers: counters and
+    histograms are summed over all snapshots, also of workers that exited, so
+    they never go down; gauges only over workers that are still running.
+    Snapshots of exited workers are folded into one archive file and removed.
+    """
+
+    def __init__(self, directory: str | None, write_interval: float):
+        self.directory = directory
+        self.write_interval = write_interval
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.collectors: list[Callable[[], Iterable[Sample]]] = []
+        self.lock = threading.Lock()
+        self.writer_pid: int | None = None
+        self.snapshot_pid: int | None = None
+        self.snapshot_filename: str | None = None
+        self.started_at = 0.0
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self._ensure_writer()
+
+    def observe(self, name: str, duration_ms: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(duration_ms)
+        self._ensure_writer()
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self.collectors.append(collector)
+
+    def get_samples(self) -> list[Sample]:
+        with self.lock:
+            samples = [(name, dict(labels), value) for (name, labels), value in self.counters.items()]
+            samples.extend(
+                (name, dict(labels), histogram.to_dict()) for (name, labels), histogram in self.histograms.items()
+            )
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector {collector.__qualname__} failed: {e}")
+        return samples
+
+    def write_snapshot(self) -> None:
+        """Writes the samples of this process to its snapshot file, atomically."""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._get_snapshot_filename())
+            snapshot = {
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "written_at": time.time(),
+                "samples": self.get_samples(),
+            }
+            with open(path + ".tmp", "w") as file:
+                json.dump(snapshot, file)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            logger.error(f"Failed to write metrics snapshot: {e}")
+
+    def _get_snapshot_filename(self) -> str:
+        """Names the snapshot by pid and start, so a later process that gets
+        the same pid does not overwrite the counters of an exited one."""
+        if self.snapshot_pid != os.getpid():
+            self.snapshot_pid = os.getpid()
+            self.started_at = time.time()
+            self.snapshot_filename = f"{self.snapshot_pid}-{time.time_ns()}{SNAPSHOT_SUFFIX}"
+        return self.snapshot_filename
+
+    def _ensure_writer(self) -> None:
+        """Starts the interval snapshot thread, once per process."""
+        if not self.directory or self.writer_pid == os.getpid():
+            return
+        with self.lock:
+            if self.writer_pid == os.getpid():
+                return
+            self.writer_pid = os.getpid()
+        atexit.register(self.write_snapshot)
+        threading.Thread(target=self._write_periodically, name="metrics-writer", daemon=True).start()
+
+    def _write_periodically(self) -> None:
+        while True:
+            time.sleep(self.write_interval)
+            self.write_snapshot()
+
+    def _read_snapshots(self) -> list[tuple[bool, list[Sample]]]:
+        """Reads (alive, samples) of the archive and of the other workers, this
+        process is read live. Snapshots of exited workers are archived first."""
+        snapshots = [(True, self.get_samples())]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+
+        with self._lock_archive():
+            archive = self._read_json(ARCHIVE_FILENAME) or {"folded": [], "samples": []}
+            workers = {}
+            for filename in os.listdir(self.directory):
+                if (not filename.endswith(SNAPSHOT_SUFFIX)
+                        or filename in (ARCHIVE_FILENAME, self.snapshot_filename)
+                        or filename in archive["folded"]):
+                    continue
+                snapshot = self._read_json(filename)
+                if snapshot is None:
+                    continue
+                if "pid" not in snapshot or "samples" not in snapshot:
+                    logger.error(f"Skipping metrics snapshot {filename} without pid or samples")
+                    continue
+                workers[filename] = snapshot
+
+            exited = _get_exited(workers)
+            if exited and fcntl:
+                archive = self._archive({filename: workers.pop(filename) for filename in exited}, archive)
+
+        snapshots.append((False, archive["samples"]))
+        snapshots.extend((filename not in exited, snapshot["samples"]) for filename, snapshot in workers.items())
+        return snapshots
+
+    def _archive(self, exited: dict[str, dict[str, Any]], archive: dict[str, Any]) -> dict[str, Any]:
+        """Adds the counters and histograms of exited workers to the archive, then
+        removes their snapshots. The archive lists them until they are gone, so a
+        snapshot left behind is never counted twice."""
+        merged = _merge([(False, archive["samples"])] + [(False, snapshot["samples"]) for snapshot in exited.values()])
+        folded = [filename for filename in archive["folded"] if os.path.exists(os.path.join(self.directory, filename))]
+        archive = {
+            "folded": folded + list(exited),
+            "samples": [(name, dict(labels), value) for (name, labels), value in merged.items()],
+        }
+        try:
+            path = os.path.join(self.directory, ARCHIVE_FILENAME)
+            with open(path + ".tmp", "w") as file:
+                json.dump(archive, file)
+            os.replace(path + ".tmp", path)
+            for filename in exited:
+                os.remove(os.path.join(self.directory, filename))
+        except OSError as e:
+            logger.error(f"Failed to archive metrics snapshots: {e}")
+        return archive
+
+    @contextlib.contextmanager
+    def _lock_archive(self):
+        """Holds the archive lock shared by all workers, without fcntl nothing is archived."""
+        if not fcntl:
+            yield
+            return
+        with open(os.path.join(self.directory, ARCHIVE_LOCK_FILENAME), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_json(self, filename: str) -> dict[str, Any] | None:
+        try:
+            with open(os.path.join(self.directory, filename)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Skipping unreadable metrics snapshot {filename}: {e}")
+            return None
+
+    def collect(self) -> dict[tuple[str, tuple], Any]:
+        """Merges the snapshots of all workers."""
+        return _merge(self._read_snapshots())
+
+    def render(self) -> str:
+        """Renders all workers' metrics in the Prometheus text format."""
+        by_name: dict[str, list[tuple[tuple, Any]]] = {}
+        for (name, labels), value in sorted(self.collect().items()):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, series in by_name.items():
+            metric_type, help_text = METRICS.get(name, ("gauge", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in series:
+                if metric_type == "histogram":
+                    lines.extend(_render_histogram(name, labels, value))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def get_cache_samples(name: str, cache) -> list[Sample]:
+    """Samples of a TTLCache, labelled with the cache name."""
+    labels = {"cache": name}
+    return [
+        ("tracking_cache_hits_total", labels, cache.hits),
+        ("tracking_cache_misses_total", labels, cache.misses),
+        ("tracking_cache_evictions_total", labels, cache.evictions),
+        ("tracking_cache_entries", labels, len(cache)),
+    ]
+
+
+def _merge(snapshots: list[tuple[bool, list[Sample]]]) -> dict[tuple[str, tuple], Any]:
+    """Sums samples by name and labels, gauges only of snapshots that are alive."""
+    merged: dict[tuple[str, tuple], Any] = {}
+    for alive, samples in snapshots:
+        for name, labels, value in samples:
+            metric_type = METRICS.get(name, ("gauge",))[0]
+            if metric_type == "gauge" and not alive:
+                continue
+            key = (name, tuple(sorted(labels.items())))
+            if metric_type == "histogram":
+                total = merged.setdefault(key, {"counts": [0] * len(BUCKET_BOUNDS), "sum": 0.0, "count": 0})
+                total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+                total["sum"] += value["sum"]
+                total["count"] += value["count"]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _get_exited(workers: dict[str, dict[str, Any]]) -> list[str]:
+    """Gets the snapshots of workers that exited. Of snapshots with the same pid
+    only the latest started one can be running, the pid was reused for it."""
+    latest: dict[int, str] = {}
+    for filename, snapshot in workers.items():
+        current = latest.get(snapshot["pid"])
+        if current is None or snapshot.get("started_at", 0) > workers[current].get("started_at", 0):
+            latest[snapshot["pid"]] = filename
+    return [
+        filename for filename, snapshot in workers.items()
+        if snapshot["pid"] == os.getpid() or latest[snapshot["pid"]] != filename or not _is_alive(snapshot["pid"])
+    ]
+
+
+def _render_histogram(name: str, labels: tuple, value: dict[str, Any]) -> list[str]:
+    """Histograms are kept in milliseconds and exported in seconds."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKET_BOUNDS, value["counts"]):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else _format_value(bound / 1000)
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'] / 1000)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return lines
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = MetricsRegistry(CFG.server.METRICS_DIR, CFG.server.METRICS_WRITE_INTERVAL)
@@ -1,8 +1,7 @@
-import os
+import hmac
 
-from flask import session, redirect, url_for, flash, request
+from flask import Response, session, redirect, url_for, flash, request
 from functools import wraps
-from PIL import Image
 
 from utils.config import CFG
 
@@ -18,11 +17,26 @@ def login_required(f):
     return decorated_function
 
 
+def token_or_login_required(token: str | None):
+    """Accepts a logged in user, or 'Authorization: Bearer <token>' when a
+    token is set, for scrapers. Otherwise behaves like login_required."""
+    def decorator(f):
+        if not token:
+            return login_required(f)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if "username" in session:
+                return f(*args, **kwargs)
+            authorization = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+                return Response("Unauthorized", status=401, mimetype="text/plain")
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
 def img_to_webp():
-    img_dir = os.path.join("static", "images")
-    for filename in os.listdir(img_dir):
-        if filename.endswith(('.png', '.jpg', '.jpeg')):
-            img_path = os.path.join(img_dir, filename)
-            with Image.open(img_path) as img:
-                webp_path = os.path.splitext(img_path)[0] + '.webp'
-                img.save(webp_path, 'WEBP', quality=85)
+    """Builds WebP/AVIF variants of the static images, see utils.assets."""
+    from utils.assets import build_image_variants
+    build_image_variants()
@@ -0,0 +1,241 @@
+import math
+import os
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Any, Final
+
+from utils.logger import logger
+from utils.ttl_cache import MISSING, TTLCache
+
+
+RATE_LIMIT_PREFIX: Final = "ratelimit_"
+# Work done for a request, expensive work is shed first as a client nears its limit
+LOAD_NORMAL: Final = 0
+LOAD_SKIP_GEOLOCATION: Final = 1
+LOAD_SKIP_TRACKING: Final = 2
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    count: float
+    limit: int
+    retry_after: int
+    load_level: int = LOAD_NORMAL
+
+
+class TokenBucket:
+    """In-process token bucket, refilled lazily on take()."""
+
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class WindowState:
+    """Counts of one client on one route: the shared counts as of the last sync
+    plus hits of this process that were not sent yet."""
+
+    def __init__(self, limit: int, window: int):
+        self.bucket = TokenBucket(limit, limit / window)
+        self.window_index = 0
+        self.previous = 0
+        self.current = 0
+        self.pending = 0
+
+    def roll(self, window_index: int) -> tuple[int, int]:
+        """Moves to a new fixed window, returns (window index, pending hits)
+        that still have to be sent for the old one."""
+        unsent = (self.window_index, self.pending)
+        if window_index == self.window_index + 1:
+            self.previous = self.current + self.pending
+        else:
+            self.previous = 0
+        self.window_index = window_index
+        self.current = 0
+        self.pending = 0
+        return unsent
+
+    def estimate(self, elapsed_ratio: float) -> float:
+        """Sliding window count, the previous window weighted by its overlap."""
+        return self.previous * (1 - elapsed_ratio) + self.current + self.pending
+
+
+class SlidingWindowLimiter:
+    """Per route and per client sliding window limiter, shared through Redis.
+
+    Uses the sliding window counter algorithm: hits are counted in fixed windows
+    stored under ratelimit_<route>:<client>:<window> keys, and the count of the
+    previous window is weighted by how much it still overlaps.
+
+    Most decisions need no network: a token bucket per client rejects clients
+    that exceed the limit in this process alone, and hits are sent to Redis in
+    batches every sync_interval seconds. Only clients past sync_ratio of their
+    limit are synced on the request path, so decisions near the limit are exact.
+    Without Redis the limits apply per process.
+    """
+
+    def __init__(self, redis, limits: dict[str, tuple[int, int]], sync_interval: float,
+                 sync_ratio: float, max_keys: int, shed_ratios: tuple[float, float]):
+        self.redis = redis
+        self.limits = limits
+        self.sync_interval = sync_interval
+        self.sync_ratio = sync_ratio
+        self.shed_ratios = shed_ratios
+        self.states = TTLCache(maxsize=max_keys)
+        self.unsent: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.syncer_pid: int | None = None
+        self.allowed = 0
+        self.rejected = 0
+
+    def get_limit(self, route: str) -> tuple[int, int]:
+        """Gets (limit, window seconds) of a route."""
+        return self.limits.get(route, self.limits["default"])
+
+    def hit(self, route: str, client: str) -> RateLimitDecision:
+        """Counts a request of client on route and decides whether it is allowed."""
+        limit, window = self.get_limit(route)
+        key = f"{route}:{client}"
+        now = time.time()
+        window_index, elapsed = divmod(now, window)
+        window_index = int(window_index)
+        elapsed_ratio = elapsed / window
+        retry_after = max(1, math.ceil(window - elapsed))
+
+        with self.lock:
+            state = self.states.get(key)
+            if state is MISSING:
+                state = WindowState(limit, window)
+                state.window_index = window_index
+                self.states.set(key, state, ttl=2 * window)
+            if state.window_index != window_index:
+                self._queue_unsent(key, *state.roll(window_index))
+
+            if not state.bucket.take():
+                self.rejected += 1
+                return RateLimitDecision(False, limit, limit, retry_after)
+            needs_sync = self.redis is not None and state.estimate(elapsed_ratio) + 1 >= limit * self.sync_ratio
+
+        if needs_sync:
+            self._sync({key: state})
+        else:
+            self._ensure_syncer()
+
+        with self.lock:
+            count = state.estimate(elapsed_ratio)
+            if count >= limit:
+                self.rejected += 1
+                return RateLimitDecision(False, count, limit, retry_after)
+            state.pending += 1
+            self.allowed += 1
+
+        return RateLimitDecision(True, count + 1, limit, retry_after, self.get_load_level(count + 1, limit))
+
+    def get_load_level(self, count: float, limit: int) -> int:
+        """Gets how much work to shed for a client at count of limit."""
+        geolocation_ratio, tracking_ratio = self.shed_ratios
+        if count >= limit * tracking_ratio:
+            return LOAD_SKIP_TRACKING
+        if count >= limit * geolocation_ratio:
+            return LOAD_SKIP_GEOLOCATION
+        return LOAD_NORMAL
+
+    def _queue_unsent(self, key: str, window_index: int, pending: int) -> None:
+        if pending and self.redis is not None:
+            redis_key = self._get_redis_key(key, window_index)
+            self.unsent[redis_key] = self.unsent.get(redis_key, 0) + pending
+
+    @staticmethod
+    def _get_redis_key(key: str, window_index: int) -> str:
+        return f"{RATE_LIMIT_PREFIX}{key}:{window_index}"
+
+    def _sync(self, states: dict[str, WindowState]) -> None:
+        """Sends pending hits and reads the shared counts, in one round-trip."""
+        with self.lock:
+            unsent, self.unsent = self.unsent, {}
+            batch = [(key, state, state.window_index, state.pending) for key, state in states.items()]
+            for _, state, _, _ in batch:
+                state.pending = 0
+
+        try:
+            pipeline = self.redis.pipeline()
+            for redis_key, pending in unsent.items():
+                pipeline.incrby(redis_key, pending)
+                pipeline.expire(redis_key, 2 * self._get_window(redis_key))
+            for key, _, window_index, pending in batch:
+                current_key = self._get_redis_key(key, window_index)
+                pipeline.incrby(current_key, pending)
+                pipeline.expire(current_key, 2 * self._get_window(current_key))
+                pipeline.get(self._get_redis_key(key, window_index - 1))
+            results = pipeline.exec()
+
+        except Exception as e:
+            logger.error(f"Failed to sync {len(batch)} rate limit counters: {e}")
+            with self.lock:
+                for redis_key, pending in unsent.items():
+                    self.unsent[redis_key] = self.unsent.get(redis_key, 0) + pending
+                for _, state, window_index, pending in batch:
+                    if state.window_index == window_index:
+                        state.pending += pending
+            return
+
+        results = results[2 * len(unsent):]
+        with self.lock:
+            for position, (_, state, window_index, _) in enumerate(batch):
+                current, _, previous = results[3 * position:3 * position + 3]
+                if state.window_index == window_index:
+                    state.current = int(current)
+                    state.previous = int(previous or 0)
+
+    def _get_window(self, redis_key: str) -> int:
+        """Gets the window of a ratelimit_<route>:<client>:<window> key."""
+        route = redis_key[len(RATE_LIMIT_PREFIX):].split(":", 1)[0]
+        return self.get_limit(route)[1]
+
+    def _ensure_syncer(self) -> None:
+        """Starts the interval sync thread, once per process."""
+        if self.redis is None or self.syncer_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.syncer_pid == os.getpid():
+                return
+            self.syncer_pid = os.getpid()
+            threading.Thread(target=self._sync_periodically, name="rate-limit-syncer", daemon=True).start()
+
+    def _sync_periodically(self) -> None:
+        """Sends the hits of all clients with pending hits every sync_interval seconds."""
+        while True:
+            time.sleep(self.sync_interval)
+            with self.lock:
+                states = {key: state for key, state in self.states.items() if state.pending}
+            if states or self.unsent:
+                self._sync(states)
+
+    def get_metric_samples(self) -> list[tuple[str, dict[str, str], Any]]:
+        return [
+            ("tracking_rate_limit_decisions_total", {"decision": "allowed"}, self.allowed),
+            ("tracking_rate_limit_decisions_total", {"decision": "rejected"}, self.rejected),
+        ]
+
+    def get_status(self) -> dict[str, Any]:
+        return {
+            "shared": self.redis is not None,
+            "clients": len(self.states),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
@@ -1,19 +1,33 @@
-import pytz
-import requests
+import asyncio
+import hashlib
+import json
+import math
+import time
 
 from dataclasses import dataclass
 from datetime import datetime
-from flask import request
+from flask import g, request
 from typing import Any, Final
-from user_agents import parse
 
+from utils.analytics import analytics
+from utils.config import CFG
+from utils.extensions import get_limiter
+from utils.geolocation import get_geolocation_backends
+from utils.ingest import AsyncIngestQueue, IngestQueue
+from utils.rate_limit import LOAD_NORMAL, LOAD_SKIP_GEOLOCATION, LOAD_SKIP_TRACKING
+from utils.timing import timed, timed_stage, timings
+from utils.ttl_cache import MISSING, TTLCache
+from utils.lazy import LazyObject
+from utils.metrics import get_cache_samples
 from utils.upstash import upstash
 from utils.logger import logger
 
 
-GEOLOCATION_API_URL: Final = "http://ip-api.com/json"
 GEOLOCATION_CACHE_DURATION: Final = 3600
-REQUEST_TIMEOUT: Final = 5
+GEOLOCATION_NEGATIVE_CACHE_DURATION: Final = 300
+USER_AGENT_MAX_KEY_LENGTH: Final = 512
+REQUEST_PAGE_SCAN_SIZE: Final = 100
+REQUEST_PAGE_MAX_SCANS: Final = 10
 
 
 @dataclass
@@ -57,7 +71,7 @@ class GeolocationData:
             "timezone": self.timezone
         }
 
-@dataclass
+@dataclass(frozen=True)
 class DeviceInfo:
     browser: str
     os: str
@@ -80,13 +94,74 @@ class DeviceInfo:
             "raw_user_agent": self.raw_user_agent
         }
 
+@dataclass
+class RawRequest:
+    """Request fields captured on the request path, enriched later."""
+    ip_address: str
+    user_agent: str
+    route: str
+    method: str
+    referrer: str
+    timestamp: float
+    skip_geolocation: bool = False
+
+
+@dataclass
+class RequestFilter:
+    """Filters applied to stored request data."""
+    route: str | None = None
+    country: str | None = None
+    device: str | None = None
+    is_bot: bool | None = None
+    since: float | None = None
+    until: float | None = None
+
+    def matches(self, data: dict[str, Any]) -> bool:
+        """Checks if a stored entry passes all set filters."""
+        device_info = data.get("device_info") or {}
+        geo_data = data.get("geo_data") or {}
+        if self.route and data.get("route") != self.route:
+            return False
+        if self.country and self.country.lower() not in (
+            str(geo_data.get("country_code", "")).lower(),
+            str(geo_data.get("country", "")).lower(),
+        ):
+            return False
+        if self.device and not device_info.get(f"is_{self.device}"):
+            return False
+        if self.is_bot is not None and bool(device_info.get("is_bot")) != self.is_bot:
+            return False
+        return True
+
+
 class RequestContext:
     """Manages request data collection."""
     
+    def __init__(self):
+        self.geolocation_backends = get_geolocation_backends()
+        self.geolocation_cache = TTLCache(
+            maxsize=CFG.tracking.GEO_CACHE_SIZE,
+            ttl=GEOLOCATION_CACHE_DURATION,
+        )
+        self.user_agent_cache = TTLCache(
+            maxsize=CFG.tracking.UA_CACHE_SIZE,
+            ttl=CFG.tracking.UA_CACHE_DURATION,
+        )
+    
     def get_ip_address(self) -> str:
-        """Get client IP address, handling proxy forwarding."""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        return forwarded_for.split(",")[0].strip() if forwarded_for else request.remote_addr
+        """Get client IP address, set from the trusted proxy headers by ProxyFix."""
+        return request.remote_addr
+    
+    def capture_request(self) -> RawRequest:
+        """Captures the raw request fields without any I/O."""
+        return RawRequest(
+            ip_address=self.get_ip_address(),
+            user_agent=request.headers.get("User-Agent", ""),
+            route=request.endpoint.split(".")[-1],
+            method=request.method,
+            referrer=request.referrer or "Direct",
+            timestamp=time.time()
+        )
     
     def _is_local_dev(self, ip_address: str) -> bool:
         """Check if IP address is from local development environment."""
@@ -95,26 +170,84 @@ class RequestContext:
                 ip_address.startswith(("192.168.", "10.")))
     
     def _request_geolocation(self, ip_address: str) -> dict[str, str] | None:
-        """Request geolocation data from API with caching."""
-        try:
-            response = requests.get(
-                f"{GEOLOCATION_API_URL}/{ip_address}",
-                timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data if data.get("status") == "success" else None
-            
-        except Exception as e:
-            logger.error(f"Geolocation request failed for IP {ip_address}: {e}")
-            return None
+        """Request geolocation data from the first backend that knows the IP."""
+        for backend in self.geolocation_backends:
+            geolocation_data = backend.lookup(ip_address)
+            if geolocation_data:
+                return geolocation_data
+        return None
 
+    def _get_cached_geolocation(self, ip_address: str) -> dict[str, str] | None:
+        """Get geolocation data from the local or shared cache, or the API.
+        Failed lookups are cached as None for a shorter duration."""
+        geolocation_data = self.geolocation_cache.get(ip_address)
+        if geolocation_data is not MISSING:
+            return geolocation_data
+        
+        shared_data = None
+        if CFG.tracking.GEO_CACHE_SHARED:
+            shared_data = upstash.get_cached_geolocation(ip_address)
+        
+        if shared_data is not None:
+            geolocation_data = json.loads(shared_data)
+        else:
+            geolocation_data = self._request_geolocation(ip_address)
+        
+        ttl = GEOLOCATION_CACHE_DURATION if geolocation_data else GEOLOCATION_NEGATIVE_CACHE_DURATION
+        self.geolocation_cache.set(ip_address, geolocation_data, ttl=ttl)
+        if CFG.tracking.GEO_CACHE_SHARED and shared_data is None:
+            upstash.cache_geolocation(ip_address, json.dumps(geolocation_data), ttl)
+        return geolocation_data
+
+    async def _request_geolocation_async(self, ip_address: str) -> dict[str, str] | None:
+        """Async _request_geolocation, backends without lookup_async run in a thread."""
+        for backend in self.geolocation_backends:
+            lookup_async = getattr(backend, "lookup_async", None)
+            if lookup_async:
+                geolocation_data = await lookup_async(ip_address)
+            else:
+                geolocation_data = await asyncio.to_thread(backend.lookup, ip_address)
+            if geolocation_data:
+                return geolocation_data
+        return None
+
+    async def _get_cached_geolocation_async(self, ip_address: str) -> dict[str, str] | None:
+        """Async _get_cached_geolocation, with the async Upstash client."""
+        geolocation_data = self.geolocation_cache.get(ip_address)
+        if geolocation_data is not MISSING:
+            return geolocation_data
+        
+        shared_data = None
+        if CFG.tracking.GEO_CACHE_SHARED:
+            shared_data = await upstash.get_cached_geolocation_async(ip_address)
+        
+        if shared_data is not None:
+            geolocation_data = json.loads(shared_data)
+        else:
+            geolocation_data = await self._request_geolocation_async(ip_address)
+        
+        ttl = GEOLOCATION_CACHE_DURATION if geolocation_data else GEOLOCATION_NEGATIVE_CACHE_DURATION
+        self.geolocation_cache.set(ip_address, geolocation_data, ttl=ttl)
+        if CFG.tracking.GEO_CACHE_SHARED and shared_data is None:
+            await upstash.cache_geolocation_async(ip_address, json.dumps(geolocation_data), ttl)
+        return geolocation_data
+
+    @timed("geolocation")
     def get_geolocation(self, ip_address: str) -> GeolocationData:
         """Get geolocation data for an IP address."""
         if self._is_local_dev(ip_address):
             return GeolocationData.create_local()
-        
-        geolocation_data = self._request_geolocation(ip_address)
+        return self._to_geolocation_data(self._get_cached_geolocation(ip_address))
+
+    @timed("geolocation")
+    async def get_geolocation_async(self, ip_address: str) -> GeolocationData:
+        """Get geolocation data for an IP address without blocking the event loop."""
+        if self._is_local_dev(ip_address):
+            return GeolocationData.create_local()
+        return self._to_geolocation_data(await self._get_cached_geolocation_async(ip_address))
+
+    @staticmethod
+    def _to_geolocation_data(geolocation_data: dict[str, str] | None) -> GeolocationData:
         if geolocation_data:
             return GeolocationData(
                 country=geolocation_data.get("country", "Unknown"),
@@ -126,9 +259,28 @@ class RequestContext:
             )
         return GeolocationData.create_unknown()
 
-    def get_device_info(self) -> DeviceInfo:
-        """Get device and browser information from user agent."""
-        user_agent_string = request.headers.get("User-Agent", "")
+    @timed("user_agent")
+    def get_device_info(self, user_agent_string: str | None = None) -> DeviceInfo:
+        """Get device and browser information from user agent.
+        Parsed results are shared between requests with the same user agent."""
+        if user_agent_string is None:
+            user_agent_string = request.headers.get("User-Agent", "")
+        
+        key = user_agent_string
+        if len(key) > USER_AGENT_MAX_KEY_LENGTH:
+            key = hashlib.sha1(key.encode()).hexdigest()
+        
+        device_info = self.user_agent_cache.get(key)
+        if device_info is MISSING:
+            device_info = self._parse_user_agent(user_agent_string)
+            self.user_agent_cache.set(key, device_info)
+        return device_info
+    
+    def _parse_user_agent(self, user_agent_string: str) -> DeviceInfo:
+        """Parse user agent string into device info."""
+        # Imported on first use, loading its regex tables is the slowest import of the app
+        from user_agents import parse
+
         user_agent = parse(user_agent_string)
         return DeviceInfo(
             browser=f"{user_agent.browser.family} {user_agent.browser.version_string}",
@@ -148,55 +300,169 @@ class RequestMonitor:
     def __init__(self):
         self.context = RequestContext()
         self.storage = upstash
+        self.analytics = analytics
+        if CFG.tracking.ASYNC_MODE:
+            self.ingest = AsyncIngestQueue(
+                handler=self._store_request_async,
+                maxsize=CFG.tracking.INGEST_QUEUE_SIZE,
+                concurrency=CFG.tracking.INGEST_CONCURRENCY,
+                name="request-ingest",
+                shutdown_timeout=CFG.tracking.INGEST_SHUTDOWN_TIMEOUT,
+            )
+        else:
+            self.ingest = IngestQueue(
+                handler=self._store_request,
+                maxsize=CFG.tracking.INGEST_QUEUE_SIZE,
+                workers=CFG.tracking.INGEST_WORKERS,
+                name="request-ingest",
+                shutdown_timeout=CFG.tracking.INGEST_SHUTDOWN_TIMEOUT,
+            )
+        self.shed = 0
     
+    @timed("monitor")
     def monitor(self) -> None:
-        """Collects and saves request data."""
+        """Collects and saves request data, in the background if enabled."""
         try:
-            request_data = self.get_request_details()
-            self.storage._save_request_data(request_data)
+            # Set by the rate limiter, clients near their limit get less work done
+            load_level = g.get("load_level", LOAD_NORMAL)
+            if load_level >= LOAD_SKIP_TRACKING:
+                self.shed += 1
+                return
+
+            raw_request = self.context.capture_request()
+            raw_request.skip_geolocation = load_level >= LOAD_SKIP_GEOLOCATION
+            if CFG.tracking.ASYNC_INGEST or CFG.tracking.ASYNC_MODE:
+                self.ingest.submit(raw_request)
+            else:
+                self._store_request(raw_request)
         
         except Exception as e:
             logger.error(f"Failed to monitor request: {e}")
     
+    def _store_request(self, raw_request: RawRequest) -> None:
+        """Enriches captured request data and saves it."""
+        request_data = self.enrich_request(raw_request)
+        # Counters first, so they go out with the flush the save may trigger
+        with timed_stage("analytics"):
+            self.analytics.record(request_data)
+        self.storage._save_request_data(request_data)
+    
+    async def _store_request_async(self, raw_request: RawRequest) -> None:
+        """Enriches and saves request data on the async ingest loop."""
+        if raw_request.skip_geolocation:
+            geo_data = GeolocationData.create_unknown()
+        else:
+            geo_data = await self.context.get_geolocation_async(raw_request.ip_address)
+        request_data = self._build_request_data(raw_request, geo_data)
+        with timed_stage("analytics"):
+            self.analytics.record(request_data)
+        await self.storage.save_request_data_async(request_data)
+    
     def get_request_details(self) -> dict[str, Any]:
         """Collects request data from context."""
-        ip_address = self.context.get_ip_address()
-        geo_data = self.context.get_geolocation(ip_address)
-        device_info = self.context.get_device_info()
+        return self.enrich_request(self.context.capture_request())
+    
+    def enrich_request(self, raw_request: RawRequest) -> dict[str, Any]:
+        """Adds geolocation and device info to captured request data."""
+        if raw_request.skip_geolocation:
+            geo_data = GeolocationData.create_unknown()
+        else:
+            geo_data = self.context.get_geolocation(raw_request.ip_address)
+        return self._build_request_data(raw_request, geo_data)
+    
+    def _build_request_data(self, raw_request: RawRequest, geo_data: GeolocationData) -> dict[str, Any]:
+        """Builds the stored request entry."""
+        device_info = self.context.get_device_info(raw_request.user_agent)
         
+        import pytz
+
         cet = pytz.timezone('Europe/Amsterdam')
-        cet_time = datetime.now(cet)
+        cet_time = datetime.fromtimestamp(raw_request.timestamp, cet)
         cet_strftime = cet_time.strftime("%Y-%m-%d @ %H:%M")
         
         return {
             "timestamp": cet_strftime,
-            "ip_address": ip_address,
+            "epoch": raw_request.timestamp,
+            "ip_address": raw_request.ip_address,
             "geo_data": geo_data.to_dict(),
             "device_info": device_info.to_dict(),
             "os": device_info.os,
-            "route": request.endpoint.split(".")[-1],
-            "method": request.method,
-            "referrer": request.referrer or "Direct"
+            "route": raw_request.route,
+            "method": raw_request.method,
+            "referrer": raw_request.referrer
         }
     
-    def get_request_data(self, limit: int | None = None) -> list[dict[str, Any]] | None:
-        """Gets stored request data with optional limit."""
+    def get_request_data(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]] | None:
+        """Gets stored request data with optional limit and offset."""
         try:
-            data = self.storage._get_request_data()
-            return data[:limit] if limit and data else data
+            return self.storage._get_request_data(limit, offset)
 
         except Exception as e:
             logger.error(f"Failed to retrieve request data: {e}")
             return None
     
+    def get_request_page(self,
+                         request_filter: RequestFilter,
+                         cursor: tuple[float, int] | None = None,
+                         limit: int = 25) -> tuple[list[dict[str, Any]], tuple[float, int] | None]:
+        """Gets a page of filtered request data, newest first.
+        The cursor is (epoch, seen) of the previous page: the epoch of its
+        last scanned entry and how many scanned entries had that epoch, so
+        entries sharing an epoch across pages are neither lost nor repeated.
+        The returned cursor is None when there are no more entries."""
+        page: list[dict[str, Any]] = []
+        epoch, seen = cursor if cursor is not None else (request_filter.until, 0)
+        try:
+            for _ in range(REQUEST_PAGE_MAX_SCANS):
+                # Inclusive of epoch when entries of it were seen, those are skipped
+                before = math.nextafter(epoch, math.inf) if seen else epoch
+                count = REQUEST_PAGE_SCAN_SIZE + seen
+                chunk = self.storage._get_requests_between(before, request_filter.since, count)
+                for data in chunk[seen:]:
+                    data_epoch = data.get("epoch", 0)
+                    seen = seen + 1 if data_epoch == epoch else 1
+                    epoch = data_epoch
+                    if request_filter.matches(data):
+                        page.append(data)
+                        if len(page) == limit:
+                            return page, (epoch, seen)
+                
+                if len(chunk) < count:
+                    return page, None
+            
+            # Scan budget used up, let the client continue from here
+            return page, (epoch, seen)
+        
+        except Exception as e:
+            logger.error(f"Failed to retrieve request page: {e}")
+            return page, None
+    
+    def get_metric_samples(self) -> list[tuple[str, dict[str, str], Any]]:
+        """Gets cache, ingest and storage samples for the metrics endpoint."""
+        samples = get_cache_samples("geolocation", self.context.geolocation_cache)
+        samples += get_cache_samples("user_agent", self.context.user_agent_cache)
+        ingest = self.ingest.get_status()
+        for outcome in ("accepted", "dropped", "processed", "failed"):
+            samples.append(("tracking_ingest_items_total", {"outcome": outcome}, ingest[outcome]))
+        samples.append(("tracking_ingest_queued", {}, ingest["queued"]))
+        samples.append(("tracking_shed_requests_total", {}, self.shed))
+        return samples + self.storage.get_metric_samples()
+    
     def get_storage_status(self) -> dict[str, Any]:
         """Gets current storage connection status."""
         try:
-            return self.storage.get_connection_status()
+            status = self.storage.get_connection_status()
+            status["ingest"] = self.ingest.get_status()
+            status["geolocation_cache"] = self.context.geolocation_cache.get_stats()
+            status["user_agent_cache"] = self.context.user_agent_cache.get_stats()
+            status["shed_requests"] = self.shed
+            status["rate_limiter"] = get_limiter().get_status()
+            status["timings"] = timings.get_summary()
+            return status
         
         except Exception as e:
             logger.error(f"Failed to get storage status: {e}")
             return {"status": "error", "message": str(e)}
 
 
-request_monitor = RequestMonitor()
+request_monitor = LazyObject(RequestMonitor)
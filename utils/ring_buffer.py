@@ -0,0 +1,148 @@
+import sys
+import threading
+
+from typing import Any, Final, Iterator
+
+
+FLAG_MOBILE: Final = 1
+FLAG_TABLET: Final = 2
+FLAG_PC: Final = 4
+FLAG_BOT: Final = 8
+DEVICE_FLAGS: Final = {
+    "is_mobile": FLAG_MOBILE,
+    "is_tablet": FLAG_TABLET,
+    "is_pc": FLAG_PC,
+    "is_bot": FLAG_BOT,
+}
+GEO_FIELDS: Final = ("country", "country_code", "city", "region", "isp", "timezone")
+
+
+def _intern(value: Any) -> str:
+    """Interns repeated strings, so equal values share one object."""
+    return sys.intern(value) if isinstance(value, str) else str(value)
+
+
+class RequestRecord:
+    """Compact stored request, see RequestMonitor.enrich_request for the dict shape."""
+    __slots__ = (
+        "timestamp", "epoch", "ip_address",
+        "country", "country_code", "city", "region", "isp", "timezone",
+        "browser", "os", "device", "flags", "raw_user_agent",
+        "route", "method", "referrer",
+    )
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'RequestRecord':
+        record = cls()
+        geo_data = data.get("geo_data") or {}
+        device_info = data.get("device_info") or {}
+        record.timestamp = _intern(data.get("timestamp", ""))
+        record.epoch = float(data.get("epoch", 0))
+        record.ip_address = _intern(data.get("ip_address", ""))
+        for field in GEO_FIELDS:
+            setattr(record, field, _intern(geo_data.get(field, "Unknown")))
+        record.browser = _intern(device_info.get("browser", "Unknown"))
+        record.os = _intern(device_info.get("os", data.get("os", "Unknown")))
+        record.device = _intern(device_info.get("device", "Unknown"))
+        record.flags = sum(flag for key, flag in DEVICE_FLAGS.items() if device_info.get(key))
+        record.raw_user_agent = _intern(device_info.get("raw_user_agent", ""))
+        record.route = _intern(data.get("route", ""))
+        record.method = _intern(data.get("method", ""))
+        record.referrer = _intern(data.get("referrer", "Direct"))
+        return record
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "timestamp": self.timestamp,
+            "epoch": self.epoch,
+            "ip_address": self.ip_address,
+            "geo_data": {field: getattr(self, field) for field in GEO_FIELDS},
+            "device_info": {
+                "browser": self.browser,
+                "os": self.os,
+                "device": self.device,
+                **{key: bool(self.flags & flag) for key, flag in DEVICE_FLAGS.items()},
+                "raw_user_agent": self.raw_user_agent,
+            },
+            "os": self.os,
+            "route": self.route,
+            "method": self.method,
+            "referrer": self.referrer,
+        }
+
+
+class RequestRingBuffer:
+    """Fixed-capacity ring of RequestRecords sorted by epoch, overwriting the
+    oldest entry when full."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.slots: list[RequestRecord | None] = [None] * self.capacity
+        self.head = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, data: dict[str, Any]) -> None:
+        """Stores an entry, in O(1) when it is the newest."""
+        record = RequestRecord.from_dict(data)
+        with self.lock:
+            self._insert(record)
+
+    def extend(self, data_list: list[dict[str, Any]]) -> None:
+        records = [RequestRecord.from_dict(data) for data in data_list]
+        with self.lock:
+            for record in records:
+                self._insert(record)
+
+    def _insert(self, record: RequestRecord) -> None:
+        """Writes record over the oldest slot and moves it back past newer records.
+        Ingest threads and failed flushes append out of order, but only by a few slots."""
+        position = self.head
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        for _ in range(self.size - 1):
+            previous = (position - 1) % self.capacity
+            if self.slots[previous].epoch <= record.epoch:
+                break
+            self.slots[position] = self.slots[previous]
+            position = previous
+        self.slots[position] = record
+
+    def clear(self) -> None:
+        with self.lock:
+            self.slots = [None] * self.capacity
+            self.head = 0
+            self.size = 0
+
+    def newest_first(self, offset: int = 0) -> Iterator[RequestRecord]:
+        """Iterates records newest first by epoch, without copying the buffer."""
+        head, size, slots = self.head, self.size, self.slots
+        for index in range(offset, size):
+            record = slots[(head - 1 - index) % self.capacity]
+            if record is not None:
+                yield record
+
+    def latest(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]]:
+        """Gets entries as dicts, newest first."""
+        data_list = []
+        for record in self.newest_first(offset):
+            data_list.append(record.to_dict())
+            if limit and len(data_list) == limit:
+                break
+        return data_list
+
+    def between(self, before: float | None, since: float | None, count: int) -> list[dict[str, Any]]:
+        """Gets up to count entries with since <= epoch < before, newest first."""
+        data_list = []
+        for record in self.newest_first():
+            if before is not None and record.epoch >= before:
+                continue
+            if since is not None and record.epoch < since:
+                break
+            data_list.append(record.to_dict())
+            if len(data_list) == count:
+                break
+        return data_list
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,62 @@
+import argparse
+import subprocess
+import sys
+import time
+
+from collections import defaultdict
+from typing import Final
+
+
+DEFAULT_MODULE: Final = "run"
+DEFAULT_TOP: Final = 25
+
+
+def get_import_times(module: str) -> list[tuple[str, int, int]]:
+    """Imports module in a fresh interpreter with -X importtime, returns
+    (module, self microseconds, cumulative microseconds) per imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def get_package_times(times: list[tuple[str, int, int]]) -> dict[str, int]:
+    """Sums the self time of all modules per top-level package."""
+    packages: dict[str, int] = defaultdict(int)
+    for name, self_us, _ in times:
+        packages[name.split(".")[0]] += self_us
+    return dict(packages)
+
+
+def report(module: str = DEFAULT_MODULE, top: int = DEFAULT_TOP) -> None:
+    """Prints the slowest packages to import and the total startup time."""
+    started_at = time.perf_counter()
+    times = get_import_times(module)
+    wall_ms = (time.perf_counter() - started_at) * 1000
+
+    packages = sorted(get_package_times(times).items(), key=lambda item: item[1], reverse=True)
+    total_us = sum(self_us for _, self_us in packages)
+    print(f"{'package':<32} {'ms':>9} {'share':>7}")
+    for name, self_us in packages[:top]:
+        print(f"{name:<32} {self_us / 1000:>9.1f} {self_us / total_us:>7.1%}")
+    print(f"{len(times)} modules in {len(packages)} packages, "
+          f"imports {total_us / 1000:.1f} ms, process {wall_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time per package at startup")
+    parser.add_argument("module", nargs="?", default=DEFAULT_MODULE, help="Module to import, defaults to run")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Number of packages to show")
+    args = parser.parse_args()
+    report(args.module, args.top)
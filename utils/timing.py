@@ -0,0 +1,163 @@
+import asyncio
+import bisect
+import functools
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+from flask import g, has_request_context
+from typing import Any, Callable, Final, Iterator
+
+from utils.config import CFG
+
+
+# Upper bounds in milliseconds, the last bucket holds everything slower
+BUCKET_BOUNDS: Final = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"),
+)
+PERCENTILES: Final = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, percentiles are interpolated in their bucket."""
+
+    def __init__(self, bounds: tuple[float, ...] = BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = min(self.bounds[index], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        """Counts per bucket of BUCKET_BOUNDS, as stored by utils.metrics."""
+        return {"counts": list(self.counts), "sum": self.total, "count": self.count}
+
+    def get_summary(self) -> dict[str, float]:
+        summary = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+        }
+        for q in PERCENTILES:
+            summary[f"p{round(q * 100)}_ms"] = round(self.percentile(q), 3)
+        return summary
+
+
+class TimingRegistry:
+    """Latency histograms per stage of this process."""
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, duration_ms: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(duration_ms)
+
+    def get_summary(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            return {stage: histogram.get_summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def get_histograms(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            return {stage: histogram.to_dict() for stage, histogram in self.histograms.items()}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+
+
+timings = TimingRegistry()
+
+
+def start_request_timing() -> None:
+    """Decides once per request whether its stages are timed."""
+    g.timing_sampled = random.random() < CFG.server.TIMING_SAMPLE_RATE
+    g.timing_stages = []
+    g.timing_started_at = time.perf_counter()
+
+
+def is_sampled() -> bool:
+    """Requests are sampled as a whole, background work per stage."""
+    if has_request_context():
+        return g.get("timing_sampled", False)
+    return random.random() < CFG.server.TIMING_SAMPLE_RATE
+
+
+def record(stage: str, duration_ms: float) -> None:
+    timings.observe(stage, duration_ms)
+    if has_request_context() and "timing_stages" in g:
+        g.timing_stages.append((stage, duration_ms))
+
+
+def get_request_stages() -> list[tuple[str, float]]:
+    """Gets (stage, ms) of the current request, repeated stages summed, with the total."""
+    stages: dict[str, float] = {}
+    for stage, duration_ms in g.get("timing_stages", []):
+        stages[stage] = stages.get(stage, 0.0) + duration_ms
+    stages["total"] = (time.perf_counter() - g.timing_started_at) * 1000
+    return list(stages.items())
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Times a block as stage, when sampled."""
+    if not is_sampled():
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, (time.perf_counter() - started_at) * 1000)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator that times a sync or async function as stage, when sampled."""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                if not is_sampled():
+                    return await func(*args, **kwargs)
+                started_at = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(stage, (time.perf_counter() - started_at) * 1000)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            if not is_sampled():
+                return func(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, (time.perf_counter() - started_at) * 1000)
+        return wrapper
+    return decorator
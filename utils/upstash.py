@@ -1,28 +1,63 @@
+import asyncio
+import atexit
 import json
 import os
-import pytz
+import threading
+import time
 
+from collections import Counter, deque
 from datetime import datetime
-from typing import Any, Final
-from upstash_redis import Redis
+from typing import TYPE_CHECKING, Any, Final
 
+from utils.circuit_breaker import CircuitOpenError
+from utils.config import CFG
+from utils.file_storage import RequestLogFile
+from utils.lazy import LazyObject
+from utils.ring_buffer import RequestRingBuffer
+from utils.timing import timed
 from utils.logger import logger
 
+if TYPE_CHECKING:
+    from upstash_redis import Redis
+    from upstash_redis.asyncio import Redis as AsyncRedis
+
 
 REDIS_EXPIRATION_DURATION: Final = 30 * 24 * 3600  # 30 days in seconds
 KEEP_LAST_N_ENTRIES: Final = 200
 MAX_REQUEST_ITEMS: Final = 100
 REQUEST_PREFIX: Final = "requests_"
+REQUEST_LOG_KEY: Final = "request_log"
+REQUEST_LOG_MIGRATED_KEY: Final = "request_log_migrated"
 USERS_PREFIX: Final = "users_"
+GEOLOCATION_PREFIX: Final = "geo_"
 
 
 class Upstash:
     """Handles all data storage operations."""
     def __init__(self):
-        self.redis: Redis = None
-        self.requests_memory: list[dict[str, Any]] = []
+        self.redis: 'Redis' = None
+        self.async_redis: 'AsyncRedis | None' = None
+        self.async_redis_pid: int | None = None
+        self.requests_memory = RequestRingBuffer(CFG.tracking.MEMORY_CAPACITY)
         self.users_memory: dict[str, dict[str, str]] = {}
+        self.write_buffer: list[dict[str, Any]] = []
+        self.counter_buffer: dict[str, Counter] = {}
+        self.counter_ttls: dict[str, int] = {}
+        self.counters_memory: dict[str, Counter] = {}
+        self.counters_memory_expiry: dict[str, float] = {}
+        # Writes that failed to reach Redis, replayed with the next flush
+        self.replay_buffer: deque[dict[str, Any]] = deque(maxlen=CFG.tracking.REPLAY_CAPACITY)
+        self.replay_counters: dict[str, Counter] = {}
+        self.replay_ttls: dict[str, int] = {}
+        # Operations served by a local fallback, per operation
+        self.fallbacks: Counter = Counter()
+        self.write_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flusher_pid: int | None = None
+        self.request_log: RequestLogFile | None = None
         self._init_redis()
+        if self.redis is None:
+            self._init_request_log()
         if self.redis is None:
             self.users_memory = {"test": "test"}
     
@@ -33,8 +68,16 @@ class Upstash:
         
         if redis_url and redis_token:
             try:
-                self.redis = Redis(url=redis_url, token=redis_token)
+                from upstash_redis import Redis
+                from utils.http_client import ProcessLocalClient, get_http_client
+
+                # Retries with jitter are done by the shared client, only for commands that were not sent
+                self.redis = Redis(url=redis_url, token=redis_token, rest_retries=0)
+                self._use_http_client(self.redis, ProcessLocalClient(get_http_client))
                 logger.info("Connected to Upstash Redis")
+                # One-off, so startup does not wait for its round-trips
+                threading.Thread(target=self._migrate_legacy_requests, name="upstash-migration", daemon=True).start()
+                atexit.register(self.flush_request_data)
             
             except Exception as e:
                 logger.error(f"Failed to connect to Upstash Redis: {e}")
@@ -42,21 +85,87 @@ class Upstash:
         else:
             logger.info("No Redis credentials found, using in-memory storage")
     
+    def _init_request_log(self) -> None:
+        """Initializes the local request log if a directory is configured."""
+        if not CFG.tracking.LOG_DIR:
+            return
+        try:
+            self.request_log = RequestLogFile(
+                CFG.tracking.LOG_DIR,
+                rotate_bytes=CFG.tracking.LOG_ROTATE_BYTES,
+                max_segments=CFG.tracking.LOG_MAX_SEGMENTS,
+                flush_interval=CFG.tracking.LOG_FLUSH_INTERVAL,
+            )
+            atexit.register(self.request_log.close)
+            logger.info(f"Using request log in {CFG.tracking.LOG_DIR}")
+        
+        except Exception as e:
+            logger.error(f"Failed to open request log in {CFG.tracking.LOG_DIR}: {e}")
+            self.request_log = None
+    
+    @timed("upstash.save")
     def _save_request_data(self, data: dict[str, Any]) -> None:
-        """Saves data to Redis or memory fallback."""
+        """Saves data to Redis, file or memory fallback."""
         if self.redis:
             self._save_request_data_to_redis(data)
+        elif self.request_log:
+            self._save_request_data_to_file(data)
         else:
             self._save_request_data_to_memory(data)
     
-    def _get_request_data(self, limit: int = None) -> list[dict[str, Any]] | None:
-        """Gets data from Redis or memory fallback."""
-        # We can ignore limit since cleanup ensures we never have too many entries
+    @timed("upstash.save")
+    async def save_request_data_async(self, data: dict[str, Any]) -> None:
+        """Saves data like _save_request_data, flushing to Redis without blocking the loop."""
+        if not self.redis:
+            # The request log writes files, so it runs in a thread
+            await asyncio.to_thread(self._save_request_data, data)
+            return
+
+        if self._buffer_request_data(data):
+            await self.flush_request_data_async()
+        else:
+            self._ensure_flusher()
+    
+    @timed("upstash.get_requests")
+    def _get_request_data(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]] | None:
+        """Gets data from Redis, file or memory fallback, newest first."""
         if self.redis:
-            return self._get_requests_from_redis(REQUEST_PREFIX)
+            return self._get_requests_from_redis(limit, offset)
+        elif self.request_log:
+            return self._get_requests_from_file(limit, offset)
         else:
-            return self._get_requests_from_memory()
+            return self._get_requests_from_memory(limit, offset)
     
+    @timed("upstash.get_requests")
+    def _get_requests_between(self,
+                              before: float | None,
+                              since: float | None,
+                              count: int) -> list[dict[str, Any]]:
+        """Gets up to count entries with since <= epoch < before, newest first."""
+        if self.redis:
+            return self._get_requests_between_from_redis(before, since, count)
+        elif self.request_log:
+            return self._get_requests_between_from_file(before, since, count)
+        else:
+            return self._get_requests_between_from_memory(before, since, count)
+    
+    @timed("upstash.increment_counters")
+    def increment_counters(self, key: str, fields: dict[str, int], ttl: int) -> None:
+        """Increments hash counters in Redis (buffered) or memory fallback."""
+        if self.redis:
+            self._increment_counters_in_redis(key, fields, ttl)
+        else:
+            self._increment_counters_in_memory({key: Counter(fields)}, {key: ttl})
+    
+    @timed("upstash.get_counters")
+    def get_counters(self, keys: list[str]) -> dict[str, dict[str, int]]:
+        """Gets hash counters from Redis or memory fallback."""
+        if self.redis:
+            return self._get_counters_from_redis(keys)
+        else:
+            return self._get_counters_from_memory(keys)
+    
+    @timed("upstash.add_user")
     def add_user(self, username: str, password: str) -> None:
         """Adds user to Redis or memory fallback"""
         if self.redis:
@@ -64,6 +173,7 @@ class Upstash:
         else:
             self._add_user_to_memory(username, password)
     
+    @timed("upstash.get_user")
     def get_user(self, username: str) -> str | None:
         """Gets user from Redis or memory fallback"""
         if self.redis:
@@ -71,57 +181,371 @@ class Upstash:
         else:
             return self._get_user_from_memory(username)
     
+    @timed("upstash.get_geolocation")
+    def get_cached_geolocation(self, ip_address: str) -> str | None:
+        """Gets serialized geolocation shared between workers, if any."""
+        if not self.redis:
+            return None
+        try:
+            return self.redis.get(f"{GEOLOCATION_PREFIX}{ip_address}")
+        
+        except Exception as e:
+            logger.error(f"Error fetching geolocation from Redis: {e}")
+            return None
+    
+    @timed("upstash.get_geolocation")
+    async def get_cached_geolocation_async(self, ip_address: str) -> str | None:
+        """Async get_cached_geolocation, for the async ingest loop."""
+        if not self.redis:
+            return None
+        try:
+            return await self.get_async_redis().get(f"{GEOLOCATION_PREFIX}{ip_address}")
+        
+        except Exception as e:
+            logger.error(f"Error fetching geolocation from Redis: {e}")
+            return None
+    
+    @timed("upstash.cache_geolocation")
+    def cache_geolocation(self, ip_address: str, value: str, ttl: int) -> None:
+        """Shares serialized geolocation between workers."""
+        if not self.redis:
+            return
+        try:
+            self.redis.set(f"{GEOLOCATION_PREFIX}{ip_address}", value, ex=ttl)
+        
+        except Exception as e:
+            logger.error(f"Error caching geolocation in Redis: {e}")
+    
+    @timed("upstash.cache_geolocation")
+    async def cache_geolocation_async(self, ip_address: str, value: str, ttl: int) -> None:
+        """Async cache_geolocation, for the async ingest loop."""
+        if not self.redis:
+            return
+        try:
+            await self.get_async_redis().set(f"{GEOLOCATION_PREFIX}{ip_address}", value, ex=ttl)
+        
+        except Exception as e:
+            logger.error(f"Error caching geolocation in Redis: {e}")
+    
+    def get_async_redis(self) -> 'AsyncRedis':
+        """Gets the async client, created per process as it holds an async HTTP client."""
+        if self.async_redis_pid != os.getpid():
+            from upstash_redis.asyncio import Redis as AsyncRedis
+            from utils.http_client import ProcessLocalClient, get_async_http_client
+
+            self.async_redis = AsyncRedis(
+                url=os.getenv("UPSTASH_REDIS_REST_URL"),
+                token=os.getenv("UPSTASH_REDIS_REST_TOKEN"),
+                rest_retries=0,
+            )
+            self._use_http_client(self.async_redis, ProcessLocalClient(get_async_http_client))
+            self.async_redis_pid = os.getpid()
+        return self.async_redis
+    
+    @staticmethod
+    def _use_http_client(redis, client) -> None:
+        """Replaces the client's own unpooled httpx client by the shared one.
+        upstash_redis has no option for this, so its private attribute is set."""
+        http = getattr(redis, "_http", None)
+        if http is None or not hasattr(http, "_client"):
+            logger.warning("Upstash client has no HTTP client to replace, using its own")
+            return
+        # Closes the client built by Redis(...), it has not sent anything yet
+        previous = http._client
+        if hasattr(previous, "aclose"):
+            try:
+                asyncio.get_running_loop().create_task(previous.aclose())
+            except RuntimeError:
+                asyncio.run(previous.aclose())
+        else:
+            previous.close()
+        http._client = client
+    
     def _save_request_data_to_redis(self, data: dict[str, Any]) -> None:
-        """Saves data to Redis."""
+        """Buffers data for Redis, flushing when the buffer is full or stale."""
+        if self._buffer_request_data(data):
+            self.flush_request_data()
+        else:
+            self._ensure_flusher()
+    
+    def _buffer_request_data(self, data: dict[str, Any]) -> bool:
+        """Buffers data for Redis, returns whether the buffer should be flushed."""
+        with self.write_lock:
+            self.write_buffer.append(data)
+            return (
+                len(self.write_buffer) >= CFG.tracking.WRITE_BUFFER_SIZE
+                or time.monotonic() - self.last_flush >= CFG.tracking.WRITE_FLUSH_INTERVAL
+            )
+    
+    def _increment_counters_in_redis(self, key: str, fields: dict[str, int], ttl: int) -> None:
+        """Buffers counter increments, they are sent with the next flush."""
+        with self.write_lock:
+            self.counter_buffer.setdefault(key, Counter()).update(fields)
+            self.counter_ttls[key] = ttl
+        self._ensure_flusher()
+    
+    @timed("upstash.flush")
+    def flush_request_data(self) -> None:
+        """Writes buffered data and counters to Redis in one round-trip,
+        together with the writes kept for replay after earlier failures."""
+        batch, counters, ttls = self._take_write_buffers()
+        replay = self._take_replay_buffers()
+        if not batch and not counters and not replay[0] and not replay[1]:
+            return
+        
+        try:
+            pipeline = self.redis.pipeline()
+            self._queue_flush_commands(pipeline, *self._merge_writes((batch, counters, ttls), replay))
+            pipeline.exec()
+            self._log_replayed(replay)
+
+        except Exception as e:
+            self._keep_failed_writes(e, (batch, counters, ttls), replay)
+    
+    @timed("upstash.flush")
+    async def flush_request_data_async(self) -> None:
+        """Async flush_request_data, for the async ingest loop."""
+        batch, counters, ttls = self._take_write_buffers()
+        replay = self._take_replay_buffers()
+        if not batch and not counters and not replay[0] and not replay[1]:
+            return
+        
         try:
-            # Get current time in CET
-            cet = pytz.timezone('Europe/Amsterdam')
-            cet_time = datetime.now(cet)
-            key = f"{REQUEST_PREFIX}{cet_time.isoformat()}"
-            self.redis.set(key, json.dumps(data))
-            self._cleanup_old_redis_entries(REQUEST_PREFIX)
+            pipeline = self.get_async_redis().pipeline()
+            self._queue_flush_commands(pipeline, *self._merge_writes((batch, counters, ttls), replay))
+            await pipeline.exec()
+            self._log_replayed(replay)
 
         except Exception as e:
-            logger.error(f"Error saving to Redis: {e}")
-            self.requests_memory.append(data)
+            self._keep_failed_writes(e, (batch, counters, ttls), replay)
+    
+    def _take_replay_buffers(self) -> tuple[list[dict[str, Any]], dict[str, Counter], dict[str, int]]:
+        """Empties the replay buffers, returns (entries, counters, counter ttls)."""
+        with self.write_lock:
+            batch = list(self.replay_buffer)
+            self.replay_buffer.clear()
+            counters, self.replay_counters = self.replay_counters, {}
+            ttls, self.replay_ttls = self.replay_ttls, {}
+        return batch, counters, ttls
+    
+    @staticmethod
+    def _merge_writes(*writes: tuple[list, dict[str, Counter], dict[str, int]]
+                      ) -> tuple[list[dict[str, Any]], dict[str, Counter], dict[str, int]]:
+        """Merges (entries, counters, counter ttls) tuples into one."""
+        batch, counters, ttls = [], {}, {}
+        for write_batch, write_counters, write_ttls in writes:
+            batch.extend(write_batch)
+            for key, fields in write_counters.items():
+                counters.setdefault(key, Counter()).update(fields)
+            ttls.update(write_ttls)
+        return batch, counters, ttls
+    
+    def _keep_failed_writes(self, error: Exception, new: tuple, replay: tuple) -> None:
+        """Keeps writes that failed for replay. New entries are also kept in memory,
+        so they can be read while Redis is unreachable.
+
+        Entries are re-added with ZADD of the same member, so replaying them is safe.
+        Counters are only replayed when the flush cannot have reached Redis, after
+        other errors it may have been applied and they are dropped instead."""
+        # Imported here, httpx is only loaded once Redis is used
+        from utils.http_client import NOT_SENT_ERRORS
+
+        batch, counters, ttls = new
+        if not isinstance(error, CircuitOpenError):
+            logger.error(f"Error saving {len(batch)} entries and {len(counters)} counters to Redis: {error}")
+        self.fallbacks["flush"] += 1
+        self.requests_memory.extend(batch)
+        self._increment_counters_in_memory(counters, ttls)
+        
+        batch, counters, ttls = self._merge_writes(replay, new)
+        if not isinstance(error, (*NOT_SENT_ERRORS, CircuitOpenError)) and counters:
+            logger.warning(f"Dropped {len(counters)} counters that may have reached Redis")
+            self.fallbacks["counters_dropped"] += 1
+            counters, ttls = {}, {}
+        with self.write_lock:
+            # Entries are scored by epoch, so the order does not matter; when full the oldest are dropped
+            self.replay_buffer.extend(batch)
+            for key, fields in counters.items():
+                self.replay_counters.setdefault(key, Counter()).update(fields)
+            self.replay_ttls.update(ttls)
+        # Retried by the flusher, also when no new writes come in
+        self._ensure_flusher()
+    
+    @staticmethod
+    def _log_replayed(replay: tuple) -> None:
+        batch, counters, _ = replay
+        if batch or counters:
+            logger.info(f"Replayed {len(batch)} entries and {len(counters)} counters to Redis")
+    
+    def _take_write_buffers(self) -> tuple[list[dict[str, Any]], dict[str, Counter], dict[str, int]]:
+        """Empties the write buffers, returns (entries, counters, counter ttls)."""
+        with self.write_lock:
+            batch, self.write_buffer = self.write_buffer, []
+            counters, self.counter_buffer = self.counter_buffer, {}
+            ttls, self.counter_ttls = self.counter_ttls, {}
+            self.last_flush = time.monotonic()
+        return batch, counters, ttls
+    
+    @staticmethod
+    def _queue_flush_commands(pipeline, batch: list[dict[str, Any]],
+                              counters: dict[str, Counter], ttls: dict[str, int]) -> None:
+        """Queues the writes of a flush on a sync or async pipeline."""
+        now = time.time()
+        if batch:
+            pipeline.zadd(REQUEST_LOG_KEY, {json.dumps(data): data.get("epoch", now) for data in batch})
+            pipeline.zremrangebyrank(REQUEST_LOG_KEY, 0, -(KEEP_LAST_N_ENTRIES + 1))
+            pipeline.zremrangebyscore(REQUEST_LOG_KEY, "-inf", now - REDIS_EXPIRATION_DURATION)
+        for key, fields in counters.items():
+            for field, amount in fields.items():
+                pipeline.hincrby(key, field, amount)
+            pipeline.expire(key, ttls[key])
+    
+    def _ensure_flusher(self) -> None:
+        """Starts the interval flush thread, once per process."""
+        if self.flusher_pid == os.getpid():
+            return
+        
+        with self.write_lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_periodically, name="upstash-flusher", daemon=True).start()
+    
+    def _flush_periodically(self) -> None:
+        """Flushes buffered data at least every WRITE_FLUSH_INTERVAL seconds."""
+        while True:
+            time.sleep(CFG.tracking.WRITE_FLUSH_INTERVAL)
+            try:
+                self.flush_request_data()
+            except Exception as e:
+                logger.error(f"Error flushing Redis write buffer: {e}")
     
     def _save_request_data_to_memory(self, data: dict[str, Any]) -> None:
         """Saves data to memory storage."""
         self.requests_memory.append(data)
-        if len(self.requests_memory) > KEEP_LAST_N_ENTRIES:
-            self.requests_memory = self.requests_memory[KEEP_LAST_N_ENTRIES//2:]
     
-    def _get_requests_from_redis(self, key_prefix: str) -> list[dict[str, Any]] | None:
-        """Gets data from Redis, sorted by timestamp."""
+    def _save_request_data_to_file(self, data: dict[str, Any]) -> None:
+        """Saves data to the local request log."""
         try:
-            # Get all keys (we know it won't be more than KEEP_LAST_N_ENTRIES)
-            keys = self.redis.keys(f"{key_prefix}*")
-            if not keys:
+            self.request_log.append(data)
+        
+        except Exception as e:
+            logger.error(f"Error saving to request log: {e}")
+            self.fallbacks["request_log"] += 1
+            self._save_request_data_to_memory(data)
+    
+    def _get_requests_from_redis(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]] | None:
+        """Gets a page of data from Redis, newest first."""
+        try:
+            self.flush_request_data()
+            stop = offset + limit - 1 if limit else -1
+            values = self.redis.zrange(REQUEST_LOG_KEY, offset, stop, rev=True)
+            if not values:
                 return None
-            
-            # Sort keys newest first
-            sorted_keys = sorted(keys, reverse=True)
-            
-            # Get all values at once
-            values = self.redis.mget(*sorted_keys)
-            
-            # Process results
-            data_list = []
-            for value in values:
-                if value:
-                    data_list.append(json.loads(value))
-            
-            return data_list
+            return [json.loads(value) for value in values]
         
         except Exception as e:
             logger.error(f"Error fetching from Redis: {e}")
-            return self._get_requests_from_memory()
+            self.fallbacks["get_requests"] += 1
+            return self._get_requests_from_memory(limit, offset)
     
-    def _get_requests_from_memory(self) -> list[dict[str, Any]] | None:
+    def _get_requests_from_memory(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]] | None:
         """Gets data from memory storage"""
-        if not self.requests_memory:
-            return None
-        return list(reversed(self.requests_memory))  # newest first
+        return self.requests_memory.latest(limit, offset) or None
+    
+    def _get_requests_from_file(self, limit: int | None = None, offset: int = 0) -> list[dict[str, Any]] | None:
+        """Gets data from the local request log, newest first."""
+        try:
+            return self.request_log.latest(limit, offset) or None
+        
+        except Exception as e:
+            logger.error(f"Error reading request log: {e}")
+            self.fallbacks["get_requests"] += 1
+            return self._get_requests_from_memory(limit, offset)
+    
+    def _get_requests_between_from_file(self,
+                                        before: float | None,
+                                        since: float | None,
+                                        count: int) -> list[dict[str, Any]]:
+        """Gets entries from the local request log by epoch range, newest first."""
+        try:
+            return self.request_log.between(before, since, count)
+        
+        except Exception as e:
+            logger.error(f"Error reading request log range: {e}")
+            self.fallbacks["get_requests"] += 1
+            return self._get_requests_between_from_memory(before, since, count)
+    
+    def _get_requests_between_from_redis(self,
+                                         before: float | None,
+                                         since: float | None,
+                                         count: int) -> list[dict[str, Any]]:
+        """Gets entries from Redis by score range, newest first."""
+        try:
+            self.flush_request_data()
+            values = self.redis.zrange(
+                REQUEST_LOG_KEY,
+                f"({before}" if before is not None else "+inf",
+                since if since is not None else "-inf",
+                sortby="BYSCORE",
+                rev=True,
+                offset=0,
+                count=count,
+            )
+            return [json.loads(value) for value in values]
+        
+        except Exception as e:
+            logger.error(f"Error fetching range from Redis: {e}")
+            self.fallbacks["get_requests"] += 1
+            return self._get_requests_between_from_memory(before, since, count)
+    
+    def _get_requests_between_from_memory(self,
+                                          before: float | None,
+                                          since: float | None,
+                                          count: int) -> list[dict[str, Any]]:
+        """Gets entries from memory by epoch range, newest first."""
+        return self.requests_memory.between(before, since, count)
+    
+    def _increment_counters_in_memory(self, counters: dict[str, Counter], ttls: dict[str, int]) -> None:
+        """Increments counters in memory storage, dropping expired hashes.
+        Ingest threads increment concurrently, so this runs under the write lock."""
+        now = time.time()
+        with self.write_lock:
+            for key, fields in counters.items():
+                if key not in self.counters_memory:
+                    self._prune_memory_counters(now)
+                self.counters_memory.setdefault(key, Counter()).update(fields)
+                self.counters_memory_expiry[key] = now + ttls[key]
+    
+    def _prune_memory_counters(self, now: float) -> None:
+        """Removes expired counter hashes from memory storage, under the write lock."""
+        expired = [key for key, expires_at in self.counters_memory_expiry.items() if expires_at <= now]
+        for key in expired:
+            self.counters_memory.pop(key, None)
+            self.counters_memory_expiry.pop(key, None)
+    
+    def _get_counters_from_redis(self, keys: list[str]) -> dict[str, dict[str, int]]:
+        """Gets hash counters from Redis in one round-trip."""
+        try:
+            self.flush_request_data()
+            pipeline = self.redis.pipeline()
+            for key in keys:
+                pipeline.hgetall(key)
+            results = pipeline.exec()
+            return {
+                key: {field: int(value) for field, value in (result or {}).items()}
+                for key, result in zip(keys, results)
+            }
+        
+        except Exception as e:
+            logger.error(f"Error fetching counters from Redis: {e}")
+            self.fallbacks["get_counters"] += 1
+            return self._get_counters_from_memory(keys)
+    
+    def _get_counters_from_memory(self, keys: list[str]) -> dict[str, dict[str, int]]:
+        """Gets hash counters from memory storage."""
+        with self.write_lock:
+            return {key: dict(self.counters_memory.get(key, {})) for key in keys}
     
     def _get_user_from_redis(self, username: str) -> str | None:
         """Gets user from Redis"""
@@ -131,6 +555,7 @@ class Upstash:
         
         except Exception as e:
             logger.error(f"Error fetching user from Redis: {e}")
+            self.fallbacks["get_user"] += 1
             return self._get_user_from_memory(username)
     
     def _get_user_from_memory(self, username: str) -> str | None:
@@ -149,34 +574,54 @@ class Upstash:
         
         except Exception as e:
             logger.error(f"Error adding user to Redis: {e}")
+            self.fallbacks["add_user"] += 1
             self._add_user_to_memory(username, password)
     
     def _add_user_to_memory(self, username: str, password: str) -> None:
         """Adds user to memory storage"""
         self.users_memory[username] = password
     
-    def _cleanup_old_redis_entries(self, key_prefix: str) -> None:
-        """Cleans up old Redis entries"""
+    def _migrate_legacy_requests(self) -> None:
+        """Moves per-key requests_<timestamp> entries into the request log, once."""
         try:
-            keys = self.redis.keys(f"{key_prefix}*")
-            if len(keys) > KEEP_LAST_N_ENTRIES:
-                sorted_keys = sorted(keys)
-                keys_to_delete = sorted_keys[:-KEEP_LAST_N_ENTRIES//2]
-                removed_keys = self.redis.delete(*keys_to_delete)
-                logger.info(f"Cleaned up {removed_keys} old Redis entries")
+            if self.redis.exists(REQUEST_LOG_MIGRATED_KEY):
+                return
+            
+            keys = self.redis.keys(f"{REQUEST_PREFIX}*")
+            if not keys:
+                self.redis.set(REQUEST_LOG_MIGRATED_KEY, int(time.time()))
+                return
+            
+            pipeline = self.redis.pipeline()
+            for key, value in zip(keys, self.redis.mget(*keys)):
+                if not value:
+                    continue
+                data = json.loads(value)
+                data.setdefault("epoch", datetime.fromisoformat(key[len(REQUEST_PREFIX):]).timestamp())
+                pipeline.zadd(REQUEST_LOG_KEY, {json.dumps(data): data["epoch"]})
+            pipeline.zremrangebyrank(REQUEST_LOG_KEY, 0, -(KEEP_LAST_N_ENTRIES + 1))
+            pipeline.delete(*keys)
+            pipeline.set(REQUEST_LOG_MIGRATED_KEY, int(time.time()))
+            pipeline.exec()
+            logger.info(f"Migrated {len(keys)} legacy request entries to {REQUEST_LOG_KEY}")
         
         except Exception as e:
-            logger.error(f"Error during Redis cleanup: {e}")
+            logger.error(f"Error migrating legacy request entries: {e}")
     
     def clear_request_data(self) -> None:
-        """Clears request data from Redis"""
+        """Clears request data from Redis and memory"""
         try:
-            keys = self.redis.keys(f"{REQUEST_PREFIX}*")
-            if keys:
-                removed_count = self.redis.delete(*keys)
-                logger.info(f"Cleared {removed_count} request entries from Redis")
+            if self.redis:
+                with self.write_lock:
+                    self.write_buffer = []
+                self.redis.delete(REQUEST_LOG_KEY)
+                logger.info("Cleared request entries from Redis")
             
-            self.requests_memory = []
+            if self.request_log:
+                self.request_log.clear()
+                logger.info("Cleared request log files")
+            
+            self.requests_memory.clear()
             
         except Exception as e:
             logger.error(f"Error clearing request data: {e}")
@@ -184,11 +629,35 @@ class Upstash:
     
     def get_connection_status(self) -> dict[str, Any]:
         """Gets current storage connection status"""
+        from utils.http_client import get_circuit_breakers_status
+
         return {
             "redis_connected": self.redis is not None,
             "memory_entries": len(self.requests_memory),
-            "storage_type": "redis" if self.redis else "memory"
+            "buffered_entries": len(self.write_buffer),
+            "buffered_counters": len(self.counter_buffer),
+            "replay_entries": len(self.replay_buffer),
+            "replay_counters": len(self.replay_counters),
+            "fallbacks": dict(self.fallbacks),
+            "circuit_breakers": get_circuit_breakers_status(),
+            "storage_type": "redis" if self.redis else "file" if self.request_log else "memory",
+            "request_log": self.request_log.get_status() if self.request_log else None,
         }
+    
+    def get_metric_samples(self) -> list[tuple[str, dict[str, str], Any]]:
+        """Gets fallback counts and buffer sizes for the metrics endpoint."""
+        samples = [
+            ("tracking_storage_fallbacks_total", {"operation": operation}, count)
+            for operation, count in self.fallbacks.items()
+        ]
+        for buffer, size in (
+            ("write", len(self.write_buffer)),
+            ("counters", len(self.counter_buffer)),
+            ("replay", len(self.replay_buffer)),
+            ("memory", len(self.requests_memory)),
+        ):
+            samples.append(("tracking_buffer_entries", {"buffer": buffer}, size))
+        return samples
 
 
-upstash = Upstash()
+upstash = LazyObject(Upstash)